@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+from rich import print
+
+from litespih4x.emu_sweep import model_slack, pareto_front, run_sweep, sweep_points
+
+
+def int_list(s: str) -> list[int]:
+    return [int(v) for v in s.split(',')]
+
+
+def float_list(s: str) -> list[float]:
+    return [float(v) for v in s.split(',')]
+
+
+def fmt(r) -> str:
+    p = r.point
+    head = f'pf{p.prefetch_bits:<2d} sys {p.sys_clk_freq / 1e6:6.1f} MHz div {p.spi_div:2d} SCLK {p.sclk_freq / 1e6:6.2f} MHz'
+    if not r.ok:
+        return f'{head}  [red]no report, rc={r.returncode}, see {r.log}'
+    color = 'green' if r.underruns == 0 else 'red'
+    slack = model_slack(p)
+    slack = f'{slack:5g}' if slack is not None else '    ?'
+    return (f'{head}  [{color}]underruns {r.underruns:4d}/{r.counters["reads"]}[/{color}]  '
+            f'latency mean {r.lat_mean_ns:7.1f} ns max {r.lat_max_ns:7.1f} ns  {r.read_mbps:6.2f} MB/s  '
+            f'model slack {slack}{"  (cached)" if r.cached else ""}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep FlashEmuLite parameters over Verilator builds and report the Pareto front")
+    parser.add_argument("--script",        default=str(Path(__file__).parent / "dram_verilator.py"), help="Verilator SoC script")
+    parser.add_argument("--prefetch-bits", type=int_list,   default=[5, 6, 7],     help="Comma separated prefetch_bits")
+    parser.add_argument("--sys-clk-freq",  type=float_list, default=[100e6],       help="Comma separated sys clocks in Hz")
+    parser.add_argument("--spi-div",       type=int_list,   default=[2, 4, 6, 8],  help="Comma separated sys clocks per SCLK")
+    parser.add_argument("--reads",         type=int,        default=256,           help="READs per point")
+    parser.add_argument("--bytes",         type=int,        default=8,             help="Bytes per READ")
+    parser.add_argument("-j", "--jobs",    type=int,        default=os.cpu_count(), help="Parallel builds/sims")
+    parser.add_argument("--work-dir",      default="sweep",                        help="Per point build dirs and results")
+    parser.add_argument("--force",         action="store_true",                    help="Rerun points with saved results")
+    parser.add_argument("--json",          default=None,                           help="Write all results as JSON")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER,                   help="Extra dram_verilator.py arguments, after --")
+    args = parser.parse_args()
+    script_args = [a for a in args.script_args if a != '--']
+
+    points = sweep_points(args.prefetch_bits, args.sys_clk_freq, args.spi_div)
+    print(f'{len(points)} points, {args.jobs} jobs -> {args.work_dir}')
+    results = run_sweep(Path(args.script), points, Path(args.work_dir), args.reads, args.bytes, args.jobs,
+                        script_args, args.force, done=lambda r: print(fmt(r)))
+
+    front = pareto_front(results)
+    print()
+    print(f'[bold]Pareto front ({len(front)} of {len(results)}):')
+    for r in front:
+        print(fmt(r))
+    if args.json:
+        Path(args.json).write_text(json.dumps([{
+            'prefetch_bits': r.point.prefetch_bits, 'sys_clk_freq': r.point.sys_clk_freq, 'spi_div': r.point.spi_div,
+            'sclk_freq': r.point.sclk_freq, 'counters': r.counters, 'pareto': r in front,
+        } for r in results], indent=1))
+    raise SystemExit(0 if all(r.ok for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
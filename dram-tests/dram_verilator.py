@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+from pathlib import Path
 
 from migen import *
 
@@ -23,10 +24,17 @@ from litedram.phy.model import SDRAMPHYModel
 from liteeth.phy.model import LiteEthPHYModel
 
 from litespih4x.emu import FlashEmu, FlashEmuLite, QSPISigs, SPISigs, IDCODE
-from litespih4x.emu_dram import FlashEmuDRAM
+from litespih4x.emu_dram import FlashEmuDRAM, FlashEmuDRAMArbiter
+from litespih4x.emu_hash import DRAMPageHasher, DRAMRangeCRC32
+from litespih4x.emu_workload import SPIReadWorkload
+from litespih4x.sim_cache import DIGEST_TAG, verilator_sim_cache, verilator_compile, verilator_run
+from litespih4x.sim_trace import TRACE_EVENTS, TraceWindow, emu_trace_events, add_windowed_debug
+from litespih4x.sim_trace import resolve_scope, scope_signal_names, filter_verilog_tracing
 
 # IOs ----------------------------------------------------------------------------------------------
 
+MAX_EMU_CLIENTS = 4
+
 _io = [
     ("sys_clk", 0, Pins(1)),
     ("sys_rst", 0, Pins(1)),
@@ -65,12 +73,14 @@ _io = [
         Subsignal("sink_ready",   Pins(1)),
         Subsignal("sink_data",    Pins(8)),
     ),
-    ("spiflash_emu", 0,
+] + [
+    # one per emulator sharing the DRAM port, see --emu-clients
+    ("spiflash_emu", i,
         Subsignal("sclk", Pins(1)),
         Subsignal("csn", Pins(1)),
         Subsignal("si", Pins(1)),
         Subsignal("so", Pins(1)),
-    ),
+    ) for i in range(MAX_EMU_CLIENTS)
 ]
 
 # Platform -----------------------------------------------------------------------------------------
@@ -82,7 +92,9 @@ class Platform(SimPlatform):
 # Bench SoC ----------------------------------------------------------------------------------------
 
 class SimSoC(SoCCore):
-    def __init__(self, sys_clk_freq = None, **kwargs):
+    def __init__(self, sys_clk_freq = None, trace_events = (), trace_window_cycles = 256, prefetch_bits = 6, spi_div = 4,
+                 workload_reads = 0, workload_bytes = 8, emu_clients = 1, num_triggers = 0,
+                 **kwargs):
         platform     = Platform()
         sys_clk_freq = int(sys_clk_freq)
 
@@ -101,7 +113,9 @@ class SimSoC(SoCCore):
         self.submodules.crg = CRG(platform.request("sys_clk"))
 
         # Trace ------------------------------------------------------------------------------------
-        self.platform.add_debug(self, reset=0)
+        # with trace events the tracer enable is hooked up once the emulator exists
+        if not trace_events:
+            self.platform.add_debug(self, reset=0)
 
         # # DDR3 -------------------------------------------------------------------------------------
         sdram_clk_freq = sys_clk_freq
@@ -139,18 +153,37 @@ class SimSoC(SoCCore):
             ("miso", sse.so),
         ], "spi_master")
 
+        self.flash_dram_port = fdp = self.sdram.crossbar.get_port("read", name="fdp")
+        emu_port = fdp
+        if emu_clients > 1:
+            # the emulators share fdp, earliest deadline first, spi_emu is client 0
+            self.submodules.flash_dram_arb = arb = FlashEmuDRAMArbiter(fdp, emu_clients)
+            emu_port = arb.ports[0]
+            for i in range(1, emu_clients):
+                setattr(self.submodules, f"spi_emu{i}", FlashEmuLite(ClockDomain("sys"),
+                    SPISigs.from_pads(self.platform.request("spiflash_emu", i)), arb.ports[i], sz_mbit=256,
+                    idcode=IDCODE, prefetch_bits=prefetch_bits))
+        self.submodules.spi_emu = FlashEmuLite(ClockDomain("sys"), sse, emu_port, sz_mbit=256, idcode=IDCODE,
+                                               prefetch_bits=prefetch_bits, num_triggers=num_triggers)
+
+        if trace_events:
+            self.submodules.trace_window = TraceWindow(emu_trace_events(self.spi_emu, trace_events), trace_window_cycles)
+            add_windowed_debug(self.platform, self, self.trace_window.active, reset=0)
+
+        # the workload drives the emulator itself and ends the sim, no host, Etherbone or analyzer
+        if workload_reads:
+            self.submodules.workload = SPIReadWorkload(sse, self.spi_emu.underrun, emu_port.rdata.valid & emu_port.rdata.ready,
+                                                       workload_reads, workload_bytes, div=spi_div)
+            return
+
         self.submodules.spi_uart_phy = spi_uart_phy = RS232PHYModel(self.platform.request("serial2spi_udp"))
         self.submodules.spi_uart_master = spi_uart_master = SimSPIMaster(
             self.spi_uart_phy,
             pads_master,
             sys_clk_freq,
-            sys_clk_freq // 4,
+            sys_clk_freq // spi_div,
         )
 
-
-        self.flash_dram_port = fdp = self.sdram.crossbar.get_port("read", name="fdp")
-        self.submodules.spi_emu = FlashEmuLite(ClockDomain("sys"), sse, fdp, sz_mbit=256, idcode=IDCODE)
-
         self.trace_sig = trace_sig = Signal()
         # self.trace_sig = trace_sig = self.sim_trace.pin
         # self.submodules.flash_dram = flash_dram = FlashEmuDRAM(dram_port, trace_sig)
@@ -161,6 +194,12 @@ class SimSoC(SoCCore):
         self.submodules.ethphy = LiteEthPHYModel(self.platform.request("eth"))
         self.add_etherbone(phy=self.ethphy, ip_address = "192.168.42.100", buffer_depth=16*4096-1)
 
+        # Image hashing ----------------------------------------------------------------------------
+        # per page CRCs of the image so the host only uploads what changed
+        self.submodules.page_hash = DRAMPageHasher(self.sdram.crossbar.get_port("read", name="page_hash"))
+        # one CRC over the whole image to verify a load without reading it back
+        self.submodules.image_crc = DRAMRangeCRC32(self.sdram.crossbar.get_port("read", name="image_crc"))
+
         from litescope import LiteScopeAnalyzer
 
         # flash_dram.ctrl_fsm.finalize()
@@ -201,21 +240,36 @@ class SimSoC(SoCCore):
 
 def main():
     parser = argparse.ArgumentParser(description="LiteEth Bench Simulation")
-    parser.add_argument("--sys-clk-freq",         default=200e6,           help="System clock frequency (default: 200MHz)")
+    parser.add_argument("--sys-clk-freq",         default=200e6, type=float, help="System clock frequency (default: 200MHz)")
     parser.add_argument("--trace",                action="store_true",     help="Enable Tracing")
     parser.add_argument("--trace-cycles",         default=128,             help="Number of cycles to trace")
+    parser.add_argument("--trace-scope",          default=None,            help="Comma separated SoC attribute paths to trace (e.g. spi_emu,flash_dram_port)")
+    parser.add_argument("--trace-on",             default=None,            help=f"Comma separated events gating the trace: {', '.join(TRACE_EVENTS)}")
+    parser.add_argument("--trace-window-cycles",  default=256, type=int,   help="sys clocks the trace stays on after its last event")
     parser.add_argument("--opt-level",            default="O3",            help="Verilator optimization level")
     parser.add_argument("--debug-soc-gen",        action="store_true",     help="Don't run simulation")
+    parser.add_argument("--build-only",           action="store_true",     help="Build the simulator but don't run it")
+    parser.add_argument("--no-sim-cache",         action="store_true",     help="Always recompile the Verilator model")
+    parser.add_argument("--prefetch-bits",        default=6, type=int,     help="FlashEmuLite prefetch window, log2 bytes")
+    parser.add_argument("--spi-div",              default=4, type=int,     help="sys clocks per SCLK")
+    parser.add_argument("--workload-reads",       default=0, type=int,     help="Run this many READs from gateware instead of serving the UDP host, then exit")
+    parser.add_argument("--num-triggers",         default=0, type=int,     help="spi_emu opcode/address/count triggers (image slot switching)")
+    parser.add_argument("--emu-clients",          default=1, type=int,     help=f"FlashEmuLite instances sharing one DRAM read port (max {MAX_EMU_CLIENTS})")
+    parser.add_argument("--workload-bytes",       default=8, type=int,     help="Bytes per workload READ")
     builder_args(parser)
     soc_core_args(parser)
     args = parser.parse_args()
+    if not 1 <= args.emu_clients <= MAX_EMU_CLIENTS:
+        parser.error(f"--emu-clients must be in 1..{MAX_EMU_CLIENTS}")
 
     sim_config = SimConfig()
     sim_config.add_clocker("sys_clk", freq_hz=args.sys_clk_freq)
-    sim_config.add_module("ethernet", "eth", args={"interface": "tap0", "ip": "192.168.42.100"})
+    if not args.workload_reads:
+        sim_config.add_module("ethernet", "eth", args={"interface": "tap0", "ip": "192.168.42.100"})
     sim_config.add_module("serial2console", "serial")
     # sim_config.add_module("serial2tcp", "serial2spi", args={"port": "2442", "bind_ip": "127.0.0.1"})
-    sim_config.add_module("serial2udp", "serial2spi_udp", args={"port": "2443", "bind_ip": "127.0.0.1"})
+    if not args.workload_reads:
+        sim_config.add_module("serial2udp", "serial2spi_udp", args={"port": "2443", "bind_ip": "127.0.0.1"})
 
     soc_kwargs     = soc_core_argdict(args)
     builder_kwargs = builder_argdict(args)
@@ -229,21 +283,36 @@ def main():
 
     builder_kwargs['csr_csv'] = 'csr.csv'
 
-    soc     = SimSoC(**soc_kwargs)
+    soc     = SimSoC(trace_events=args.trace_on.split(',') if args.trace_on else (),
+                     trace_window_cycles=args.trace_window_cycles, prefetch_bits=args.prefetch_bits,
+                     spi_div=args.spi_div, workload_reads=args.workload_reads, workload_bytes=args.workload_bytes,
+                     emu_clients=args.emu_clients, num_triggers=args.num_triggers, **soc_kwargs)
     if not args.debug_soc_gen:
         builder = Builder(soc, **builder_kwargs)
-        for i in range(2):
-            build = (i == 0)
-            run   = (i == 1)
-            builder.build(
-                build=build,
-                run=run,
-                skip_sw_build=run,
-                sim_config=sim_config,
-                trace=args.trace,
-                trace_cycles=args.trace_cycles,
-                opt_level=args.opt_level,
-            )
+        # generate gateware/BIOS once, the Verilator model is only rebuilt when its inputs change
+        ns = builder.build(
+            build=True,
+            run=False,
+            sim_config=sim_config,
+            trace=args.trace,
+            trace_cycles=args.trace_cycles,
+            opt_level=args.opt_level,
+        )
+        if args.trace_scope:
+            keep = scope_signal_names(ns, [resolve_scope(soc, s) for s in args.trace_scope.split(',')])
+            hidden = filter_verilog_tracing(Path(builder.gateware_dir) / 'sim.v', keep)
+            print(f'tracing {len(keep)} signals, {hidden} declarations hidden')
+        cache = verilator_sim_cache(builder, options={
+            'trace': args.trace,
+            'opt_level': args.opt_level,
+        })
+        if args.no_sim_cache:
+            cache.manifest_path.unlink(missing_ok=True)
+        reused = verilator_compile(cache)
+        print(f'Verilator model {"reused" if reused else "rebuilt"} ({cache.digest()[:12]})')
+        print(f'{DIGEST_TAG} {cache.digest()}')
+        if not args.build_only:
+            verilator_run(cache, as_root=sim_config.has_module("ethernet"))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from litex import RemoteClient
+from rich import print
+
+from litespih4x.emu_upload import MAIN_RAM_BASE, delta_upload, verify_image
+from litespih4x.argtypes import parse_int
+
+
+def connect(args) -> RemoteClient:
+    kwargs = dict(host=args.host, port=args.port, csr_csv=args.csr_csv)
+    if args.sim:
+        kwargs['with_sim_hack'] = True
+    bus = RemoteClient(**kwargs)
+    bus.open()
+    return bus
+
+
+def cmd_upload(args):
+    image = Path(args.image).read_bytes()
+    bus = connect(args)
+    t0 = time.monotonic()
+    s = delta_upload(bus, image, args.image_base, args.ram_base, args.fine_shift, full=args.full)
+    bus.close()
+    print(f'{s.image_bytes} byte image, {s.coarse_dirty} dirty {s.coarse_page} byte pages, '
+          f'sent {s.pages_sent} {s.fine_page} byte pages ({s.bytes_sent} bytes) in {time.monotonic() - t0:.1f}s')
+
+
+def cmd_verify(args):
+    image = Path(args.image).read_bytes()
+    bus = connect(args)
+    r = verify_image(bus, image, args.image_base, args.word_bytes)
+    bus.close()
+    if not r.ok:
+        print(f'[red]MISMATCH[/red] {r.length} bytes at {args.image_base:#x}: '
+              f'image crc32 {r.expected:#010x}, DRAM {r.actual:#010x}')
+        raise SystemExit(1)
+    print(f'[green]OK[/green] {r.length} bytes at {args.image_base:#x} crc32 {r.actual:#010x} in {r.cycles} sys clocks')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load flash images into the emulator's DRAM over Etherbone")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--csr-csv", default="csr.csv")
+    parser.add_argument("--sim", action="store_true", help="talking to the Verilator sim")
+    parser.add_argument("--ram-base", type=parse_int, default=MAIN_RAM_BASE, help="DRAM on the bus")
+    parser.add_argument("--image-base", type=parse_int, default=0, help="DRAM byte offset of the image slot")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("upload", help="upload the pages that differ from DRAM")
+    p.add_argument("image")
+    p.add_argument("--fine-shift", type=int, default=12, help="log2 of the upload page size")
+    p.add_argument("--full", action="store_true", help="upload everything, no hashing")
+    p.set_defaults(func=cmd_upload)
+    p = sub.add_parser("verify", help="check DRAM against an image with the on-chip CRC engine")
+    p.add_argument("image")
+    p.add_argument("--word-bytes", type=int, default=16, help="DRAM native port width in bytes")
+    p.set_defaults(func=cmd_verify)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,82 @@
 #!/usr/bin/env python3
 
-import socket
-import sys
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from pathlib import Path
 
 from rich import print
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server_address = ('127.0.0.1', 2443)
+from litespih4x.argtypes import parse_int
+from litespih4x.udp_spi import DEFAULT_BRIDGE, SPIBridgeClient
+
+
+def client(args) -> SPIBridgeClient:
+    return SPIBridgeClient((args.host, args.port), window=args.window, max_frame=args.frame, timeout=args.timeout,
+                           retries=args.retries)
+
+
+async def cmd_idcode(args):
+    async with client(args) as c:
+        print(f'idcode: {await c.idcode():06x}')
+
+
+async def cmd_read(args):
+    async with client(args) as c:
+        data = await c.read(args.addr, args.size, addr_bytes=args.addr_bytes)
+    print(f'read {args.addr:#x}: {data.hex()}')
 
-def get_idcode():
-    get_icdode_buf = bytes([0x9f, 0x00, 0x00, 0x00])
 
-    sent = sock.sendto(get_icdode_buf, server_address)
-    assert sent == len(get_icdode_buf)
-    rsp, srv = sock.recvfrom(2000)
-    assert len(rsp) == len(get_icdode_buf)
+async def cmd_dump(args):
+    done = 0
+    last = 0.0
 
-    print(f'get_idcode: {get_icdode_buf.hex()} rsp: {rsp.hex()}')
+    def progress(n):
+        nonlocal done, last
+        done += n
+        now = time.monotonic()
+        if now - last >= 1 or done == args.size:
+            last = now
+            print(f'{done}/{args.size} bytes {done / (now - t0) / 1024:.1f} KiB/s')
 
-def read(addr: int, sz: int):
-    read_buf = bytes([0x03]) + addr.to_bytes(3, 'big', signed=False) + bytes(sz)
+    t0 = time.monotonic()
+    async with client(args) as c:
+        data = await c.read(args.addr, args.size, addr_bytes=args.addr_bytes, progress=progress)
+    Path(args.output).write_bytes(data)
+    s = c.stats
+    print(f'{args.size} bytes in {time.monotonic() - t0:.1f}s, {s.requests} frames, {s.retries} retries, '
+          f'{s.unmatched} unmatched replies -> {args.output}')
 
-    sent = sock.sendto(read_buf, server_address)
-    assert sent == len(read_buf)
-    rsp, srv = sock.recvfrom(2000)
-    assert len(rsp) == len(read_buf)
 
-    print(f'read_buf[:4]: {read_buf[:4].hex()} data: {rsp[4:].hex()}')
+def main():
+    parser = argparse.ArgumentParser(description="SPI flash access through the sim's serial2udp bridge")
+    parser.add_argument("--host", default=DEFAULT_BRIDGE[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_BRIDGE[1])
+    parser.add_argument("--window", type=int, default=8, help="Frames in flight")
+    parser.add_argument("--frame", type=int, default=1024, help="Max data bytes per READ frame")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds before a frame is resent")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--addr-bytes", type=int, choices=(3, 4), default=3)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("idcode", help="read the JEDEC ID")
+    p.set_defaults(func=cmd_idcode)
+    p = sub.add_parser("read", help="read and print a few bytes")
+    p.add_argument("addr", type=parse_int)
+    p.add_argument("size", type=parse_int)
+    p.set_defaults(func=cmd_read)
+    p = sub.add_parser("dump", help="read a region to a file")
+    p.add_argument("addr", type=parse_int)
+    p.add_argument("size", type=parse_int)
+    p.add_argument("-o", "--output", default="dump.bin")
+    p.set_defaults(func=cmd_dump)
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
 
-# get_idcode()
 
-# read(0x4, 4)
-read(0xEDBEEF, 4)
+if __name__ == "__main__":
+    main()
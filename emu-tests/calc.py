@@ -1,39 +1,93 @@
 #!/usr/bin/env python3
 
-import math
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
 
+from __future__ import annotations
+
+import argparse
+
+import attr
 from rich import print
 
-dfi_latency = 11
-clk_ratio = 4
-word_width = 16 # 128 bits per sys_clk
+from litespih4x.emu_latency import READ_MODES, LatencyParams, dram_read_latency, min_prefetch_bits, self_check, \
+    smallest_prefetch_bits, solve
+
+
+def params(args) -> LatencyParams:
+    mode = READ_MODES[args.mode]
+    if args.dummy is not None:
+        mode = attr.evolve(mode, dummy_cycles=args.dummy)
+    if args.addr_bytes is not None:
+        mode = attr.evolve(mode, addr_bytes=args.addr_bytes)
+    lat = args.dram_latency
+    if lat is None:
+        lat = dram_read_latency(args.module, args.sys_clk_freq, args.phy_ratio, row_miss=not args.row_hit,
+                                refresh=args.refresh)
+    return LatencyParams(sys_clk_freq=args.sys_clk_freq, sclk_freq=args.sclk_freq, prefetch_bits=args.prefetch_bits,
+                         port_data_width=args.port_width, dram_latency=lat, mode=mode, guard_sys=args.guard)
+
+
+def cmd_solve(args):
+    p = params(args)
+    rep = solve(p)
+    print(f'{p.mode.name} {p.sys_clk_freq / 1e6:g} MHz sys / {p.sclk_freq / 1e6:g} MHz SCLK = {rep.sys_per_sclk:g} sys/SCLK, '
+          f'DRAM latency {p.dram_latency}, prefetch {rep.max_burst_bytes} bytes')
+    print(f'request {rep.request_sys:g} first word {rep.first_word_sys:g} ready {rep.ready_sys:g} '
+          f'data phase {rep.data_phase_sys:g} first sample {rep.first_sample_sys:g} (sys clks after CS#)')
+    color = 'green' if rep.ok else 'red'
+    print(f'[{color}]slack {rep.slack_sys:g} sys clks[/{color}], first word slack {rep.first_word_slack_sys:g}')
+    print(f'max SCLK {rep.max_sclk_freq / 1e6:.2f} MHz')
+    bits = smallest_prefetch_bits(p)
+    print(f'smallest prefetch_bits: {bits if bits is not None else "none"}')
+
 
-def sys_clk_for_read_n(n):
-    return dfi_latency + n
+def cmd_table(args):
+    p = params(args)
+    for bits in range(min_prefetch_bits(p.port_data_width), args.max_bits + 1):
+        rep = solve(attr.evolve(p, prefetch_bits=bits))
+        print(f'prefetch_bits {bits:2d} ({rep.max_burst_bytes:5d} bytes): ready {rep.ready_sys:7g} slack {rep.slack_sys:7g} '
+              f'max SCLK {rep.max_sclk_freq / 1e6:7.2f} MHz')
 
-def sys_clk_to_read_n(n):
-    return n - dfi_latency
 
+def cmd_self_check(args):
+    results = self_check(ratios=args.ratio)
+    for r in results:
+        print(f'[{"green" if r.ok else "red"}]{r}')
+    bad = sum(not r.ok for r in results)
+    print(f'{len(results) - bad}/{len(results)} match')
+    raise SystemExit(bool(bad))
 
 
-for i in range(0):
-    sys_lat = dfi_latency + i
-    spi_lat = sys_lat / 4
-    num_guesses = 2**spi_lat
-    num_bytes = word_width * (i+1)
-    print(f'latency: {sys_lat} sys clk, {spi_lat} spi clk num bytes: {num_bytes} num guesses: {num_guesses}')
+def main():
+    parser = argparse.ArgumentParser(description="FlashEmuLite read timing: slack, max SCLK and prefetch window")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, func, help in (("solve", cmd_solve, "timing for one configuration"),
+                             ("table", cmd_table, "slack and max SCLK per prefetch window")):
+        p = sub.add_parser(name, help=help)
+        p.add_argument("--module", default="MT41K128M16", help="litedram.modules SDRAM module")
+        p.add_argument("--phy-ratio", default="1:4", help="sys:memory clock ratio")
+        p.add_argument("--port-width", type=int, default=128, help="native port data width in bits")
+        p.add_argument("--sys-clk-freq", type=float, default=100e6)
+        p.add_argument("--sclk-freq", type=float, default=25e6)
+        p.add_argument("--mode", choices=READ_MODES, default="read")
+        p.add_argument("--dummy", type=int, help="override the mode's dummy cycles")
+        p.add_argument("--addr-bytes", type=int, choices=(3, 4))
+        p.add_argument("--prefetch-bits", type=int, default=6)
+        p.add_argument("--dram-latency", type=int, help="sys clks, default from the module and PHY")
+        p.add_argument("--row-hit", action="store_true", help="assume the row is open")
+        p.add_argument("--refresh", action="store_true", help="assume a refresh is in the way")
+        p.add_argument("--guard", type=int, default=1, help="sys clks of CDC margin")
+        p.set_defaults(func=func)
+    sub.choices["table"].add_argument("--max-bits", type=int, default=12)
+    p = sub.add_parser("self-check", help="compare against the FlashEmuLite sims")
+    p.add_argument("--ratio", type=int, action="append", help="sys clks per SCLK, repeatable")
+    p.set_defaults(func=cmd_self_check)
+    args = parser.parse_args()
+    if args.cmd == "self-check" and not args.ratio:
+        args.ratio = [4, 10]
+    args.func(args)
 
-for i in range(14):
-    num_guesses = 2**i
-    spi_clks = i
-    sys_clks = clk_ratio * spi_clks
-    n_reads = sys_clk_to_read_n(sys_clks) + 1
-    num_bytes = word_width * n_reads
-    n_reads_to_get_guesses = math.ceil(num_guesses / word_width)
-    sys_clks_to_get_guesses = sys_clk_for_read_n(n_reads_to_get_guesses-1)
-    slack_sys_clks = sys_clks - sys_clks_to_get_guesses
-    print(f'spi clk: {spi_clks} # guesses: {num_guesses} sys clks: {sys_clks} # read TX: {n_reads} # bytes readahead: {num_bytes}')
-    print(f'# reads to get guesses: {n_reads_to_get_guesses} # sys clks: {sys_clks_to_get_guesses}')
-    print(f'slack sys clks: {slack_sys_clks}')
-    print()
 
+if __name__ == "__main__":
+    main()
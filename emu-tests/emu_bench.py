@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+from rich import print
+
+from litespih4x.emu_bench import METRICS, TIMING_LANES, bench_timing, default_configs, run_benches, save_results, load_results, compare
+
+
+def selected_configs(only):
+    configs = default_configs()
+    if only:
+        names = set(only.split(','))
+        configs = [c for c in configs if c.name in names]
+        if not configs:
+            print(f'[red]no benches match {only}')
+            sys.exit(1)
+    return configs
+
+
+def write_timing(configs, args):
+    for cfg in configs:
+        if cfg.kind not in TIMING_LANES:
+            continue
+        path, measured = bench_timing(cfg, args.timing, sys_per_sclk=args.timing_ratio, clk_freq=args.sys_clk_freq)
+        print(f'{cfg.name:20s} ' + ', '.join(str(m) for m in measured) + f' -> {path}')
+
+
+def cmd_run(args):
+    configs = selected_configs(args.only)
+    res = run_benches(configs, nbytes=args.nbytes, nominal_sys_per_sclk=args.ratio, max_sys_per_sclk=args.max_ratio)
+    for name, metrics in res['results'].items():
+        print(f'{name:20s} ' + ' '.join(f'{m}={v}' for m, v in metrics.items()))
+    save_results(args.output, res)
+    print(f'-> {args.output}')
+    if args.timing:
+        write_timing(configs, args)
+
+
+def cmd_timing(args):
+    write_timing(selected_configs(args.only), args)
+
+
+def cmd_compare(args):
+    tols = {}
+    for t in args.tol or []:
+        metric, val = t.split('=')
+        if metric not in METRICS:
+            print(f'[red]unknown metric {metric}')
+            sys.exit(2)
+        tols[metric] = float(val)
+    regs = compare(load_results(args.base), load_results(args.new), tols)
+    for r in regs:
+        print(f'[red]regression[/] {r}')
+    if not regs:
+        print('[green]no regressions')
+    sys.exit(1 if regs else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulator and flash model throughput/latency benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="Run the benches and write JSON results")
+    run.add_argument("-o", "--output",   default="emu_bench.json",       help="Results file")
+    run.add_argument("--only",          default=None,                    help="Comma separated bench names")
+    run.add_argument("--nbytes",        type=int, default=128,           help="Bytes per READ (clipped to the prefetch window for FlashEmuLite)")
+    run.add_argument("--ratio",         type=int, default=10,            help="sys clocks per SCLK for the latency measurements")
+    run.add_argument("--max-ratio",     type=int, default=32,            help="Top of the min sys clocks per SCLK search")
+    run.add_argument("--timing",        default=None,                    help="Also regenerate timing-<bench>.json WaveDrom diagrams in this directory")
+    run.set_defaults(func=cmd_run)
+
+    tim = sub.add_parser("timing", help="Draw WaveDrom timing diagrams of one READ per bench, annotated with measured latencies")
+    tim.add_argument("--timing",        default="docs",                  help="Output directory")
+    tim.add_argument("--only",          default=None,                    help="Comma separated bench names")
+    tim.set_defaults(func=cmd_timing)
+
+    for p in (run, tim):
+        p.add_argument("--timing-ratio", type=int, default=4,            help="sys clocks per SCLK for the timing diagrams")
+        p.add_argument("--sys-clk-freq", type=float, default=None,       help="sys clock in Hz to annotate latencies in ns")
+
+    cmp = sub.add_parser("compare", help="Compare results against a baseline, exits 1 on regressions")
+    cmp.add_argument("base",                                             help="Baseline results")
+    cmp.add_argument("new",                                              help="New results")
+    cmp.add_argument("--tol", action="append",                           help="metric=relative tolerance, repeatable")
+    cmp.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
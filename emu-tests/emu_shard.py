@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from rich import print
+
+from litespih4x.cocotb_shard import discover_tests, shard_tests, run_shards, merge_junit, junit_summary, bench_cmd
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a cocotb bench's tests in parallel simulator processes")
+    parser.add_argument("--bench",    default=str(Path(__file__).parent / "emu_sim.py"), help="cocotb bench script")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),         help="Parallel simulator processes")
+    parser.add_argument("--shards",   type=int, default=None,                     help="Number of shards (default: jobs)")
+    parser.add_argument("--work-dir", default="shards",                           help="Directory for the shared build and per shard runs")
+    parser.add_argument("--prologue", default=None,                               help="Comma separated tests run first in every shard (default: first test)")
+    parser.add_argument("--junit",    default=None,                               help="Merged JUnit XML (default: <work-dir>/results.xml)")
+    parser.add_argument("--no-build", action="store_true",                        help="Reuse <work-dir>/base/build as is")
+    parser.add_argument("bench_args", nargs=argparse.REMAINDER,                   help="Extra bench arguments, after --")
+    args = parser.parse_args()
+    bench_args = [a for a in args.bench_args if a != '--']
+
+    tests = [t.name for t in discover_tests(Path(args.bench)) if not t.skip]
+    if not tests:
+        print(f'[red]no enabled cocotb tests in {args.bench}')
+        sys.exit(1)
+    prologue = args.prologue.split(',') if args.prologue is not None else tests[:1]
+    shards = shard_tests(tests, args.shards or args.jobs, prologue)
+
+    work_dir = Path(args.work_dir).resolve()
+    base_dir = work_dir / "base"
+    base_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.monotonic()
+    if not args.no_build:
+        r = subprocess.call(bench_cmd(Path(args.bench), "--build", *bench_args), cwd=base_dir)
+        if r != 0:
+            print(f'[red]bench build failed with {r}')
+            sys.exit(r)
+    t_build = time.monotonic() - t0
+
+    print(f'{len(tests)} tests in {len(shards)} shards, prologue: {", ".join(prologue)}')
+    results = run_shards(shards, bench_cmd(Path(args.bench), "--run", *bench_args), base_dir / "build", work_dir, args.jobs)
+    merged = merge_junit(results, prologue)
+    junit = Path(args.junit) if args.junit else work_dir / "results.xml"
+    ET.ElementTree(merged).write(junit, encoding="utf-8", xml_declaration=True)
+
+    for r in results:
+        status = '[green]ok' if r.returncode == 0 and r.results is not None else f'[red]rc={r.returncode}'
+        print(f'shard{r.index}: {status}[/] {r.wall_s:7.1f}s  {", ".join(r.tests)}')
+    ntests, nfail, nskip = junit_summary(merged)
+    print(f'build {t_build:.1f}s, shards {max(r.wall_s for r in results):.1f}s wall, '
+          f'{sum(r.wall_s for r in results):.1f}s total')
+    print(f'{ntests} tests, {nfail} failed, {nskip} skipped -> {junit}')
+    sys.exit(1 if nfail else 0)
+
+
+if __name__ == "__main__":
+    main()
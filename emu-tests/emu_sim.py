@@ -7,6 +7,7 @@
 from __future__ import annotations
 
 import argparse
+import os
 from pathlib import Path
 import socket
 import time
@@ -26,8 +27,14 @@ from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder import *
 from litex.soc.interconnect import wishbone
 
-from litespih4x.macronix_model import MacronixModel
+from litespih4x.macronix_model import MacronixModel, MacronixTiming, VENDORED_TIMING
+from litespih4x.macronix_lite import MacronixModelLite
 from litespih4x.emu import FlashEmu, QSPISigs, IDCODE
+from litespih4x.spi_bfm import SPIMasterBFM, SPIMasterBFMDriver, spi_bfm_io
+from litespih4x.sim_cache import SimBuildCache
+from litespih4x.sim_names import SIM_NAMES_ENV, sim_names_for_run, load_sim_names, fetch_sim_names
+from litespih4x.sim_profile import PROFILE_ENV, profiled, profile_rpyc
+from litespih4x.sim_trace import TRACE_EVENTS, TraceWindow, ScopedVCDDumper, emu_trace_events, resolve_scope
 
 import cocotb
 from cocotb.triggers import Timer, ReadWrite, ReadOnly, NextTimeStep
@@ -45,7 +52,7 @@ from pyftdi.jtag import BitSequence
 
 USE_RESET_PIN: Final = False
 
-srv: Final = start_sim_server()
+srv: Final = profile_rpyc(start_sim_server())
 ext: Final = cocotb.external
 
 Fsys_clk_mhz = 100
@@ -62,29 +69,17 @@ qtclkh: Final = Timer(qclkper_ns/2, units='ns')
 qtclk2: Final = Timer(qclkper_ns*2, units='ns')
 
 
-# tRLRH_ns = 10 * 1_000
-tRLRH_ns = 10
-tRLRH: Final = Timer(2*tRLRH_ns, units='ns')
+# flash waits follow the timing the model was built with, see --flash-time-scale
+def set_flash_timing(t: MacronixTiming):
+    global tRLRH, tRHSL, tREADY2_ROLL, tVSL, tREADY2_W, tW
+    tRLRH = Timer(2*t.tRLRH, units='ns')
+    tRHSL = Timer(2*t.tRHSL, units='ns')
+    tREADY2_ROLL = Timer(2*t.tREADY2_R, units='ns')
+    tVSL = Timer(2*t.tVSL, units='ns')
+    tREADY2_W = Timer(2*t.tREADY2_W, units='ns')
+    tW = Timer(2*t.tW, units='ns')
 
-# tRHSL_ns = 10 * 1_000
-tRHSL_ns = 10
-tRHSL: Final = Timer(2*tRHSL_ns, units='ns')
-
-# tREADY2_ROLL_ns = 40 * 1_000
-tREADY2_ROLL_ns = 40
-tREADY2_ROLL: Final = Timer(2*tREADY2_ROLL_ns, units='ns')
-
-# tVSL_ns = 1500 * 1_000
-tVSL_ns = 10
-tVSL: Final = Timer(2*tVSL_ns, units='ns')
-
-# tREADY2_W_ns = 40_000_000
-tREADY2_W_ns = 40
-tREADY2_W = Timer(2*tREADY2_W_ns, units='ns')
-
-# tW_ns = 40_000_000
-tW_ns = 40
-tW = Timer(2*tW_ns, units='ns')
+set_flash_timing(VENDORED_TIMING)
 
 async def tmr(ns: float) -> None:
     await Timer(ns, units='ns')
@@ -113,7 +108,9 @@ _io = [
         Subsignal("wpn", Pins(1)),
         Subsignal("sio3", Pins(1)),
     ),
-]
+    # held high by cocotb to force a trace window open
+    ("trace_window", 0, Pins(1)),
+] + spi_bfm_io()
 
 # Platform -----------------------------------------------------------------------------------------
 
@@ -126,7 +123,9 @@ class Platform(SimPlatform):
 # Bench SoC ----------------------------------------------------------------------------------------
 
 class BenchSoC(SoCCore):
-    def __init__(self, toolchain="cocotb", dump=False, sim_debug=False, trace_reset_on=False, **kwargs):
+    def __init__(self, toolchain="cocotb", dump=False, sim_debug=False, trace_reset_on=False, spi_bfm=False,
+                 flash_time_scale=None, flash_model="behavioral", trace_scopes=(), trace_events=(),
+                 trace_window_cycles=256, **kwargs):
         platform     = Platform(toolchain=toolchain)
         sys_clk_freq = int(1e6)
 
@@ -142,9 +141,15 @@ class BenchSoC(SoCCore):
 
         self.qspi_pads_real = qr = self.platform.request("qspiflash_real")
         self.qpsi_real_sigs = qrs = QSPISigs.from_pads(qr)
-        self.submodules.qspi_model = qm = MacronixModel(self.platform,
-            qr.sclk, qr.rstn, qr.csn, qr.si, qr.so, qr.wpn, qr.sio3
-        )
+        if flash_model == "lite":
+            # cycle based stand-in clocked by sys, no Verilog delays to wait out
+            self.submodules.qspi_model = qm = MacronixModelLite(self.platform,
+                qr.sclk, qr.rstn, qr.csn, qr.si, qr.so, qr.wpn, qr.sio3
+            )
+        else:
+            self.submodules.qspi_model = qm = MacronixModel(self.platform,
+                qr.sclk, qr.rstn, qr.csn, qr.si, qr.so, qr.wpn, qr.sio3, time_scale=flash_time_scale
+            )
 
 
         self.qspi_pads_emu = qe = self.platform.request("qspiflash_emu")
@@ -152,6 +157,12 @@ class BenchSoC(SoCCore):
         cds = crg.clock_domains
         self.qspi_emu = self.submodules.qspi_emu = FlashEmu(crg.cd_sys, qrs=qrs, qes=qes, sz_mbit=256, idcode=IDCODE)
 
+        # SCLK/CS#/SI come from the gateware SPI master instead of cocotb bit-banging the pads
+        self.spi_bfm = None
+        if spi_bfm:
+            self.spi_bfm_pads = self.platform.request("spi_bfm")
+            self.spi_bfm = self.submodules.spi_bfm = SPIMasterBFM(qes, self.spi_bfm_pads)
+
 
         self.wb_sim_tap = wb_sim_tap = wishbone.Interface()
         self.add_wb_master(wb_sim_tap, 'wb_sim_tap')
@@ -161,13 +172,31 @@ class BenchSoC(SoCCore):
                 f.write(str(verilog.convert(self.qspi_emu)))
             sys.exit(0)
 
-        self.specials.vcddumper = CocotbVCDDumperSpecial()
+        self.trace_window = None
+        if trace_events:
+            self.trace_window_pad = self.platform.request("trace_window")
+            self.submodules.trace_window = TraceWindow(emu_trace_events(self.qspi_emu, trace_events), trace_window_cycles)
+            self.comb += self.trace_window.force.eq(self.trace_window_pad)
+        if trace_scopes or trace_events:
+            self.specials.vcddumper = ScopedVCDDumper(
+                scopes=[resolve_scope(self, s) for s in trace_scopes],
+                window=self.trace_window.active if self.trace_window is not None else None,
+            )
+        else:
+            self.specials.vcddumper = CocotbVCDDumperSpecial()
 
         if sim_debug:
             platform.add_debug(self, reset=1 if trace_reset_on else 0)
         else:
             self.comb += platform.trace.eq(1)
 
+    def sim_info(self) -> dict:
+        info = {'spi_bfm': None, 'flash_timing': attr.asdict(self.qspi_model.timing),
+                'trace_window': self.trace_window is not None}
+        if self.spi_bfm is not None:
+            info['spi_bfm'] = {'word_bytes': self.spi_bfm.word_bytes, 'fifo_depth': self.spi_bfm.fifo_depth}
+        return info
+
 
 # Main ---------------------------------------------------------------------------------------------
 
@@ -186,6 +215,13 @@ def main():
     parser.add_argument("--sim-end",              default="-1",            help="Time to end simulation (ps)")
     parser.add_argument("--sim-debug",            action="store_true",     help="Add simulation debugging modules")
     parser.add_argument("--sim-top", default=None,                         help="Use a custom file for the top sim module")
+    parser.add_argument("--spi-bfm",              action="store_true",     help="Drive the emulator from the gateware SPI master")
+    parser.add_argument("--flash-model",          default="behavioral", choices=["behavioral", "lite"], help="Real flash model")
+    parser.add_argument("--flash-time-scale",     default=None, type=float, help="Scale the datasheet timing of the Macronix model (e.g. 1e-5)")
+    parser.add_argument("--trace-scope",          default=None,            help="Comma separated SoC attribute paths to dump (e.g. qspi_emu,qspi_emu.flash_mem)")
+    parser.add_argument("--trace-on",             default=None,            help=f"Comma separated events opening a dump window: {', '.join(TRACE_EVENTS)}")
+    parser.add_argument("--trace-window-cycles",  default=256, type=int,   help="sys clocks a trace window stays open after its last event")
+    parser.add_argument("--profile",              default=None,            help="Write a folded stack wall clock profile of the cocotb side here")
     args = parser.parse_args()
     try:
         args.trace_start = int(args.trace_start)
@@ -199,9 +235,14 @@ def main():
     sim_config = SimConfig()
     sim_config.add_clocker("sys_clk", freq_hz=1e6)
 
-    soc     = BenchSoC(toolchain=args.toolchain, dump=args.dump, sim_debug=args.sim_debug, trace_reset_on=args.trace_start > 0 or args.trace_end > 0)
+    soc     = BenchSoC(toolchain=args.toolchain, dump=args.dump, sim_debug=args.sim_debug, trace_reset_on=args.trace_start > 0 or args.trace_end > 0,
+                       spi_bfm=args.spi_bfm, flash_time_scale=args.flash_time_scale,
+                       flash_model=args.flash_model,
+                       trace_scopes=args.trace_scope.split(',') if args.trace_scope else (),
+                       trace_events=args.trace_on.split(',') if args.trace_on else (),
+                       trace_window_cycles=args.trace_window_cycles)
     builder = Builder(soc, csr_csv="csr.csv", csr_json="csr.json", compile_software=False)
-    soc.ns = builder.build(
+    build_kwargs = dict(
         sim_config  = sim_config,
         trace       = args.trace,
         trace_fst   = args.trace_fst,
@@ -212,9 +253,23 @@ def main():
         sim_top     = args.sim_top,
         module      = sys.modules[__name__],
         soc         = soc,
-        build       = args.build,
-        run         = args.run,
     )
+    soc.ns = builder.build(**build_kwargs, build=args.build, run=False)
+    # regenerated but unchanged sources keep their old mtimes so the simulator's make skips the recompile
+    sim_cache = SimBuildCache(Path(builder.gateware_dir), options={'trace': args.trace, 'trace_fst': args.trace_fst})
+    sim_cache.restore_mtimes()
+    sim_cache.save()
+    # the cocotb process resolves its handles from this file instead of over rpyc
+    try:
+        names_path = sim_names_for_run(Path(builder.gateware_dir), args.build, platform=soc.platform, soc=soc,
+                                       ns=soc.ns, info=soc.sim_info())
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    os.environ[SIM_NAMES_ENV] = str(names_path.resolve())
+    if args.profile is not None:
+        os.environ[PROFILE_ENV] = str(Path(args.profile).resolve())
+    if args.run:
+        soc.ns = builder.build(**build_kwargs, build=False, run=True)
 
     print()
 
@@ -230,6 +285,9 @@ class Sigs:
 sigs = None
 soc = None
 ns = None
+bfm = None
+sim_names = None
+trace_gate = None
 
 
 def nol(sig: Signal) -> str:
@@ -239,43 +297,33 @@ def nol(sig: Signal) -> str:
 def nsl(sig: Signal) -> str:
     return ns.pnd[sig]
 
-def get_qspisigs_dict(t, p):
-    def helper(platform, soc, ns):
-        return {
-            'sclk':  getattr(t, nsl(p.sclk)),
-            'rstn':  getattr(t, nsl(p.rstn)),
-            'csn': getattr(t, nsl(p.csn)),
-            'si': getattr(t, nsl(p.si)),
-            'so': getattr(t, nsl(p.so)),
-            'wpn': getattr(t, nsl(p.wpn)),
-            'sio3': getattr(t, nsl(p.sio3)),
-        }
-    return srv.root.call_on_server(helper)
-
-def get_sigs_dict(t):
-    def helper(platform, soc, ns):
-        return {
-            'clk':  getattr(t, nol(soc.crg.cd_sys.clk)),
-            'rst':  getattr(t, nol(soc.crg.cd_sys.rst)),
-        }
-    return srv.root.call_on_server(helper)
-
 
 if cocotb.top is not None:
-    soc = srv.root.soc
-    ns = srv.root.ns
-    pads_real = soc.qspi_pads_real
-    pads_emu = soc.qspi_pads_emu
+    # soc/ns are only fetched over rpyc on demand, e.g. srv.root.soc from a debugger
+    sim_names = load_sim_names()
+    if sim_names is None:
+        sim_names = fetch_sim_names(srv, lambda soc: soc.sim_info())
+
+    set_flash_timing(MacronixTiming(**sim_names.info['flash_timing']))
 
-    flash_mem_region: Final = soc.csr.regions['qspi_emu_flash_mem']
-    flash_mem_wb_base: Final = flash_mem_region.origin // (flash_mem_region.busword // 8)
-    flash_mem_sel_region: Final = soc.csr.regions['qspi_emu']
-    flash_mem_sel_ptr: Final = flash_mem_sel_region.origin // (flash_mem_sel_region.busword // 8)
+    flash_mem_wb_base: Final = sim_names.csr_regions['qspi_emu_flash_mem'].wb_base
+    flash_mem_sel_ptr: Final = sim_names.csr_regions['qspi_emu'].wb_base
 
-    d = get_sigs_dict(cocotb.top)
-    d['qr'] = QSPISigs(**get_qspisigs_dict(cocotb.top, pads_real))
-    d['qe'] = QSPISigs(**get_qspisigs_dict(cocotb.top, pads_emu))
-    sigs = Sigs(**d)
+    sigs = Sigs(
+        clk=getattr(cocotb.top, sim_names.pad('sys_clk')),
+        rst=getattr(cocotb.top, sim_names.pad('sys_rst')),
+        qr=QSPISigs(**sim_names.pad_handles(cocotb.top, 'qspiflash_real')),
+        qe=QSPISigs(**sim_names.pad_handles(cocotb.top, 'qspiflash_emu')),
+    )
+
+    if sim_names.info['trace_window']:
+        trace_gate = getattr(cocotb.top, sim_names.pad('trace_window'))
+        trace_gate <= 0
+
+    bfm_info = sim_names.info['spi_bfm']
+    if bfm_info is not None:
+        bfm = SPIMasterBFMDriver(sigs.clk, sim_names.pad_handles(cocotb.top, 'spi_bfm'), **bfm_info)
+        bfm.xfer = profiled(bfm.xfer, name='bfm.xfer')
 
     wb_bus = WishboneMaster(cocotb.top, "wb_sim_tap", sigs.clk,
                           width=32,   # size of data bus
@@ -288,10 +336,17 @@ if cocotb.top is not None:
                                         "datrd": "dat_r",
                                          "ack":  "ack" })
 
+def trace_window(on: bool):
+    # holds the gateware trace window open, the dump only covers windows when the bench was built with --trace-on
+    if trace_gate is not None:
+        trace_gate <= int(on)
+
+
 def fork_clk():
     cocotb.fork(Clock(cocotb.top.sys_clk, clkper_ns, units="ns").start())
 
 
+@profiled
 async def spi_txfr_start(dut, q: QSPISigs):
     dut._log.info('-- SPI BEGIN')
     # assert q.csn.value == 1
@@ -300,6 +355,7 @@ async def spi_txfr_start(dut, q: QSPISigs):
     await qtclk
 
 
+@profiled
 async def spi_txfr_end(dut, q: QSPISigs):
     # assert q.csn.value == 0
     await qtclk
@@ -309,6 +365,7 @@ async def spi_txfr_end(dut, q: QSPISigs):
     await qtclk
 
 
+@profiled
 async def tick_si(dut, q: QSPISigs, si: BitSequence, write_only=False) -> BitSequence:
     so = None
     if not write_only:
@@ -328,6 +385,7 @@ async def tick_si(dut, q: QSPISigs, si: BitSequence, write_only=False) -> BitSeq
     return so
 
 
+@profiled
 async def tick_so(dut, q: QSPISigs, nbits: int, write_only=False) -> BitSequence:
     # dut._log.info(f'tick_tdo {nbits}')
     si = BitSequence(0, length=nbits)
@@ -338,6 +396,7 @@ def reset_soc_line(sigs: Sigs):
     sigs.clk <= 0
     sigs.rst <= 0
 
+@profiled
 async def reset_soc(dut):
     reset_soc_line(sigs)
 
@@ -352,12 +411,16 @@ async def reset_soc(dut):
     await tclk
 
 def reset_flash_lines(q: QSPISigs):
-    q.sclk <= 0
     q.rstn <= 1
+    q.wpn <= 0
+    if bfm is not None:
+        bfm.idle_lines()
+        return
+    q.sclk <= 0
     q.csn <= 1
     q.si <= 0
-    q.wpn <= 0
 
+@profiled
 async def reset_flash(q: QSPISigs):
     reset_flash_lines(q)
 
@@ -367,7 +430,7 @@ async def reset_flash(q: QSPISigs):
 
     await tRLRH
 
-    for i in range(5):
+    for i in range(5 if bfm is None else 0):
         q.sclk <= 1
         await qtclkh
         q.sclk <= 0
@@ -378,8 +441,11 @@ async def reset_flash(q: QSPISigs):
     await tRHSL
     await tREADY2_ROLL
 
+@profiled
 async def read_flash_spi(dut, q: QSPISigs, addr: int, sz: int):
     assert addr < 2**24
+    if bfm is not None:
+        return await bfm.xfer(bytes([0x03]) + addr.to_bytes(3, 'big'), sz)
     cmd = BitSequence(0x03, msb=True, length=8) + BitSequence(addr, msb=True, length=24)
     await spi_txfr_start(dut, q)
     await tick_si(dut, q, cmd, write_only=True)
@@ -387,6 +453,7 @@ async def read_flash_spi(dut, q: QSPISigs, addr: int, sz: int):
     await spi_txfr_end(dut, q)
     return so.tobytes(msb=True)
 
+@profiled
 async def read_flash_wb(dut, addr: int, sz: int):
     sel_wr_on_res = await wb_bus.send_cycle([WBOp(flash_mem_sel_ptr, dat=1)])
     assert sel_wr_on_res[0].ack
@@ -401,6 +468,7 @@ async def read_flash_wb(dut, addr: int, sz: int):
     assert sel_wr_off_res[0].ack
     return rd_buf
 
+@profiled
 async def write_flash_wb(dut, addr: int, buf: bytes):
     sel_wr_on_res = await wb_bus.send_cycle([WBOp(flash_mem_sel_ptr, dat=1)])
     assert sel_wr_on_res[0].ack
@@ -413,6 +481,7 @@ async def write_flash_wb(dut, addr: int, buf: bytes):
     assert sel_wr_off_res[0].ack
 
 @cocotb.test()
+@profiled
 async def initial_reset(dut):
     fork_clk()
     reset_soc_line(sigs)
@@ -422,13 +491,13 @@ async def initial_reset(dut):
 
 
 @cocotb.test(skip=True)
+@profiled
 async def read_wb_soc_id(dut):
     fork_clk()
 
     # dut._log.info(f'bus: {wb_bus}')
     soc_id = ''
-    soc_id_region = soc.csr.regions['identifier_mem']
-    soc_id_ptr = soc_id_region.origin // (soc_id_region.busword // 8)
+    soc_id_ptr = sim_names.csr_regions['identifier_mem'].wb_base
     # dut._log.info(f'soc_id_ptr: {soc_id_ptr:x}')
     while True:
         wb_res = await wb_bus.send_cycle([WBOp(soc_id_ptr)])
@@ -442,8 +511,13 @@ async def read_wb_soc_id(dut):
 
 
 @cocotb.test(skip=False)
+@profiled
 async def read_flash_id(dut):
     fork_clk()
+    if bfm is not None:
+        flash_id = await bfm.xfer(bytes([0x9f]), 3)
+        dut._log.info(f'flash_id: {flash_id.hex()}')
+        return
     cmd = BitSequence(0x9f, msb=True, length=8)
     await spi_txfr_start(dut, sigs.qe)
     await tick_si(dut, sigs.qe, cmd, write_only=True)
@@ -452,35 +526,56 @@ async def read_flash_id(dut):
     dut._log.info(f'flash_id: {flash_id}')
 
 @cocotb.test(skip=False)
+@profiled
 async def read_first_four_bytes(dut):
     fork_clk()
     first_four_bytes = await read_flash_spi(dut, sigs.qe, 0x4, 4)
     dut._log.info(f'first_four_bytes: {first_four_bytes.hex()}')
 
 @cocotb.test(skip=False)
+@profiled
 async def read_first_four_bytes_wb(dut):
     fork_clk()
     first_four_bytes_wb = await read_flash_wb(dut, 0x4, 4)
     dut._log.info(f'first four bytes WB: {first_four_bytes_wb.hex()}')
 
 @cocotb.test(skip=False)
+@profiled
 async def read_first_four_bytes_again(dut):
     fork_clk()
     first_four_bytes = await read_flash_spi(dut, sigs.qe, 0x4, 4)
     dut._log.info(f'first_four_bytes again: {first_four_bytes.hex()}')
 
 @cocotb.test(skip=False)
+@profiled
+async def read_4k_bfm(dut):
+    fork_clk()
+    if bfm is None:
+        dut._log.info('read_4k_bfm: built without --spi-bfm, skipping')
+        return
+    buf = await read_flash_spi(dut, sigs.qe, 0x1000, 4096)
+    dut._log.info(f'4k read @ 0x1000: {buf[:16].hex()}...{buf[-16:].hex()}')
+    # FlashEmu serves a 256 byte BRAM wrapped over the address space, still as initialized at this point
+    expected = bytes(FlashEmu.val4addr(a & 0xff) for a in range(0x1000, 0x1000 + 4096))
+    bad = next((i for i, (a, b) in enumerate(zip(buf, expected)) if a != b), min(len(buf), len(expected)))
+    assert buf == expected, \
+        f'4k read differs at {0x1000 + bad:#x}: {buf[bad:bad + 8].hex()} != {expected[bad:bad + 8].hex()}'
+
+@cocotb.test(skip=False)
+@profiled
 async def write_first_four_bytes_wb(dut):
     fork_clk()
     await write_flash_wb(dut, 0x4, buf=bytes.fromhex('aa5500ff'))
 
 @cocotb.test(skip=False)
+@profiled
 async def read_first_four_bytes_again_but_different(dut):
     fork_clk()
     first_four_bytes = await read_flash_spi(dut, sigs.qe, 0x4, 4)
     dut._log.info(f'first_four_bytes again but different: {first_four_bytes.hex()}')
 
 @cocotb.test(skip=True)
+@profiled
 async def enable_write(dut):
     fork_clk()
 
@@ -492,6 +587,7 @@ async def enable_write(dut):
     dut._log.info(f'enabled write mode')
 
 @cocotb.test(skip=True)
+@profiled
 async def read_status_wel(dut):
     fork_clk()
     status = None
@@ -506,6 +602,7 @@ async def read_status_wel(dut):
     dut._log.info(f'status WEL: {status}')
 
 @cocotb.test(skip=True)
+@profiled
 async def enable_quad_mode(dut):
     fork_clk()
 
@@ -517,6 +614,7 @@ async def enable_quad_mode(dut):
     dut._log.info(f'enabled quad mode')
 
 @cocotb.test(skip=True)
+@profiled
 async def read_status_wip(dut):
     fork_clk()
     status = None
@@ -531,6 +629,7 @@ async def read_status_wip(dut):
     dut._log.info(f'status WIP: {status}')
 
 @cocotb.test(skip=True)
+@profiled
 async def read_status_qe(dut):
     fork_clk()
     status = None
@@ -548,6 +647,7 @@ async def read_status_qe(dut):
     dut._log.info(f'status QE: {status}')
 
 @cocotb.test(skip=True)
+@profiled
 async def read_first_four_bytes_qmode(dut):
     fork_clk()
     first_four_bytes = None
@@ -566,11 +666,13 @@ async def read_first_four_bytes_qmode(dut):
 
 
 @cocotb.test(skip=True)
+@profiled
 async def reset_flash_cnt(dut):
     fork_clk()
     await reset_flash(sigs.qe)
 
 @cocotb.test(skip=True)
+@profiled
 async def inc_flash_cnt(dut):
     fork_clk()
     await tick_so(dut, sigs.qe, 16, write_only=True)
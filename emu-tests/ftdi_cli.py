@@ -1,17 +1,97 @@
 #!/usr/bin/env python3
 
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
 import sys
+import time
+
+from rich import print
+
+from litespih4x.ftdi_dump import DEFAULT_URL, dump, idcode, open_port, usb_chunk, verify
+from litespih4x.argtypes import parse_int
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.t0 = self.last = time.monotonic()
+
+    def __call__(self, done: int):
+        now = time.monotonic()
+        if now - self.last >= 1 or done == self.total:
+            self.last = now
+            print(f'{done >> 10}/{self.total >> 10} KiB {done / max(now - self.t0, 1e-9) / 2**20:.2f} MiB/s')
+
+
+def port(args):
+    spi, p = open_port(args.url, args.freq, args.cs)
+    chunk = args.chunk or usb_chunk(spi)
+    print(f'{args.url}: SCLK {p.frequency / 1e6:.2f} MHz, {chunk} byte chunks')
+    return spi, p, chunk
+
+
+def cmd_idcode(args):
+    spi, p, _ = port(args)
+    print(f'jedec_id: {idcode(p):06x}')
+    spi.terminate()
+
+
+def cmd_dump(args):
+    spi, p, chunk = port(args)
+    t0 = time.monotonic()
+    r = dump(p, args.output, args.size, args.addr, chunk, args.addr_bytes, not args.slow_read,
+             resume=not args.restart, progress=Progress(args.size))
+    spi.terminate()
+    resumed = f', resumed at {r.resumed_from:#x}' if r.resumed_from else ''
+    print(f'{r.size} bytes in {time.monotonic() - t0:.1f}s{resumed} -> {r.path}')
 
-from pyftdi.spi import SpiController, SpiPort
 
-spi = SpiController()
+def cmd_verify(args):
+    spi, p, chunk = port(args)
+    bad = verify(p, args.reference, args.addr, args.size, chunk, args.addr_bytes, not args.slow_read,
+                 progress=Progress(args.size) if args.size else None)
+    spi.terminate()
+    for m in bad[:args.limit]:
+        print(f'[red]mismatch {m}')
+    print(f'[{"red" if bad else "green"}]{len(bad)} mismatching ranges')
+    sys.exit(1 if bad else 0)
 
-spi.configure(sys.argv[1])
 
-periph = spi.get_port(cs=0, freq=12E6, mode=0)
+def main():
+    parser = argparse.ArgumentParser(description="Dump and verify SPI flash (or the emulator) over FTDI MPSSE")
+    parser.add_argument("--url", default=DEFAULT_URL, help="pyftdi device URL")
+    parser.add_argument("--freq", type=float, default=None, help="SCLK in Hz (default: fastest MPSSE clock)")
+    parser.add_argument("--cs", type=int, default=0)
+    parser.add_argument("--chunk", type=parse_int, default=None, help="bytes per exchange (default: fits the USB FIFO)")
+    parser.add_argument("--addr-bytes", type=int, choices=(3, 4), default=4,
+                        help="4: FAST_READ4B (0x0c)/READ4B (0x13), 3: FAST_READ (0x0b)/READ (0x03)")
+    parser.add_argument("--slow-read", action="store_true", help="READ instead of FAST_READ")
+    parser.add_argument("--emu", action="store_true",
+                        help="reading the emulator back: 3 byte READ (0x03), the only read in its default decode table")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("idcode", help="read the JEDEC ID")
+    p.set_defaults(func=cmd_idcode)
+    p = sub.add_parser("dump", help="read a range into a file, resumable")
+    p.add_argument("output")
+    p.add_argument("--addr", type=parse_int, default=0)
+    p.add_argument("--size", type=parse_int, default=32 << 20, help="bytes (default: 32 MiB)")
+    p.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    p.set_defaults(func=cmd_dump)
+    p = sub.add_parser("verify", help="compare a range against a file")
+    p.add_argument("reference")
+    p.add_argument("--addr", type=parse_int, default=0)
+    p.add_argument("--size", type=parse_int, default=None, help="bytes (default: the reference's size)")
+    p.add_argument("--limit", type=int, default=32, help="mismatches to print")
+    p.set_defaults(func=cmd_verify)
+    args = parser.parse_args()
+    if args.emu:
+        args.addr_bytes, args.slow_read = 3, True
+    args.func(args)
 
-jedec_id = periph.exchange([0x9f], 3)
-print(f'jedec_id: {jedec_id.hex()}')
 
-first_four_bytes = periph.exchange([0x03, 0x00, 0x00, 0x00], 4)
-print(f'first_four_bytes: {first_four_bytes.hex()}')
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from rich import print
+
+from litespih4x.argtypes import parse_int
+from litespih4x.wavedrom import Lane, Latency, timing_diagram, write_timing
+from litespih4x.wavestore import EDGE_KINDS, WaveStore, convert
+
+
+def cmd_convert(args):
+    t0 = time.perf_counter()
+    store = convert(args.trace, args.store, args.signal or None)
+    n = sum(s['count'] for s in store.signals.values())
+    print(f'{len(store.names)} signals, {n} changes in {time.perf_counter() - t0:.1f}s -> {args.store}')
+
+
+def cmd_info(args):
+    store = WaveStore(args.store)
+    print(f'{store.source}: timescale {store.timescale_ps} ps, ends at {store.end_time}')
+    for name, info in store.signals.items():
+        print(f'{name:60s} {info["width"]:4d} bits {info["count"]:10d} changes')
+
+
+def cmd_at(args):
+    store = WaveStore(args.store)
+    for name in args.signal:
+        v = store[name].value_at(args.time)
+        print(f'{store.find(name)} = {"x" if v is None else hex(v) if isinstance(v, int) else v}')
+
+
+def cmd_edges(args):
+    store = WaveStore(args.store)
+    edges = store[args.signal].edges(args.kind, args.start, args.end)
+    print(f'{len(edges)} {args.kind} edges')
+    for t in edges[:args.limit]:
+        print(int(t))
+
+
+def cmd_wavedrom(args):
+    store = WaveStore(args.store)
+    lanes = []
+    for spec in args.lane:
+        clk, _, sigs = spec.partition(':')
+        lanes.append(Lane(clk, [s for s in sigs.split(',') if s]))
+    lats = []
+    for spec in args.latency or []:
+        name, _, edges = spec.partition('=')
+        start, _, end = edges.partition(',')
+        lats.append(Latency(name, start, end))
+    end = store.end_time if args.end is None else args.end
+    src, measured = timing_diagram(store, lanes, args.start, end, lats, clk_freq=args.clk_freq, title=args.title)
+    for m in measured:
+        print(m)
+    print(f'-> {write_timing(args.output, src)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert VCD/FST traces to a memory-mapped waveform store and query it")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("convert", help="convert a trace")
+    p.add_argument("trace", help="VCD, VCD.gz or FST trace")
+    p.add_argument("store", help="output directory")
+    p.add_argument("-s", "--signal", action="append", help="signal to keep (name or unique suffix), repeatable, default all")
+    p.set_defaults(func=cmd_convert)
+    p = sub.add_parser("info", help="list stored signals")
+    p.add_argument("store")
+    p.set_defaults(func=cmd_info)
+    p = sub.add_parser("at", help="values at a time (trace timescale units)")
+    p.add_argument("store")
+    p.add_argument("time", type=parse_int)
+    p.add_argument("signal", nargs="+")
+    p.set_defaults(func=cmd_at)
+    p = sub.add_parser("edges", help="edge times of a signal")
+    p.add_argument("store")
+    p.add_argument("signal")
+    p.add_argument("--kind", choices=EDGE_KINDS, default="rising")
+    p.add_argument("--start", type=parse_int)
+    p.add_argument("--end", type=parse_int)
+    p.add_argument("--limit", type=int, default=32, help="edges to print")
+    p.set_defaults(func=cmd_edges)
+    p = sub.add_parser("wavedrom", help="WaveDrom timing diagram of a time window")
+    p.add_argument("store")
+    p.add_argument("-l", "--lane", action="append", required=True,
+                   help="clock:signal,signal,... sampled on the clock, repeatable, the first lane's clock is the base; label=signal renames")
+    p.add_argument("--latency", action="append", help="name=start,end with signal[:rising|falling|any] edges, repeatable")
+    p.add_argument("--start", type=parse_int, default=0)
+    p.add_argument("--end", type=parse_int)
+    p.add_argument("--clk-freq", type=float, help="base clock in Hz to annotate latencies in ns")
+    p.add_argument("--title")
+    p.add_argument("-o", "--output", default="timing.json")
+    p.set_defaults(func=cmd_wavedrom)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,46 @@
 #!/usr/bin/env python3
 
-import sys
+import argparse
 
-from pyDigitalWaveTools.vcd.parser import VcdParser
+from litespih4x.vcd_stream import VCDReader, open_jtag, open_spi
 
-def dump(path: str):
-	with open(path) as vcd_file:
-		vcd = VcdParser()
-		vcd.parse(vcd_file)
-		print(vcd)
-		print()
-		print(vcd.scope)
+# Streams the trace, memory use doesn't grow with the file size. Signal names may be unique suffixes.
+
+def dump_jtag(args):
+	with VCDReader(args.vcd) as vcd:
+		ps = vcd.timescale_ps
+		for op in open_jtag(vcd, args.tck, args.tms, args.tdi, args.tdo):
+			print(f'@{op.start * ps / 1000:.1f}ns {op}')
+	return
+
+
+def dump_spi(args):
+	with VCDReader(args.vcd) as vcd:
+		ps = vcd.timescale_ps
+		for txn in open_spi(vcd, args.sclk, args.csn, args.mosi, args.miso):
+			addr = f' addr=0x{txn.addr:x}' if txn.addr is not None else ''
+			per = f' sclk={txn.min_clk_period * ps / 1000:.1f}ns' if txn.min_clk_period else ''
+			partial = '' if txn.complete else ' (truncated)'
+			print(f'@{txn.start * ps / 1000:.1f}ns {txn.name}{addr} clks={txn.nclk}{per} data={txn.data.hex()}{partial}')
 	return
 
 
 if __name__ == '__main__':
-	dump(sys.argv[1])
+	parser = argparse.ArgumentParser(description='decode JTAG TAP operations or SPI flash transactions from a VCD')
+	sub = parser.add_subparsers(dest='proto', required=True)
+	jtag = sub.add_parser('jtag')
+	jtag.add_argument('vcd')
+	jtag.add_argument('--tck', default='altera_reserved_tck')
+	jtag.add_argument('--tms', default='altera_reserved_tms')
+	jtag.add_argument('--tdi', default='altera_reserved_tdi')
+	jtag.add_argument('--tdo', default='jtag_phy_tdo')
+	jtag.set_defaults(func=dump_jtag)
+	spi = sub.add_parser('spi')
+	spi.add_argument('vcd')
+	spi.add_argument('--sclk', default='spiflash_emu_sclk')
+	spi.add_argument('--csn', default='spiflash_emu_csn')
+	spi.add_argument('--mosi', default='spiflash_emu_si')
+	spi.add_argument('--miso', default='spiflash_emu_so')
+	spi.set_defaults(func=dump_spi)
+	args = parser.parse_args()
+	args.func(args)
@@ -0,0 +1,11 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# argparse types shared by the host tools, kept free of migen/litex so they load without the gateware.
+
+from __future__ import annotations
+
+
+def parse_int(s: str) -> int:
+    # decimal, 0x, 0o or 0b
+    return int(s, 0)
@@ -0,0 +1,140 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Split the @cocotb.test functions of a bench across simulator processes and merge their JUnit results.
+# Each shard gets its own copy of one prebuilt sim dir, selects its tests with TESTCASE and writes its own
+# COCOTB_RESULTS_FILE.
+
+from __future__ import annotations
+
+import ast
+import os
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Final, Optional, Sequence
+
+import attr
+
+RESULTS_FILE: Final = 'results.xml'
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CocotbTestInfo:
+    name: str
+    skip: bool = False
+
+
+def _is_cocotb_test(dec: ast.expr) -> Optional[ast.expr]:
+    fn = dec.func if isinstance(dec, ast.Call) else dec
+    if isinstance(fn, ast.Attribute) and fn.attr == 'test' and isinstance(fn.value, ast.Name) and fn.value.id == 'cocotb':
+        return dec
+    return None
+
+
+def discover_tests(path: Path) -> list[CocotbTestInfo]:
+    # static scan so discovery doesn't need a simulator, in file (= cocotb run) order
+    tree = ast.parse(Path(path).read_text(), filename=str(path))
+    tests = []
+    for node in tree.body:
+        if not isinstance(node, (ast.AsyncFunctionDef, ast.FunctionDef)):
+            continue
+        for dec in node.decorator_list:
+            if _is_cocotb_test(dec) is None:
+                continue
+            skip = False
+            if isinstance(dec, ast.Call):
+                for kw in dec.keywords:
+                    if kw.arg == 'skip' and isinstance(kw.value, ast.Constant):
+                        skip = bool(kw.value.value)
+            tests.append(CocotbTestInfo(node.name, skip))
+    return tests
+
+
+def shard_tests(names: Sequence[str], nshards: int, prologue: Sequence[str] = ()) -> list[list[str]]:
+    # contiguous chunks keep neighbouring tests, which tend to share flash state, in the same process
+    body = [n for n in names if n not in prologue]
+    nshards = max(1, min(nshards, len(body)))
+    shards = []
+    for i in range(nshards):
+        lo, hi = len(body) * i // nshards, len(body) * (i + 1) // nshards
+        shards.append([*prologue, *body[lo:hi]])
+    return shards
+
+
+@attr.s(auto_attribs=True)
+class ShardResult:
+    index: int
+    tests: list[str]
+    returncode: int
+    wall_s: float
+    results: Optional[Path]
+    log: Path
+
+
+def run_shard(index: int, tests: Sequence[str], cmd: Sequence[str], build_src: Optional[Path], work_dir: Path,
+              build_subdir: str = 'build') -> ShardResult:
+    shard_dir = work_dir / f'shard{index}'
+    if shard_dir.exists():
+        shutil.rmtree(shard_dir)
+    shard_dir.mkdir(parents=True)
+    if build_src is not None:
+        # copy2 keeps mtimes so the simulator's make sees the prebuilt model as up to date
+        shutil.copytree(build_src, shard_dir / build_subdir, symlinks=True)
+    results = shard_dir / RESULTS_FILE
+    env = dict(os.environ, TESTCASE=','.join(tests), COCOTB_RESULTS_FILE=str(results))
+    log = shard_dir / 'shard.log'
+    t0 = time.monotonic()
+    with open(log, 'wb') as f:
+        rc = subprocess.call(list(cmd), cwd=shard_dir, env=env, stdout=f, stderr=subprocess.STDOUT)
+    return ShardResult(index, list(tests), rc, time.monotonic() - t0, results if results.is_file() else None, log)
+
+
+def run_shards(shards: Sequence[Sequence[str]], cmd: Sequence[str], build_src: Optional[Path], work_dir: Path,
+               jobs: Optional[int] = None) -> list[ShardResult]:
+    jobs = jobs or len(shards)
+    with ThreadPoolExecutor(max_workers=jobs) as ex:
+        futs = [ex.submit(run_shard, i, s, cmd, build_src, work_dir) for i, s in enumerate(shards)]
+        return [f.result() for f in futs]
+
+
+def merge_junit(results: Sequence[ShardResult], prologue: Sequence[str] = ()) -> ET.Element:
+    # prologue tests ran once per shard, only the first shard's copy is reported unless a later one failed
+    merged = ET.Element('testsuites', name='cocotb-shards')
+    suite = ET.SubElement(merged, 'testsuite', name='all')
+    ntests = nfail = nskip = 0
+    for r in results:
+        if r.results is None:
+            case = ET.SubElement(suite, 'testcase', name=f'shard{r.index}', classname='shard')
+            ET.SubElement(case, 'failure', message=f'no results, exit code {r.returncode}, see {r.log}')
+            ntests += 1
+            nfail += 1
+            continue
+        for case in ET.parse(r.results).getroot().iter('testcase'):
+            failed = case.find('failure') is not None or case.find('error') is not None
+            if r.index != results[0].index and case.get('name') in prologue and not failed:
+                continue
+            case.set('shard', str(r.index))
+            suite.append(case)
+            ntests += 1
+            if failed:
+                nfail += 1
+            elif case.find('skipped') is not None:
+                nskip += 1
+    suite.set('tests', str(ntests))
+    suite.set('failures', str(nfail))
+    suite.set('skipped', str(nskip))
+    return merged
+
+
+def junit_summary(merged: ET.Element) -> tuple[int, int, int]:
+    suite = merged.find('testsuite')
+    return int(suite.get('tests')), int(suite.get('failures')), int(suite.get('skipped'))
+
+
+def bench_cmd(script: Path, *args: str) -> list[str]:
+    return [sys.executable, str(Path(script).resolve()), *args]
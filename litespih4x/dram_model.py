@@ -0,0 +1,59 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Behavioral LiteDRAM native read port for migen run_simulation benches. Plain migen, so the DRAM side
+# gateware can be simulated without the forked migen/litex the emulators need.
+
+from __future__ import annotations
+
+from migen import *
+
+from litedram.common import LiteDRAMNativePort
+
+from typing import Generator, Union
+
+import attr
+
+
+@attr.s(auto_attribs=True)
+class DRAMNativePortModelStats:
+    cmds: int = 0
+    words: int = 0
+    max_outstanding: int = 0
+
+
+# behavioral in-order LiteDRAM native read port, reads return latency sys clocks after the command
+class DRAMNativePortModel:
+    def __init__(self, port: LiteDRAMNativePort, mem: Union[bytes, bytearray], latency: int = 11):
+        self.port = port
+        self.mem = mem
+        self.latency = latency
+        self.nbytes_per_word = port.data_width // 8
+        self.stats = DRAMNativePortModelStats()
+
+    def read_word(self, word_addr: int) -> int:
+        off = word_addr * self.nbytes_per_word
+        return int.from_bytes(self.mem[off:off + self.nbytes_per_word].ljust(self.nbytes_per_word, b'\xff'), 'little')
+
+    @passive
+    def handler(self) -> Generator:
+        p = self.port
+        pending = []
+        cycle = 0
+        yield p.cmd.ready.eq(1)
+        while True:
+            # reads see the values the DUT sampled on this edge, writes show up for the next one
+            if (yield p.cmd.valid) and (yield p.cmd.ready):
+                pending.append((cycle + self.latency, (yield p.cmd.addr)))
+                self.stats.cmds += 1
+                self.stats.max_outstanding = max(self.stats.max_outstanding, len(pending))
+            if (yield p.rdata.valid) and (yield p.rdata.ready):
+                pending.pop(0)
+                self.stats.words += 1
+            if pending and pending[0][0] <= cycle:
+                yield p.rdata.valid.eq(1)
+                yield p.rdata.data.eq(self.read_word(pending[0][1]))
+            else:
+                yield p.rdata.valid.eq(0)
+            yield
+            cycle += 1
@@ -5,6 +5,10 @@
 from __future__ import annotations
 
 from .emu_mem import FlashEmuMem
+from .emu_decode import FlashEmuDecodeTable, decode_entry_layout, DEFAULT_DECODE_TABLE, QSPI_DECODE_TABLE
+from .emu_decode import LANES_SINGLE, LANES_QUAD, SRC_MEM, SRC_IDCODE, SRC_SFDP, ACT_ERR, ACT_IGNORE
+from .emu_sfdp import FlashEmuSFDP
+from .emu_trigger import FlashEmuTrigger
 
 from rich import print
 
@@ -14,6 +18,7 @@ from migen.genlib.resetsync import AsyncResetSingleStageSynchronizer
 
 from litex.build.generic_platform import Subsignal, Pins, IOStandard
 from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import CSRStorage, CSRStatus
 from litedram.core.crossbar import LiteDRAMNativeReadPort
 from litespih4x.emu_dram import FlashEmuDRAMLite
 
@@ -85,6 +90,8 @@ CMD_WRSR: Final = 0x01
 
 CMD_WREN: Final = 0x06
 
+CMD_RDSFDP: Final = 0x5a
+
 
 class FlashEmu(Module):
     def __init__(self, cd_sys: ClockDomain, qrs: QSPISigs, qes: QSPISigs, sz_mbit: int, idcode: int):
@@ -193,11 +200,17 @@ class FlashEmu(Module):
 
         self.addr = addr = Signal(24)
         self.addr_next = addr_next = Signal(24)
-        self.addr_cnt = addr_cnt = Signal(max=24)
+        self.addr_cnt = addr_cnt = Signal(max=32)
+        self.addr_last = addr_last = Signal(max=32)
+        self.dummy_cnt = dummy_cnt = Signal(max=32)
         self.dr = dr = Signal(8)
         self.dr_bit_cnt = dr_bit_cnt = Signal(max=8)
         self.qmode = qmode = Signal()
 
+        self.submodules.decoder = decoder = FlashEmuDecodeTable(cmd_next, cd_sys, QSPI_DECODE_TABLE)
+        self.dec_ent = dec_ent = Record(decode_entry_layout)
+        self.submodules.sfdp = sfdp = FlashEmuSFDP(addr, cd_sys)
+
         # self.specials.flash_mem = flash_mem = Memory(8, 0x100, init=[self.val4addr(a) for a in range(0x100)], name='flash_mem')
         # self.specials.fmrp = fmrp = flash_mem.get_port(clock_domain='spi')
         # self.comb += fmrp.adr.eq(addr_next)
@@ -210,6 +223,16 @@ class FlashEmu(Module):
         cmd_fsm = ClockDomainsRenamer('spi')(cmd_fsm)
         self.submodules.cmd_fsm = cmd_fsm
 
+        def goto_data(src):
+            return If((src == SRC_MEM) | (src == SRC_SFDP),
+                NextState('read_get_data'),
+            ).Elif(src == SRC_IDCODE,
+                NextState('rdid'),
+            ).Else(
+                NextState('bad_cmd_err'),
+            )
+
+        dec = decoder.entry
         self.get_cmd_flag = get_cmd_flag = Signal()
         cmd_fsm.act('get_cmd',
             cmd_next.eq(Cat(esi, cmd[:-1])),
@@ -218,15 +241,19 @@ class FlashEmu(Module):
             NextValue(cmd_bit_cnt, cmd_bit_cnt + 1),
 
             If(cmd_bit_cnt == 7,
-                If(cmd_next == CMD_READ,
-                    NextState('read_get_addr'),
-                ).Elif(cmd_next == CMD_QREAD,
+                NextValue(dec_ent.raw_bits(), dec.raw_bits()),
+                NextValue(addr_last, Cat(C(0, 3), dec.addr_bytes) - 1),
+                NextValue(qmode, dec.lanes == LANES_QUAD),
+                If((dec.action == ACT_ERR) | ((dec.lanes != LANES_SINGLE) & (dec.lanes != LANES_QUAD)),
+                    NextState('bad_cmd_err'),
+                ).Elif(dec.action == ACT_IGNORE,
+                    NextState('ignore'),
+                ).Elif(dec.addr_bytes != 0,
                     NextState('read_get_addr'),
-                    NextValue(qmode, 1),
-                ).Elif(cmd_next == CMD_RDID,
-                    NextState('rdid'),
+                ).Elif(dec.dummy != 0,
+                    NextState('dummy'),
                 ).Else(
-                    NextState('bad_cmd_err'),
+                    goto_data(dec.src),
                 )
             ),
         )
@@ -241,15 +268,31 @@ class FlashEmu(Module):
             addr_next.eq(Cat(esi, addr[:-1])),
             NextValue(addr, addr_next),
             NextValue(addr_cnt, addr_cnt + 1),
-            If(addr_cnt == 23,
-               NextState('read_get_data'),
+            If(addr_cnt == addr_last,
+                If(dec_ent.dummy != 0,
+                    NextState('dummy'),
+                ).Else(
+                    goto_data(dec_ent.src),
+                )
+            )
+        )
+
+        cmd_fsm.act('dummy',
+            addr_next.eq(addr), # keep the sync flash_mem read port on the first data byte
+            NextValue(dummy_cnt, dummy_cnt + 1),
+            If(dummy_cnt == dec_ent.dummy - 1,
+                goto_data(dec_ent.src),
             )
         )
 
         self.dr_tmp = dr_tmp = Signal(8)
         cmd_fsm.act('read_get_data',
             If(dr_bit_cnt == 0,
-                dr_tmp.eq(fmp.dat_r)
+                If(dec_ent.src == SRC_SFDP,
+                    dr_tmp.eq(sfdp.dat_r),
+                ).Else(
+                    dr_tmp.eq(fmp.dat_r),
+                )
             ).Else(
                 dr_tmp.eq(dr)
             ),
@@ -272,6 +315,8 @@ class FlashEmu(Module):
             bad_cmd_err.eq(1),
         )
 
+        cmd_fsm.act('ignore')
+
         self.cnt = cnt = Signal(16)
         self.sync.spi += cnt.eq(cnt + 1)
 
@@ -283,12 +328,12 @@ class FlashEmu(Module):
         return self.flash_mem.get_memories()
 
     def get_csrs(self):
-        return self.flash_mem.get_csrs()
+        return self.flash_mem.get_csrs() + self.decoder.get_csrs() + self.sfdp.get_csrs()
 
 
 class FlashEmuLite(Module):
     def __init__(self, cd_sys: ClockDomain, sigs: SPISigs, dram_port: LiteDRAMNativeReadPort,
-                 sz_mbit: int, idcode: int, prefetch_bits = 6):
+                 sz_mbit: int, idcode: int, prefetch_bits = 6, num_triggers = 0):
         self.spi_sigs = sigs
         self.dram_port = dram_port
         self.sz_mbit = sz_mbit
@@ -317,10 +362,16 @@ class FlashEmuLite(Module):
 
         self.addr = addr = Signal(24)
         self.addr_next = addr_next = Signal(24)
-        self.addr_cnt = addr_cnt = Signal(max=24)
+        self.addr_cnt = addr_cnt = Signal(max=32)
+        self.addr_last = addr_last = Signal(max=32)
+        self.dummy_cnt = dummy_cnt = Signal(max=32)
         self.dr = dr = Signal(8)
         self.dr_bit_cnt = dr_bit_cnt = Signal(max=8)
 
+        self.submodules.decoder = decoder = FlashEmuDecodeTable(cmd_next, cd_sys, DEFAULT_DECODE_TABLE)
+        self.dec_ent = dec_ent = Record(decode_entry_layout)
+        self.submodules.sfdp = sfdp = FlashEmuSFDP(addr, cd_sys)
+
         self.partial_addr_valid = paddr_valid = Signal()
         self.partial_addr_valid_sys = paddr_valid_sys = Signal()
         self.specials.paddr_valid_sync = MultiReg(paddr_valid, paddr_valid_sys, cd_sys.name)
@@ -328,10 +379,47 @@ class FlashEmuLite(Module):
         self.partial_addr_fw = paddr_fw = Signal(addr.nbits)
         self.comb += paddr_fw.eq(Cat(C(0, prefetch_bits), paddr))
 
-        self.submodules.flash_mem = flash_mem = FlashEmuDRAMLite(dram_port, prefetch_bits, paddr_fw, paddr_valid_sys)
+        self.nbytes_per_mt = dram_port.data_width//8
+        word_shift = log2_int(self.nbytes_per_mt)
+
+        # image slot base, only follows the CSR while CS# is high so a transaction never tears
+        self.image_base = image_base = CSRStorage(dram_port.address_width + word_shift, write_from_dev=True,
+            description="Byte offset of the image slot in DRAM, applied at the next CS# boundary")
+        self.image_base_active = image_base_active = CSRStatus(image_base.size,
+            description="Image slot byte offset currently used by the emulator")
+        self.csn_sys = csn_sys = Signal(reset=1)
+        self.specials.csn_sync = MultiReg(sigs.csn, csn_sys, cd_sys.name, reset=1)
+        self.base_word = base_word = Signal(dram_port.address_width)
+        self.comb += base_word.eq(image_base_active.status[word_shift:])
+
+        self.submodules.flash_mem = flash_mem = FlashEmuDRAMLite(dram_port, prefetch_bits, paddr_fw, paddr_valid_sys, base_word)
+
+        # opcode/address of the last transaction, kept across the CS# reset of the spi domain for the triggers
+        self.txn_cmd = txn_cmd = Signal(8, reset_less=True)
+        self.txn_addr = txn_addr = Signal(24, reset_less=True)
+        self.txn_has_addr = txn_has_addr = Signal(reset_less=True)
+
+        if num_triggers:
+            self.submodules.trigger = trigger = FlashEmuTrigger(csn_sys, txn_cmd, txn_addr, txn_has_addr,
+                                                                image_base.size, num_triggers)
+            self.comb += [
+                image_base.we.eq(trigger.base_we),
+                image_base.dat_w.eq(trigger.base_dat),
+            ]
+            self.sync += \
+                If(trigger.base_we,
+                    image_base_active.status.eq(trigger.base_dat),
+                ).Elif(csn_sys & flash_mem.idle_flag,
+                    image_base_active.status.eq(image_base.storage),
+                )
+        else:
+            self.sync += \
+                If(csn_sys & flash_mem.idle_flag,
+                    image_base_active.status.eq(image_base.storage),
+                )
+
         self.pfr_idx = pfr_idx = Signal(max=prefetch_bits)
         self.pfr_sel = pfr_sel = Signal(dram_port.data_width)
-        self.nbytes_per_mt = dram_port.data_width//8
         self.byte_idx = byte_idx = Signal(max=self.nbytes_per_mt)
         self.byte_arr = byte_arr = Array([pfr_sel[i*8:(i+1)*8] for i in range(self.nbytes_per_mt)])
         self.byte_sel = byte_sel = Signal(8)
@@ -346,6 +434,16 @@ class FlashEmuLite(Module):
         cmd_fsm = ClockDomainsRenamer('spi')(cmd_fsm)
         self.submodules.cmd_fsm = cmd_fsm
 
+        def goto_data(src):
+            return If((src == SRC_MEM) | (src == SRC_SFDP),
+                NextState('read_get_data'),
+            ).Elif(src == SRC_IDCODE,
+                NextState('rdid'),
+            ).Else(
+                NextState('bad_cmd_err'),
+            )
+
+        dec = decoder.entry
         self.get_cmd_flag = get_cmd_flag = Signal()
         cmd_fsm.act('get_cmd',
             cmd_next.eq(Cat(sigs.si, cmd[:-1])),
@@ -354,12 +452,21 @@ class FlashEmuLite(Module):
             NextValue(cmd_bit_cnt, cmd_bit_cnt + 1),
 
             If(cmd_bit_cnt == 7,
-                If(cmd_next == CMD_READ,
+                NextValue(dec_ent.raw_bits(), dec.raw_bits()),
+                NextValue(addr_last, Cat(C(0, 3), dec.addr_bytes) - 1),
+                NextValue(txn_cmd, cmd_next),
+                NextValue(txn_has_addr, 0),
+                # single lane only, a QREAD/DREAD entry must not be served on SO
+                If((dec.action == ACT_ERR) | (dec.lanes != LANES_SINGLE),
+                    NextState('bad_cmd_err'),
+                ).Elif(dec.action == ACT_IGNORE,
+                    NextState('ignore'),
+                ).Elif(dec.addr_bytes != 0,
                     NextState('read_get_addr'),
-                ).Elif(cmd_next == CMD_RDID,
-                    NextState('rdid'),
+                ).Elif(dec.dummy != 0,
+                    NextState('dummy'),
                 ).Else(
-                    NextState('bad_cmd_err'),
+                    goto_data(dec.src),
                 )
             ),
         )
@@ -373,21 +480,38 @@ class FlashEmuLite(Module):
             addr_next.eq(Cat(sigs.si, addr[:-1])),
             NextValue(addr, addr_next),
             NextValue(addr_cnt, addr_cnt + 1),
-            If(addr_cnt == 23 - prefetch_bits,
+            If(addr_cnt == addr_last - prefetch_bits,
                 NextValue(paddr, addr_next),
             ),
-            If(addr_cnt == 23 - (prefetch_bits - 1),
-                paddr_valid.eq(1),
+            If(addr_cnt == addr_last - (prefetch_bits - 1),
+                paddr_valid.eq(dec_ent.src == SRC_MEM),
             ),
-            If(addr_cnt == 23,
-               NextState('read_get_data'),
+            If(addr_cnt == addr_last,
+                NextValue(txn_addr, addr_next),
+                NextValue(txn_has_addr, 1),
+                If(dec_ent.dummy != 0,
+                    NextState('dummy'),
+                ).Else(
+                    goto_data(dec_ent.src),
+                )
             ),
         )
 
+        cmd_fsm.act('dummy',
+            NextValue(dummy_cnt, dummy_cnt + 1),
+            If(dummy_cnt == dec_ent.dummy - 1,
+                goto_data(dec_ent.src),
+            )
+        )
+
         self.dr_tmp = dr_tmp = Signal(8)
         cmd_fsm.act('read_get_data',
             If(dr_bit_cnt == 0,
-                dr_tmp.eq(byte_sel)
+                If(dec_ent.src == SRC_SFDP,
+                    dr_tmp.eq(sfdp.dat_r),
+                ).Else(
+                    dr_tmp.eq(byte_sel),
+                )
             ).Else(
                 dr_tmp.eq(dr)
             ),
@@ -400,14 +524,26 @@ class FlashEmuLite(Module):
             eso.eq(dr_tmp[-1]),
         )
 
+        # data phase reached while the prefetch is still in flight, the bytes shifted out may be stale
+        self.underrun = underrun = Signal()
+        self.comb += underrun.eq(cmd_fsm.ongoing('read_get_data') & (dec_ent.src == SRC_MEM) & ~flash_mem.idle_flag)
+
         self.bad_cmd_err = bad_cmd_err = Signal()
         cmd_fsm.act('bad_cmd_err',
             bad_cmd_err.eq(1),
         )
 
+        cmd_fsm.act('ignore')
+
         self.cnt = cnt = Signal(16)
         self.sync.spi += cnt.eq(cnt + 1)
 
     @staticmethod
     def val4addr(addr: int) -> int:
         return (addr & 0xff) ^ ((addr >> 8) & 0xff) ^ ((addr >> 16) & 0xff) ^ ((addr >> 24) & 0xff)
+
+    def get_csrs(self):
+        csrs = self.decoder.get_csrs() + self.sfdp.get_csrs() + [self.image_base, self.image_base_active]
+        if hasattr(self, 'trigger'):
+            csrs += self.trigger.get_csrs()
+        return csrs
@@ -0,0 +1,347 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Throughput/latency benchmarks for the emulators and the flash model on the migen simulator, with JSON
+# results and a comparison against a saved baseline. Ratios are sys clocks per SCLK, latencies are in sys
+# clocks. The emulator gateware needs the forked migen, so it is only imported by the benches using it.
+
+from __future__ import annotations
+
+import datetime
+import json
+import platform
+import time
+from pathlib import Path
+from typing import Callable, Final, Generator, Optional, Sequence
+
+import attr
+
+from migen import *
+
+BENCH_VERSION: Final = 2 # 2: metrics a bench kind can't measure are null
+BENCH_ADDR: Final = 0x1200 # prefetch window aligned for every prefetch_bits benched
+BENCH_IMAGE_SZ: Final = 0x10000
+
+# metric -> (better direction, default relative tolerance); wall clock numbers are noisy, the rest are exact
+METRICS: Final = {
+    'min_sys_per_sclk': ('lower', 0.0),
+    'first_word_sys': ('lower', 0.0),
+    'first_word_slack_sys': ('higher', 0.0),
+    'burst_bytes': ('higher', 0.0),
+    'bytes_per_sclk': ('higher', 0.0),
+    'bytes_per_ksys': ('higher', 0.0),
+    'wall_s': ('lower', 0.25),
+    'sys_cycles_per_s': ('higher', 0.25),
+}
+
+
+def bench_image(sz: int = BENCH_IMAGE_SZ) -> bytes:
+    return bytes((a & 0xff) ^ ((a >> 8) & 0xff) ^ 0x5a for a in range(sz))
+
+
+class _SimTristate:
+    # benches drive TSTriple.i and sample TSTriple.o directly, same as emu_tb.SimTristate
+    @staticmethod
+    def lower(dr):
+        return Module()
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class BenchConfig:
+    name: str
+    kind: str # 'emu', 'lite' or 'macronix'
+    prefetch_bits: int = 6
+    dram_latency: int = 11
+
+    @property
+    def max_burst(self) -> Optional[int]:
+        # FlashEmuLite only serves a READ from its prefetch window, it doesn't refill mid transaction
+        return 2**self.prefetch_bits if self.kind == 'lite' else None
+
+    @property
+    def sys_bound(self) -> bool:
+        # FlashEmu serves reads from BRAM without touching sys, no ratio ever fails so none is reported
+        return self.kind != 'emu'
+
+
+def default_configs() -> list[BenchConfig]:
+    return [
+        BenchConfig('flashemu', 'emu'),
+        *(BenchConfig(f'flashemulite_pf{pf}', 'lite', prefetch_bits=pf) for pf in (5, 6, 7)),
+        BenchConfig('macronix_lite', 'macronix'),
+    ]
+
+
+@attr.s(auto_attribs=True)
+class ReadRun:
+    data: bytes = b''
+    sclks: int = 0
+    sys_cycles: int = 0
+    csn_fall: Optional[int] = None
+    first_word: Optional[int] = None
+    first_sample: Optional[int] = None
+
+
+@passive
+def _sys_monitor(run: ReadRun, csn: Signal, rdata_valid: Optional[Signal]) -> Generator:
+    # sys domain timestamps, the spi domain master reads run.sys_cycles to stamp its own events
+    while True:
+        if run.csn_fall is None and not (yield csn):
+            run.csn_fall = run.sys_cycles
+        if rdata_valid is not None and run.first_word is None and run.csn_fall is not None and (yield rdata_valid):
+            run.first_word = run.sys_cycles
+        yield
+        run.sys_cycles += 1
+
+
+def _spi_read_timed(run: ReadRun, sigs, addr: int, nbytes: int) -> Generator:
+    # spi domain single lane READ, one yield per SCLK like emu_tb.spi_xfer
+    tx = bytes([0x03]) + addr.to_bytes(3, 'big')
+    yield sigs.csn.eq(0)
+    bits = []
+    for i, bit in enumerate(b for byte in tx + bytes(nbytes) for b in ((byte >> (7 - n)) & 1 for n in range(8))):
+        yield sigs.si.eq(bit)
+        yield
+        run.sclks += 1
+        if i >= len(tx) * 8:
+            if run.first_sample is None:
+                run.first_sample = run.sys_cycles
+            bits.append((yield sigs.so))
+    yield sigs.csn.eq(1)
+    for _ in range(2):
+        yield
+        run.sclks += 1
+    run.data = bytes(int(''.join(map(str, bits[i:i+8])), 2) for i in range(0, len(bits), 8))
+
+
+def _bitbang_read_timed(run: ReadRun, pins: dict, addr: int, nbytes: int, half: int) -> Generator:
+    # sys domain mode 0 bit-bang for models that oversample SCLK, half is sys clocks per SCLK phase
+    tx = bytes([0x03]) + addr.to_bytes(3, 'big')
+    yield pins['csn'].eq(0)
+    run.csn_fall = run.sys_cycles
+    for _ in range(half):
+        yield
+    bits = []
+    for i, bit in enumerate(b for byte in tx + bytes(nbytes) for b in ((byte >> (7 - n)) & 1 for n in range(8))):
+        yield pins['si'].eq(bit)
+        for _ in range(half):
+            yield
+        yield pins['sclk'].eq(1)
+        for _ in range(half):
+            yield
+        run.sclks += 1
+        if i >= len(tx) * 8:
+            if run.first_sample is None:
+                run.first_sample = run.sys_cycles
+            bits.append((yield pins['so']))
+        yield pins['sclk'].eq(0)
+    for _ in range(half):
+        yield
+    yield pins['csn'].eq(1)
+    for _ in range(4 * half):
+        yield
+    run.sclks += 2
+    run.data = bytes(int(''.join(map(str, bits[i:i+8])), 2) for i in range(0, len(bits), 8))
+
+
+def run_read(cfg: BenchConfig, sys_per_sclk: int, nbytes: int, addr: int = BENCH_ADDR,
+             vcd_name: Optional[str] = None) -> tuple[ReadRun, bytes]:
+    # one timed READ, returns the run and the bytes it should have returned
+    run = ReadRun()
+    image = bench_image()
+    if cfg.kind == 'macronix':
+        from migen.fhdl.specials import Tristate
+        from .macronix_lite import MacronixModelLite
+        if sys_per_sclk % 2:
+            raise ValueError('sys_per_sclk must be even for the bit-bang master')
+        sigs = {n: Signal(name=n, reset=int(n in ('csn', 'rstn'))) for n in ('sclk', 'rstn', 'csn', 'si', 'so', 'wpn', 'sio3')}
+        dut = MacronixModelLite(None, *sigs.values(), sz=len(image), init=image)
+        pins = dict(sclk=sigs['sclk'], csn=sigs['csn'], si=dut.si_ts.i, so=dut.so_ts.o)
+
+        @passive
+        def count():
+            while True:
+                yield
+                run.sys_cycles += 1
+        run_simulation(dut, [_bitbang_read_timed(run, pins, addr, nbytes, sys_per_sclk // 2), count()],
+                       special_overrides={Tristate: _SimTristate}, vcd_name=vcd_name)
+        return run, image[addr:addr + nbytes]
+
+    from litedram.common import LiteDRAMNativeReadPort
+    from .emu import FlashEmu, FlashEmuLite, SPISigs, QSPISigs, IDCODE
+    from .emu_tb import DRAMNativePortModel, emu_run_simulation
+    sys_period = 2
+    spi_period = sys_per_sclk * sys_period
+    if cfg.kind == 'emu':
+        def qsigs():
+            return QSPISigs(sclk=Signal(), rstn=Signal(reset=1), csn=Signal(reset=1),
+                            si=Signal(), so=Signal(), wpn=Signal(), sio3=Signal())
+        qrs, qes = qsigs(), qsigs()
+        dut = FlashEmu(ClockDomain('sys'), qrs, qes, sz_mbit=256, idcode=IDCODE)
+        sigs = SPISigs(sclk=qes.sclk, csn=qes.csn, si=dut.esi_ts.i, so=dut.eso_ts.o)
+        emu_run_simulation(dut, [_spi_read_timed(run, sigs, addr, nbytes)], [_sys_monitor(run, sigs.csn, None)],
+                           sys_period=sys_period, spi_period=spi_period, vcd_name=vcd_name)
+        # FlashEmu serves a 256 byte BRAM, wrapped over the whole address space
+        return run, bytes(FlashEmu.val4addr(a & 0xff) for a in range(addr, addr + nbytes))
+    if cfg.kind == 'lite':
+        port = LiteDRAMNativeReadPort(24, 128)
+        # named so timing_diagram can find the pins in the VCD
+        sigs = SPISigs(sclk=Signal(name='pad_sclk'), csn=Signal(reset=1, name='pad_csn'), si=Signal(name='pad_si'),
+                       so=Signal(name='pad_so'))
+        dut = FlashEmuLite(ClockDomain('sys'), sigs, port, sz_mbit=256, idcode=IDCODE, prefetch_bits=cfg.prefetch_bits)
+        model = DRAMNativePortModel(port, image, latency=cfg.dram_latency)
+        emu_run_simulation(dut, [_spi_read_timed(run, sigs, addr, nbytes)],
+                           [model.handler(), _sys_monitor(run, sigs.csn, port.rdata.valid)],
+                           sys_period=sys_period, spi_period=spi_period, vcd_name=vcd_name)
+        return run, image[addr:addr + nbytes]
+    raise ValueError(f'unknown bench kind {cfg.kind!r}')
+
+
+def min_passing(ok: Callable[[int], bool], lo: int, hi: int, step: int = 1) -> Optional[int]:
+    # smallest passing value in [lo, hi], passing is assumed monotonic (a slower SCLK never breaks a read)
+    if not ok(hi):
+        return None
+    lo_i, hi_i = lo // step, hi // step
+    while lo_i < hi_i:
+        mid = (lo_i + hi_i) // 2
+        if ok(mid * step):
+            hi_i = mid
+        else:
+            lo_i = mid + 1
+    return hi_i * step
+
+
+def bench_config(cfg: BenchConfig, nbytes: int = 128, nominal_sys_per_sclk: int = 10,
+                 max_sys_per_sclk: int = 32) -> dict:
+    t0 = time.monotonic()
+    sys_cycles = 0
+    if cfg.max_burst is not None:
+        nbytes = min(nbytes, cfg.max_burst)
+    step = 2 if cfg.kind == 'macronix' else 1
+
+    def ok(r: int) -> bool:
+        nonlocal sys_cycles
+        run, expected = run_read(cfg, r, nbytes)
+        sys_cycles += run.sys_cycles
+        return run.data == expected
+
+    min_ratio = min_passing(ok, 2, max_sys_per_sclk, step) if cfg.sys_bound else None
+    run, expected = run_read(cfg, nominal_sys_per_sclk, nbytes)
+    sys_cycles += run.sys_cycles
+    if run.data != expected:
+        raise ValueError(f'{cfg.name}: read at {nominal_sys_per_sclk} sys clocks per SCLK returned bad data')
+    first_word = slack = None
+    if run.first_word is not None:
+        first_word = run.first_word - run.csn_fall
+        slack = run.first_sample - run.first_word
+    wall_s = time.monotonic() - t0
+    bytes_per_sclk = nbytes / run.sclks
+    return {
+        'min_sys_per_sclk': min_ratio,
+        'first_word_sys': first_word,
+        'first_word_slack_sys': slack,
+        'burst_bytes': nbytes,
+        'bytes_per_sclk': round(bytes_per_sclk, 6),
+        'bytes_per_ksys': round(1000 * bytes_per_sclk / min_ratio, 3) if min_ratio else None,
+        'wall_s': round(wall_s, 3),
+        'sys_cycles_per_s': round(sys_cycles / wall_s, 1),
+    }
+
+
+def run_benches(configs: Optional[Sequence[BenchConfig]] = None, nbytes: int = 128, **kwargs) -> dict:
+    configs = default_configs() if configs is None else configs
+    return {
+        'version': BENCH_VERSION,
+        'meta': {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'nbytes': nbytes,
+        },
+        'results': {cfg.name: bench_config(cfg, nbytes, **kwargs) for cfg in configs},
+    }
+
+
+# kind -> (lanes, latencies) for bench_timing, the sim ticks the spi domain itself so its clock is SCLK
+TIMING_LANES: Final = {
+    'lite': (
+        [('sys_clk', ['csn=pad_csn', 'cmd_valid', 'cmd_ready', 'rdata_valid']),
+         ('sclk=spi_clk', ['copi=pad_si', 'cipo=pad_so'])],
+        [('read cmd', 'pad_csn:falling', 'cmd_valid'), ('dram', 'cmd_valid', 'rdata_valid'),
+         ('first word', 'pad_csn:falling', 'rdata_valid')],
+    ),
+    'macronix': (
+        [('sys_clk', ['csn', 'data_phase']),
+         ('sclk', ['copi=si_ts_i', 'cipo=so_ts_o'])],
+        [('first data', 'csn:falling', 'data_phase')],
+    ),
+}
+
+
+def bench_timing(cfg: BenchConfig, out_dir: Path, sys_per_sclk: int = 4, nbytes: int = 2,
+                 clk_freq: Optional[float] = None) -> tuple[Path, list]:
+    # one short READ dumped to VCD and drawn as docs/timing-<name>.json with its measured latencies
+    import tempfile
+    from .wavedrom import Lane, Latency, timing_diagram, write_timing
+    from .wavestore import convert
+    if cfg.kind not in TIMING_LANES:
+        raise ValueError(f'no timing diagram for {cfg.kind!r} benches, expected one of {", ".join(TIMING_LANES)}')
+    lane_specs, lat_specs = TIMING_LANES[cfg.kind]
+    lanes = [Lane(clk, sigs) for clk, sigs in lane_specs]
+    with tempfile.TemporaryDirectory() as tmp:
+        vcd = str(Path(tmp) / 'read.vcd')
+        run, expected = run_read(cfg, sys_per_sclk, nbytes, vcd_name=vcd)
+        if run.data != expected:
+            raise ValueError(f'{cfg.name}: read at {sys_per_sclk} sys clocks per SCLK returned bad data')
+        signals = {s.rpartition('=')[2] for lane in lanes for s in [lane.clock] + lane.signals}
+        store = convert(vcd, Path(tmp) / 'store', sorted(signals))
+        src, measured = timing_diagram(store, lanes, 0, store.end_time, [Latency(*l) for l in lat_specs],
+                                       clk_freq=clk_freq, title=f'{cfg.name}, {sys_per_sclk} sys clocks per SCLK')
+    return write_timing(Path(out_dir) / f'timing-{cfg.name}.json', src), measured
+
+
+def save_results(path: Path, results: dict) -> Path:
+    path = Path(path)
+    path.write_text(json.dumps(results, indent=2) + '\n')
+    return path
+
+
+def load_results(path: Path) -> dict:
+    d = json.loads(Path(path).read_text())
+    if d.get('version') != BENCH_VERSION:
+        raise ValueError(f'{path}: bench results version {d.get("version")} != {BENCH_VERSION}')
+    return d
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Regression:
+    config: str
+    metric: str
+    base: Optional[float]
+    new: Optional[float]
+
+    def __str__(self) -> str:
+        return f'{self.config}.{self.metric}: {self.base} -> {self.new}'
+
+
+def compare(base: dict, new: dict, tolerances: Optional[dict[str, float]] = None) -> list[Regression]:
+    # a metric regresses when it moves the wrong way by more than its relative tolerance or goes missing
+    tols = {m: tol for m, (_, tol) in METRICS.items()}
+    tols.update(tolerances or {})
+    regs = []
+    for name, bres in base['results'].items():
+        nres = new['results'].get(name)
+        if nres is None:
+            regs.append(Regression(name, '*', None, None))
+            continue
+        for metric, (better, _) in METRICS.items():
+            b, n = bres.get(metric), nres.get(metric)
+            if b is None:
+                continue
+            if n is None:
+                regs.append(Regression(name, metric, b, n))
+                continue
+            tol = tols[metric] * abs(b)
+            if (better == 'lower' and n > b + tol) or (better == 'higher' and n < b - tol):
+                regs.append(Regression(name, metric, b, n))
+    return regs
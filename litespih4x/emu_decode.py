@@ -0,0 +1,109 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+
+from typing import Final, Mapping
+
+import attr
+
+
+# Decode RAM entry layout, LSB first
+decode_entry_layout: Final = [
+    ("addr_bytes", 3), # 0 = no address phase, otherwise 3 or 4
+    ("dummy",      5), # dummy SCLK cycles between address and data
+    ("lanes",      2), # LANES_*
+    ("src",        3), # SRC_*
+    ("action",     3), # ACT_*
+]
+DECODE_ENTRY_WIDTH: Final = sum(f[1] for f in decode_entry_layout)
+DECODE_DEPTH: Final = 256
+
+# FlashEmu serves LANES_SINGLE and LANES_QUAD, FlashEmuLite only LANES_SINGLE, other lane modes decode as ACT_ERR
+LANES_SINGLE: Final = 0
+LANES_DUAL: Final = 1
+LANES_QUAD: Final = 2
+
+SRC_NONE: Final = 0
+SRC_MEM: Final = 1
+SRC_IDCODE: Final = 2
+SRC_SFDP: Final = 3
+
+ACT_ERR: Final = 0
+ACT_READ: Final = 1
+ACT_IGNORE: Final = 2
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class DecodeEntry:
+    action: int = ACT_ERR
+    src: int = SRC_NONE
+    addr_bytes: int = 0
+    dummy: int = 0
+    lanes: int = LANES_SINGLE
+
+    def pack(self) -> int:
+        v = 0
+        off = 0
+        for name, nbits in decode_entry_layout:
+            fv = getattr(self, name)
+            if fv >= 2**nbits:
+                raise ValueError(f'{name}={fv} does not fit in {nbits} bits')
+            v |= fv << off
+            off += nbits
+        return v
+
+    @classmethod
+    def unpack(cls, v: int) -> DecodeEntry:
+        d = {}
+        for name, nbits in decode_entry_layout:
+            d[name] = v & (2**nbits - 1)
+            v >>= nbits
+        return cls(**d)
+
+
+# opcodes the emulators understand out of the box, matches the old hard-coded If/Elif
+DEFAULT_DECODE_TABLE: Final[Mapping[int, DecodeEntry]] = {
+    0x03: DecodeEntry(action=ACT_READ, src=SRC_MEM, addr_bytes=3), # READ
+    0x9f: DecodeEntry(action=ACT_READ, src=SRC_IDCODE), # RDID
+    0x5a: DecodeEntry(action=ACT_READ, src=SRC_SFDP, addr_bytes=3, dummy=8), # RDSFDP
+}
+
+# FlashEmu never clocked the 8 QREAD dummy cycles, set dummy=8 over CSR to try it
+QSPI_DECODE_TABLE: Final[Mapping[int, DecodeEntry]] = {
+    **DEFAULT_DECODE_TABLE,
+    0x6b: DecodeEntry(action=ACT_READ, src=SRC_MEM, addr_bytes=3, lanes=LANES_QUAD), # QREAD
+}
+
+
+def decode_table_init(table: Mapping[int, DecodeEntry] = DEFAULT_DECODE_TABLE) -> list[int]:
+    return [table.get(op, DecodeEntry()).pack() for op in range(DECODE_DEPTH)]
+
+
+class FlashEmuDecodeTable(Module, AutoCSR):
+    def __init__(self, cmd: Signal, cd_sys: ClockDomain, table: Mapping[int, DecodeEntry] = DEFAULT_DECODE_TABLE):
+        self.mem = self.specials.mem = mem = Memory(DECODE_ENTRY_WIDTH, DECODE_DEPTH, init=decode_table_init(table), name='decode_mem')
+        # async read so the cmd FSM sees the entry in the same SCLK as the last opcode bit
+        self.specials.rdport = rdport = mem.get_port(async_read=True)
+        self.specials.wrport = wrport = mem.get_port(write_capable=True, clock_domain=cd_sys.name)
+
+        self.entry = entry = Record(decode_entry_layout)
+        self.comb += [
+            rdport.adr.eq(cmd),
+            entry.raw_bits().eq(rdport.dat_r),
+        ]
+
+        self.decode_adr = decode_adr = CSRStorage(8, description="Opcode of the decode entry to write")
+        self.decode_dat = decode_dat = CSRStorage(fields=[
+            CSRField(name, size=nbits) for name, nbits in decode_entry_layout
+        ], description="Decode entry, written to the table at ``decode_adr`` on write. Lane modes the emulator "
+                       "can't serve are rejected like ``action`` = error")
+        self.comb += [
+            wrport.adr.eq(decode_adr.storage),
+            wrport.dat_w.eq(decode_dat.storage),
+            wrport.we.eq(decode_dat.re),
+        ]
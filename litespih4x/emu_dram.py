@@ -98,8 +98,12 @@ class FlashEmuDRAM(Module, AutoCSR):
         )
 
 class FlashEmuDRAMLite(Module):
-    def __init__(self, port: LiteDRAMNativeReadPort, prefetch_bits: int, paddr: Signal, paddr_valid: Signal):
+    def __init__(self, port: LiteDRAMNativeReadPort, prefetch_bits: int, paddr: Signal, paddr_valid: Signal,
+                 base: Optional[Signal] = None):
         self.port = p = port
+        if base is None:
+            base = Signal(port.address_width)
+        self.base = base
 
         self.read_addr = read_addr = Signal(port.address_width)
 
@@ -121,7 +125,7 @@ class FlashEmuDRAMLite(Module):
             NextValue(rd_cnt, rd_cnt.reset),
             If(paddr_valid,
                NextValue(paddr_tmp, paddr),
-               NextValue(read_addr, paddr[4:]),
+               NextValue(read_addr, paddr[4:] + base),
                NextState("RD_LAUNCH"),
             ),
         )
@@ -143,10 +147,140 @@ class FlashEmuDRAMLite(Module):
             rd_land_flag.eq(1),
             p.rdata.ready.eq(1),
             If(p.rdata.valid,
-                NextValue(pf_regs[num_prefetch_reads - rd_cnt], p.rdata.data),
+                NextValue(pf_regs[num_prefetch_reads - 1 - rd_cnt], p.rdata.data),
                 NextValue(rd_cnt, rd_cnt - 1),
                 If(rd_cnt == 0,
                     NextState("IDLE"),
                 ),
             ),
-        )
\ No newline at end of file
+        )
+
+
+class FlashEmuDRAMArbiter(Module, AutoCSR):
+    def __init__(self, port: LiteDRAMNativeReadPort, num_clients: int, slack: int = 64):
+        if num_clients < 1:
+            raise ValueError('num_clients must be >= 1')
+        self.port = p = port
+        self.num_clients = n = num_clients
+        self.ports = ports = [LiteDRAMNativeReadPort(port.address_width, port.data_width, clock_domain=port.clock_domain, id=i)
+                              for i in range(n)]
+
+        self.grant = grant = Signal(max=max(n, 2))
+        self.locked = locked = Signal()
+        self.closed = closed = Signal()
+        self.outstanding = outstanding = Signal(16)
+
+        cmd_valids = Array(cp.cmd.valid for cp in ports)
+        cmd_addrs = Array(cp.cmd.addr for cp in ports)
+        rdata_readys = Array(cp.rdata.ready for cp in ports)
+
+        self.comb += [
+            p.cmd.we.eq(0),
+            p.cmd.valid.eq(locked & ~closed & cmd_valids[grant]),
+            p.cmd.addr.eq(cmd_addrs[grant]),
+            p.rdata.ready.eq(rdata_readys[grant]),
+        ]
+        for i, cp in enumerate(ports):
+            self.comb += [
+                cp.cmd.ready.eq(locked & ~closed & (grant == i) & p.cmd.ready),
+                cp.rdata.valid.eq((grant == i) & p.rdata.valid),
+                cp.rdata.data.eq(p.rdata.data),
+            ]
+
+        # earliest deadline first: every waiting client burns down its slack, least slack left wins
+        self.remaining = remaining = [Signal(16, name=f'remaining{i}') for i in range(n)]
+        waiting = [Signal(name=f'waiting{i}') for i in range(n)]
+        for i, cp in enumerate(ports):
+            slack_csr = CSRStorage(16, reset=slack, name=f'slack{i}',
+                                   description=f"Sys clocks client {i} can wait for the port before it underruns")
+            setattr(self, f'slack{i}', slack_csr)
+            self.comb += waiting[i].eq(cp.cmd.valid & ~(locked & ~closed & (grant == i)))
+            self.sync += \
+                If(~waiting[i],
+                    remaining[i].eq(slack_csr.storage),
+                ).Elif(remaining[i] != 0,
+                    remaining[i].eq(remaining[i] - 1),
+                )
+
+        self.winner = winner = Signal.like(grant)
+        self.winner_valid = winner_valid = Signal()
+        best, best_valid, best_rem = C(0, grant.nbits), C(0, 1), C(0, 16)
+        for i in range(n):
+            nbest, nbest_valid, nbest_rem = Signal.like(grant), Signal(), Signal(16)
+            take = waiting[i] & (~best_valid | (remaining[i] < best_rem))
+            self.comb += [
+                nbest.eq(Mux(take, i, best)),
+                nbest_valid.eq(best_valid | waiting[i]),
+                nbest_rem.eq(Mux(take, remaining[i], best_rem)),
+            ]
+            best, best_valid, best_rem = nbest, nbest_valid, nbest_rem
+        self.comb += [
+            winner.eq(best),
+            winner_valid.eq(best_valid),
+        ]
+
+        # hold the grant for a whole prefetch burst: once the grantee drops cmd.valid no new
+        # reads are let through and the port is released when every launched read has landed
+        cmd_fire = Signal()
+        rdata_fire = Signal()
+        self.comb += [
+            cmd_fire.eq(p.cmd.valid & p.cmd.ready),
+            rdata_fire.eq(p.rdata.valid & p.rdata.ready),
+        ]
+        self.sync += [
+            outstanding.eq(outstanding + cmd_fire - rdata_fire),
+            If(~locked,
+                If(winner_valid,
+                    grant.eq(winner),
+                    locked.eq(1),
+                    closed.eq(0),
+                ),
+            ).Else(
+                If(~cmd_valids[grant],
+                    closed.eq(1),
+                ),
+                If((closed | ~cmd_valids[grant]) & (outstanding == 0),
+                    locked.eq(0),
+                ),
+            ),
+        ]
+
+        # per client bandwidth (words delivered) and request-to-first-word latency in sys clocks
+        for i, cp in enumerate(ports):
+            words = CSRStatus(32, name=f'words{i}', description=f"Words delivered to client {i}")
+            lat_last = CSRStatus(16, name=f'lat_last{i}', description=f"Request to first word latency of client {i}'s last burst")
+            lat_max = CSRStatus(16, name=f'lat_max{i}', description=f"Worst request to first word latency of client {i}")
+            setattr(self, f'words{i}', words)
+            setattr(self, f'lat_last{i}', lat_last)
+            setattr(self, f'lat_max{i}', lat_max)
+
+            pending = Signal(name=f'pending{i}')
+            busy = Signal(name=f'busy{i}')
+            lat_cnt = Signal(16, name=f'lat_cnt{i}')
+            first_word = Signal(name=f'first_word{i}')
+            self.comb += first_word.eq(pending & cp.rdata.valid & cp.rdata.ready)
+            self.sync += [
+                If(cp.rdata.valid & cp.rdata.ready,
+                    words.status.eq(words.status + 1),
+                ),
+                If(first_word,
+                    pending.eq(0),
+                    lat_last.status.eq(lat_cnt),
+                    If(lat_cnt > lat_max.status,
+                        lat_max.status.eq(lat_cnt),
+                    ),
+                ).Elif(pending,
+                    If(lat_cnt != 2**lat_cnt.nbits - 1,
+                        lat_cnt.eq(lat_cnt + 1),
+                    ),
+                ).Elif(cp.cmd.valid & ~busy,
+                    pending.eq(1),
+                    lat_cnt.eq(1),
+                ),
+                If(cp.cmd.valid,
+                    busy.eq(1),
+                ).Elif(~pending & ~(locked & (grant == i) & (outstanding != 0)),
+                    busy.eq(0),
+                ),
+            ]
+
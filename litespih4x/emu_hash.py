@@ -0,0 +1,200 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# DRAM image hashing. CRC32Words folds a whole native port word into a zlib compatible CRC32 every clock, the
+# bytes of a word in address order like the wishbone view of main_ram, so the host checks against
+# zlib.crc32 of the same bytes. DRAMPageHasher streams a run of equal sized pages through it at full port
+# rate and leaves one CRC per page in a table the host reads back as a CSR memory. DRAMRangeCRC32 hashes one
+# arbitrary word aligned range the same way and reports a single digest, so checking a loaded image costs a
+# few CSR accesses instead of reading it back over Etherbone.
+
+from __future__ import annotations
+
+import functools
+import operator
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+
+from litedram.common import LiteDRAMNativePort
+
+from typing import Final
+
+CRC32_POLY_REFLECTED: Final = 0xedb88320
+CRC32_INIT: Final = 0xffffffff
+CSR_MEM_MAX_WORDS: Final = 0x800 // 4 # larger CSR memories need a page register
+
+
+@functools.lru_cache(maxsize=None)
+def crc32_taps(data_width: int) -> tuple[tuple[int, int], ...]:
+    # per next-state bit, the (state, data) bit masks XORed into it; zlib's bitwise reflected CRC run
+    # symbolically, data bit 0 first
+    state = [1 << i for i in range(32)]
+    for i in range(data_width):
+        fb = state[0] ^ (1 << (32 + i))
+        state = [(state[j + 1] if j < 31 else 0) ^ (fb if (CRC32_POLY_REFLECTED >> j) & 1 else 0) for j in range(32)]
+    return tuple((s & CRC32_INIT, s >> 32) for s in state)
+
+
+def _xor_bits(sig: Signal, mask: int) -> list:
+    return [sig[i] for i in range(mask.bit_length()) if (mask >> i) & 1]
+
+
+class CRC32Words(Module):
+    def __init__(self, data_width: int):
+        self.data = data = Signal(data_width)
+        self.ce = ce = Signal()
+        self.restart = restart = Signal() # fold data into a fresh CRC instead of the running one
+        self.crc = crc = Signal(32, reset=CRC32_INIT)
+        self.digest = digest = Signal(32)
+
+        cur = Signal(32)
+        nxt = Signal(32)
+        self.comb += [
+            cur.eq(Mux(restart, CRC32_INIT, crc)),
+            digest.eq(~crc),
+        ]
+        for i, (smask, dmask) in enumerate(crc32_taps(data_width)):
+            terms = _xor_bits(cur, smask) + _xor_bits(data, dmask)
+            self.comb += nxt[i].eq(functools.reduce(operator.xor, terms) if terms else 0)
+        self.sync += If(ce,
+            crc.eq(nxt),
+        )
+
+
+class DRAMPageHasher(Module, AutoCSR):
+    def __init__(self, port: LiteDRAMNativePort, max_pages: int = CSR_MEM_MAX_WORDS):
+        if not 1 <= max_pages <= CSR_MEM_MAX_WORDS:
+            raise ValueError(f'max_pages must be in 1..{CSR_MEM_MAX_WORDS}, the table is an unpaged CSR memory')
+        self.port = p = port
+        word_bytes = port.data_width // 8
+        self.word_shift = word_shift = log2_int(word_bytes)
+        addr_bits = port.address_width + word_shift
+
+        self.base = CSRStorage(addr_bits, description="Byte offset in DRAM of the first page, word aligned")
+        self.page_shift = CSRStorage(bits_for(addr_bits), reset=12,
+            description=f"log2 of the page size in bytes, at least {word_shift}")
+        self.npages = CSRStorage(bits_for(max_pages), description=f"Pages to hash, at most {max_pages}")
+        self.start = CSRStorage(1, description="Write to hash, the table is valid once busy drops")
+        self.status = CSRStatus(fields=[
+            CSRField("busy", size=1),
+        ])
+        self.pages_done = CSRStatus(bits_for(max_pages))
+        self.table = table = Memory(32, max_pages, name='table')
+        table.bus_read_only = True
+        self.wr_port = wr_port = table.get_port(write_capable=True)
+        self.specials += table, wr_port
+
+        self.submodules.crc = crc = CRC32Words(port.data_width)
+
+        words_left = Signal(port.address_width + 1) # commands still to issue
+        page_words = Signal(port.address_width + 1)
+        word_in_page = Signal(port.address_width + 1)
+        page = Signal(bits_for(max_pages))
+        read_addr = Signal(port.address_width)
+        page_end = Signal()
+        busy = self.status.fields.busy
+
+        self.comb += [
+            page_words.eq(1 << (self.page_shift.storage - word_shift)),
+            p.cmd.we.eq(0),
+            p.cmd.addr.eq(read_addr),
+            p.cmd.valid.eq(busy & (words_left != 0)),
+            p.rdata.ready.eq(1),
+            crc.data.eq(p.rdata.data),
+            crc.ce.eq(busy & p.rdata.valid),
+            wr_port.adr.eq(page),
+            wr_port.dat_w.eq(crc.digest),
+            wr_port.we.eq(page_end),
+            self.pages_done.status.eq(page),
+        ]
+        self.sync += [
+            page_end.eq(0),
+            If(self.start.re,
+                busy.eq(self.npages.storage != 0),
+                read_addr.eq(self.base.storage[word_shift:]),
+                words_left.eq(self.npages.storage << (self.page_shift.storage - word_shift)),
+                word_in_page.eq(0),
+                page.eq(0),
+                crc.restart.eq(1),
+            ).Elif(busy,
+                If(p.cmd.valid & p.cmd.ready,
+                    read_addr.eq(read_addr + 1),
+                    words_left.eq(words_left - 1),
+                ),
+                If(p.rdata.valid,
+                    crc.restart.eq(0),
+                    word_in_page.eq(word_in_page + 1),
+                    If(word_in_page == page_words - 1,
+                        word_in_page.eq(0),
+                        crc.restart.eq(1),
+                        page_end.eq(1),
+                    ),
+                ),
+                # the last page's CRC lands in the table on the cycle busy drops
+                If(page_end,
+                    page.eq(page + 1),
+                    If(page + 1 == self.npages.storage,
+                        busy.eq(0),
+                    ),
+                ),
+            ),
+        ]
+
+
+class DRAMRangeCRC32(Module, AutoCSR):
+    def __init__(self, port: LiteDRAMNativePort):
+        self.port = p = port
+        word_bytes = port.data_width // 8
+        self.word_shift = word_shift = log2_int(word_bytes)
+        addr_bits = port.address_width + word_shift
+
+        self.base = CSRStorage(addr_bits, description="Byte offset in DRAM of the range, word aligned")
+        self.length = CSRStorage(addr_bits + 1, description="Range length in bytes, whole words")
+        self.start = CSRStorage(1, description="Write to hash, digest is valid once busy drops")
+        self.status = CSRStatus(fields=[
+            CSRField("busy", size=1),
+        ])
+        self.digest = CSRStatus(32, description="zlib compatible CRC32 of the range")
+        self.cycles = CSRStatus(32, description="sys clocks the last run took")
+
+        self.submodules.crc = crc = CRC32Words(port.data_width)
+
+        words_left = Signal(port.address_width + 1) # commands still to issue
+        words_pending = Signal(port.address_width + 1) # words still to land
+        read_addr = Signal(port.address_width)
+        busy = self.status.fields.busy
+
+        self.comb += [
+            p.cmd.we.eq(0),
+            p.cmd.addr.eq(read_addr),
+            p.cmd.valid.eq(busy & (words_left != 0)),
+            p.rdata.ready.eq(1),
+            crc.data.eq(p.rdata.data),
+            crc.ce.eq(busy & p.rdata.valid),
+            self.digest.status.eq(crc.digest),
+        ]
+        self.sync += [
+            If(self.start.re,
+                busy.eq(self.length.storage[word_shift:] != 0),
+                read_addr.eq(self.base.storage[word_shift:]),
+                words_left.eq(self.length.storage[word_shift:]),
+                words_pending.eq(self.length.storage[word_shift:]),
+                crc.restart.eq(1),
+                self.cycles.status.eq(0),
+            ).Elif(busy,
+                self.cycles.status.eq(self.cycles.status + 1),
+                If(p.cmd.valid & p.cmd.ready,
+                    read_addr.eq(read_addr + 1),
+                    words_left.eq(words_left - 1),
+                ),
+                If(p.rdata.valid,
+                    crc.restart.eq(0),
+                    words_pending.eq(words_pending - 1),
+                    If(words_pending == 1,
+                        busy.eq(0),
+                    ),
+                ),
+            ),
+        ]
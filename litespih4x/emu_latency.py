@@ -0,0 +1,211 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Analytic FlashEmuLite read timing. The prefetch request leaves as soon as the address bits above the
+# prefetch window are in, it has to land before the data phase starts. All times are sys clocks after CS#
+# falls with SCLK edge k (1 based) at k * sys_per_sclk - 1, which is how the migen benches line up; sync_sys
+# is exact there, on hardware the CDC phase is unknown and guard_sys covers it.
+#
+#   request     = addr_sclks(bits above the window) * r + sync_sys        first DRAM command
+#   first_word  = request + dram_latency + 1                              first prefetch word registered
+#   ready       = first_word + words per window                           whole window registered, FSM idle
+#   data phase  = (cmd + addr + dummy SCLKs) * r - 1                      underrun if not ready by then
+#   first bit   = data phase + r / 2                                      first byte shifted out on the fall
+#
+# FlashEmuLite itself only speaks single lane SDR, the lane/DTR modes project what the same prefetch
+# scheme would need. The window isn't refilled, bursts end at the window boundary.
+
+from __future__ import annotations
+
+import math
+from typing import Final, Optional, Sequence
+
+import attr
+
+SYNC_SYS: Final = 3 # paddr_valid MultiReg plus the prefetch FSM leaving IDLE
+CTRL_PIPELINE_SYS: Final = 3 # native port to DFI read: crossbar, bank machine, multiplexer
+GUARD_SYS: Final = 1 # unknown SCLK to sys phase on hardware
+CMD_BITS: Final = 8
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ReadMode:
+    name: str
+    addr_lanes: int = 1
+    data_lanes: int = 1
+    dummy_cycles: int = 0
+    dtr: bool = False # address and data on both SCLK edges, the opcode stays SDR
+    addr_bytes: int = 3
+
+    def addr_sclks(self, bits: int) -> int:
+        return math.ceil(bits / (self.addr_lanes * (2 if self.dtr else 1)))
+
+    def data_bits_per_sclk(self) -> int:
+        return self.data_lanes * (2 if self.dtr else 1)
+
+
+# Macronix MX25U25635F opcodes, default dummy cycles
+READ_MODES: Final = {
+    'read': ReadMode('READ'),
+    'fastread': ReadMode('FASTREAD', dummy_cycles=8),
+    'dread': ReadMode('DREAD', data_lanes=2, dummy_cycles=8),
+    'qread': ReadMode('QREAD', data_lanes=4, dummy_cycles=8),
+    '4read': ReadMode('4READ', addr_lanes=4, data_lanes=4, dummy_cycles=6),
+    '4dtrd': ReadMode('4DTRD', addr_lanes=4, data_lanes=4, dummy_cycles=8, dtr=True),
+}
+
+
+def dram_read_latency(module: str = 'MT41K128M16', sys_clk_freq: float = 100e6, phy_ratio: str = '1:4',
+                      databits: int = 16, row_miss: bool = True, refresh: bool = False) -> int:
+    # worst case native port command to first rdata in sys clocks; a row hit is the 11 of
+    # docs/timing-11-cycles-read-latency.json, a miss precharges and activates first
+    from litedram import modules
+    from litedram.phy.model import get_sdram_phy_settings
+    try:
+        mod = getattr(modules, module)(sys_clk_freq, phy_ratio)
+    except AttributeError:
+        raise ValueError(f'unknown SDRAM module {module!r}') from None
+    phy = get_sdram_phy_settings(mod.memtype, databits, sys_clk_freq)
+    t = mod.timing_settings
+    lat = CTRL_PIPELINE_SYS + phy.read_latency
+    if row_miss:
+        lat += t.tRP + t.tRCD
+    if refresh:
+        lat += t.tRFC
+    return lat
+
+
+@attr.s(auto_attribs=True)
+class LatencyParams:
+    sys_clk_freq: float
+    sclk_freq: float
+    prefetch_bits: int = 6
+    port_data_width: int = 128
+    dram_latency: int = 11 # see dram_read_latency()
+    mode: ReadMode = READ_MODES['read']
+    sync_sys: int = SYNC_SYS
+    guard_sys: int = GUARD_SYS
+
+    @property
+    def sys_per_sclk(self) -> float:
+        return self.sys_clk_freq / self.sclk_freq
+
+    def check(self):
+        port_bytes = self.port_data_width // 8
+        if self.port_data_width % 8 or port_bytes & (port_bytes - 1):
+            raise ValueError('port_data_width must be a power of two number of bytes')
+        # FlashEmuDRAMLite needs at least two port words per window
+        if 2**self.prefetch_bits < 2 * port_bytes:
+            raise ValueError(f'prefetch_bits must be >= {min_prefetch_bits(self.port_data_width)} for a {self.port_data_width} bit port')
+        if self.prefetch_bits >= 8 * self.mode.addr_bytes:
+            raise ValueError('prefetch window larger than the address space')
+
+
+def min_prefetch_bits(port_data_width: int) -> int:
+    return int(math.log2(port_data_width // 8)) + 1
+
+
+@attr.s(auto_attribs=True)
+class LatencyReport:
+    sys_per_sclk: float
+    request_sys: float
+    first_word_sys: float
+    ready_sys: float
+    data_phase_sys: float
+    first_sample_sys: float
+    first_word_slack_sys: float # first sample minus first word, emu_bench's metric
+    slack_sys: float # guaranteed: data phase minus ready minus guard, negative means underrun
+    max_sclk_freq: float
+    max_burst_bytes: int
+
+    @property
+    def ok(self) -> bool:
+        return self.slack_sys >= 0
+
+
+def _sclks(p: LatencyParams) -> tuple[int, int]:
+    # SCLKs until the request can leave and until the data phase
+    addr_bits = 8 * p.mode.addr_bytes
+    before = CMD_BITS + p.mode.addr_sclks(addr_bits - p.prefetch_bits)
+    total = CMD_BITS + p.mode.addr_sclks(addr_bits) + p.mode.dummy_cycles
+    return before, total
+
+
+def _fixed_sys(p: LatencyParams) -> int:
+    # ready minus request-edge time, independent of the SCLK ratio
+    words = 2**p.prefetch_bits * 8 // p.port_data_width
+    return p.sync_sys + p.dram_latency + 1 + words
+
+
+def solve(p: LatencyParams) -> LatencyReport:
+    p.check()
+    r = p.sys_per_sclk
+    before, total = _sclks(p)
+    request = before * r + p.sync_sys
+    first_word = request + p.dram_latency + 1
+    ready = before * r + _fixed_sys(p)
+    data_phase = total * r - 1
+    first_sample = (total + 1) * r - 1
+    # slack(r) = (total - before) * r - 1 - fixed - guard >= 0
+    min_r = (1 + _fixed_sys(p) + p.guard_sys) / (total - before)
+    return LatencyReport(
+        sys_per_sclk=r,
+        request_sys=request,
+        first_word_sys=first_word,
+        ready_sys=ready,
+        data_phase_sys=data_phase,
+        first_sample_sys=first_sample,
+        first_word_slack_sys=first_sample - first_word,
+        slack_sys=data_phase - ready - p.guard_sys,
+        max_sclk_freq=p.sys_clk_freq / min_r,
+        max_burst_bytes=2**p.prefetch_bits,
+    )
+
+
+def smallest_prefetch_bits(p: LatencyParams, max_bits: int = 12) -> Optional[int]:
+    # smallest window with non-negative slack, more bits request earlier but land more words
+    for bits in range(min_prefetch_bits(p.port_data_width), max_bits + 1):
+        if solve(attr.evolve(p, prefetch_bits=bits)).ok:
+            return bits
+    return None
+
+
+@attr.s(auto_attribs=True)
+class CheckResult:
+    name: str
+    sys_per_sclk: int
+    metric: str
+    analytic: float
+    measured: float
+
+    @property
+    def ok(self) -> bool:
+        return self.analytic == self.measured
+
+    def __str__(self) -> str:
+        return f'{self.name} @{self.sys_per_sclk}: {self.metric} analytic {self.analytic} measured {self.measured}'
+
+
+def self_check(configs: Optional[Sequence] = None, ratios: Sequence[int] = (4, 10), nbytes: int = 4) -> list[CheckResult]:
+    # runs the emu_bench READ for the FlashEmuLite configs, guard_sys=0 as the sim has no CDC uncertainty
+    from .emu_bench import run_read, default_configs
+    configs = [c for c in (configs or default_configs()) if c.kind == 'lite']
+    results = []
+    for cfg in configs:
+        for r in ratios:
+            run, expected = run_read(cfg, r, nbytes)
+            rep = solve(LatencyParams(sys_clk_freq=r, sclk_freq=1, prefetch_bits=cfg.prefetch_bits,
+                                      dram_latency=cfg.dram_latency, guard_sys=0))
+            measured = {
+                'first_word_sys': run.first_word - run.csn_fall,
+                'first_sample_sys': run.first_sample - run.csn_fall,
+                'data_ok': int(run.data == expected),
+            }
+            analytic = {
+                'first_word_sys': rep.first_word_sys,
+                'first_sample_sys': rep.first_sample_sys,
+                # the first byte is picked on the falling edge after the data phase starts
+                'data_ok': int(rep.first_word_sys <= rep.data_phase_sys + r / 2),
+            }
+            results += [CheckResult(cfg.name, r, m, analytic[m], measured[m]) for m in measured]
+    return results
@@ -0,0 +1,49 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+
+from typing import Final, Optional
+
+from .data import macronix as data_mod
+from importlib_resources import files
+_SFDP_HEX_NAME: Final = 'MX25U25635F_sfdp.hex'
+_SFDP_HEX_PATH: Final = files(data_mod).joinpath(_SFDP_HEX_NAME)
+
+SFDP_DEPTH: Final = 128
+
+
+def load_sfdp_hex(path=_SFDP_HEX_PATH) -> list[int]:
+    return [int(l, 16) for l in path.read_text().split()]
+
+
+class FlashEmuSFDP(Module, AutoCSR):
+    def __init__(self, addr: Signal, cd_sys: ClockDomain, init: Optional[list[int]] = None):
+        if init is None:
+            init = load_sfdp_hex()
+        if len(init) > SFDP_DEPTH:
+            raise ValueError(f'SFDP table is {len(init)} bytes, max is {SFDP_DEPTH}')
+
+        self.mem = self.specials.mem = mem = Memory(8, SFDP_DEPTH, init=init, name='sfdp_mem')
+        # async read so the data path can pick the byte in the same SCLK as the flash array byte
+        self.specials.rdport = rdport = mem.get_port(async_read=True)
+        self.specials.wrport = wrport = mem.get_port(write_capable=True, clock_domain=cd_sys.name)
+
+        # SFDP addresses wrap inside the table like on the real part
+        self.dat_r = dat_r = Signal(8)
+        self.comb += [
+            rdport.adr.eq(addr[:log2_int(SFDP_DEPTH)]),
+            dat_r.eq(rdport.dat_r),
+        ]
+
+        self.sfdp_adr = sfdp_adr = CSRStorage(log2_int(SFDP_DEPTH), description="SFDP byte address to write")
+        self.sfdp_dat = sfdp_dat = CSRStorage(8, description="SFDP byte, written to the table at ``sfdp_adr`` on write")
+        self.comb += [
+            wrport.adr.eq(sfdp_adr.storage),
+            wrport.dat_w.eq(sfdp_dat.storage),
+            wrport.we.eq(sfdp_dat.re),
+        ]
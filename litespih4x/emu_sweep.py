@@ -0,0 +1,166 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Parameter sweep over dram-tests/dram_verilator.py builds running the gateware READ workload. Every point
+# builds in its own output dir so the Verilator model cache (sim_cache) is per variant, and a point's counters
+# are kept next to it, keyed on the command and the sim_cache digest of the generated sources, so rerunning a
+# sweep only runs new points or ones whose gateware changed. The points that never underran
+# are ranked on a Pareto front of SCLK, mean first word latency, prefetch window and sys clock.
+
+from __future__ import annotations
+
+import itertools
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Final, Optional, Sequence
+
+import attr
+
+from .emu_workload import parse_workload
+from .sim_cache import parse_digest
+
+RESULT_FILE: Final = 'sweep.json'
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class SweepPoint:
+    prefetch_bits: int
+    sys_clk_freq: float
+    spi_div: int
+
+    @property
+    def sclk_freq(self) -> float:
+        return self.sys_clk_freq / self.spi_div
+
+    @property
+    def tag(self) -> str:
+        return f'pf{self.prefetch_bits}_sys{self.sys_clk_freq / 1e6:g}mhz_div{self.spi_div}'
+
+
+def sweep_points(prefetch_bits: Sequence[int], sys_clk_freqs: Sequence[float], spi_divs: Sequence[int]) -> list[SweepPoint]:
+    for d in spi_divs:
+        if d < 2 or d % 2:
+            raise ValueError(f'SPI divider must be even and >= 2, got {d}')
+    return [SweepPoint(pf, f, d) for pf, f, d in itertools.product(prefetch_bits, sys_clk_freqs, spi_divs)]
+
+
+@attr.s(auto_attribs=True)
+class SweepResult:
+    point: SweepPoint
+    nbytes: int
+    counters: Optional[dict[str, int]]
+    returncode: int = 0
+    wall_s: float = 0.0
+    cached: bool = False
+    log: Optional[Path] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.counters is not None and self.counters['reads'] > 0
+
+    @property
+    def underruns(self) -> Optional[int]:
+        return self.counters['underruns'] if self.ok else None
+
+    @property
+    def lat_mean_ns(self) -> Optional[float]:
+        if not self.ok:
+            return None
+        return self.counters['lat_sum'] / self.counters['reads'] / self.point.sys_clk_freq * 1e9
+
+    @property
+    def lat_max_ns(self) -> Optional[float]:
+        return self.counters['lat_max'] / self.point.sys_clk_freq * 1e9 if self.ok else None
+
+    @property
+    def read_mbps(self) -> Optional[float]:
+        # payload rate including command, address and CS# gaps
+        if not self.ok:
+            return None
+        return self.counters['reads'] * self.nbytes * self.point.sys_clk_freq / self.counters['cycles'] / 1e6
+
+
+def sweep_cmd(script: Path, point: SweepPoint, out_dir: Path, reads: int, nbytes: int,
+              extra_args: Sequence[str] = ()) -> list[str]:
+    return [sys.executable, str(Path(script).resolve()),
+            '--sys-clk-freq', f'{point.sys_clk_freq:g}', '--prefetch-bits', str(point.prefetch_bits),
+            '--spi-div', str(point.spi_div), '--workload-reads', str(reads), '--workload-bytes', str(nbytes),
+            '--output-dir', str(out_dir), *extra_args]
+
+
+def build_digest(cmd: Sequence[str], out_dir: Path) -> Optional[str]:
+    # regenerates the point's gateware and (re)compiles its model, the sim_cache digest of what got built
+    with open(out_dir / 'build.log', 'wb') as f:
+        rc = subprocess.call([*cmd, '--build-only'], cwd=out_dir, stdout=f, stderr=subprocess.STDOUT)
+    return parse_digest((out_dir / 'build.log').read_text(errors='replace')) if rc == 0 else None
+
+
+def run_point(script: Path, point: SweepPoint, work_dir: Path, reads: int, nbytes: int,
+              extra_args: Sequence[str] = (), force: bool = False) -> SweepResult:
+    out_dir = (work_dir / point.tag).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cmd = sweep_cmd(script, point, out_dir, reads, nbytes, extra_args)
+    saved = out_dir / RESULT_FILE
+    log = out_dir / 'sweep.log'
+    if not force and saved.is_file():
+        prev = json.loads(saved.read_text())
+        # the interpreter path doesn't change what gets built, the gateware (FlashEmuLite, the workload) might
+        if prev.get('cmd', [])[1:] == cmd[1:] and prev.get('counters') is not None and prev.get('digest') is not None \
+                and build_digest(cmd, out_dir) == prev['digest']:
+            return SweepResult(point, nbytes, prev['counters'], cached=True, log=log)
+    t0 = time.monotonic()
+    with open(log, 'wb') as f:
+        rc = subprocess.call(cmd, cwd=out_dir, stdout=f, stderr=subprocess.STDOUT)
+    wall_s = time.monotonic() - t0
+    text = log.read_text(errors='replace')
+    counters = parse_workload(text)
+    saved.write_text(json.dumps({'cmd': cmd, 'digest': parse_digest(text), 'returncode': rc, 'wall_s': wall_s,
+                                 'counters': counters}))
+    return SweepResult(point, nbytes, counters, rc, wall_s, log=log)
+
+
+def run_sweep(script: Path, points: Sequence[SweepPoint], work_dir: Path, reads: int, nbytes: int,
+              jobs: Optional[int] = None, extra_args: Sequence[str] = (), force: bool = False,
+              done: Optional[Callable[[SweepResult], None]] = None) -> list[SweepResult]:
+    # each point is its own build and simulator process, the threads only wait on them
+    jobs = jobs or len(points)
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as ex:
+        futs = [ex.submit(run_point, script, p, work_dir, reads, nbytes, extra_args, force) for p in points]
+        results = []
+        for f in futs:
+            results.append(f.result())
+            if done is not None:
+                done(results[-1])
+        return results
+
+
+def objectives(r: SweepResult) -> tuple[float, ...]:
+    # all minimized: faster SCLK, lower latency, smaller window (less DRAM traffic per READ), slower sys clock
+    return -r.point.sclk_freq, r.lat_mean_ns, 2**r.point.prefetch_bits, r.point.sys_clk_freq
+
+
+def dominates(a: Sequence[float], b: Sequence[float]) -> bool:
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+
+def pareto_front(results: Sequence[SweepResult]) -> list[SweepResult]:
+    # underrun free points no other underrun free point beats on every objective, fastest SCLK first
+    ok = [r for r in results if r.ok and r.underruns == 0]
+    objs = [objectives(r) for r in ok]
+    front = [r for r, o in zip(ok, objs) if not any(dominates(p, o) for p in objs)]
+    return sorted(front, key=objectives)
+
+
+def model_slack(point: SweepPoint) -> Optional[float]:
+    # emu_latency's guaranteed slack for a row miss, None when litedram can't describe the point
+    from .emu_latency import LatencyParams, dram_read_latency, solve
+    try:
+        lat = dram_read_latency('MT41K128M16', point.sys_clk_freq, '1:4')
+        return solve(LatencyParams(sys_clk_freq=point.sys_clk_freq, sclk_freq=point.sclk_freq,
+                                   prefetch_bits=point.prefetch_bits, dram_latency=lat)).slack_sys
+    except (ImportError, ValueError):
+        return None
@@ -0,0 +1,113 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Transaction level migen run_simulation helpers for the flash emulators, no Verilator/cocotb needed.
+# The spi/spi_inv domains are ticked by the simulator and the SPI master generator runs in the spi
+# domain, so every spi tick is one SCLK rising edge.
+
+from __future__ import annotations
+
+from migen import *
+from migen.fhdl.structure import _Assign
+from migen.fhdl.specials import Tristate
+from migen.genlib.cdc import AsyncClockMux
+from migen.genlib.resetsync import AsyncResetSingleStageSynchronizer
+
+from typing import Final, Generator, Optional, Union
+
+from .emu import SPISigs, QSPISigs
+from .dram_model import DRAMNativePortModel, DRAMNativePortModelStats
+
+
+class _SimResetMeta(Module):
+    def __init__(self, cd: ClockDomain, async_reset: Signal):
+        # the reset is released on the first edge after async_reset drops, like the real single stage syncer
+        rst_meta = Signal(reset=1, reset_less=True)
+        self.comb += cd.rst.eq(async_reset | rst_meta)
+        self.sync += rst_meta.eq(async_reset)
+
+
+class SimAsyncResetSingleStageSynchronizer:
+    @staticmethod
+    def lower(dr):
+        return ClockDomainsRenamer(dr.cd.name)(_SimResetMeta(dr.cd, dr.async_reset))
+
+
+class SimAsyncClockMux:
+    # the muxed domain gets its own entry in the simulator clocks instead
+    @staticmethod
+    def lower(dr):
+        return Module()
+
+
+class SimTristate:
+    # benches drive TSTriple.i and sample TSTriple.o directly
+    @staticmethod
+    def lower(dr):
+        return Module()
+
+
+SIM_SPECIAL_OVERRIDES: Final = {
+    AsyncResetSingleStageSynchronizer: SimAsyncResetSingleStageSynchronizer,
+    AsyncClockMux: SimAsyncClockMux,
+    Tristate: SimTristate,
+}
+
+
+def emu_clocks(sys_period: int = 2, spi_period: int = 20) -> dict:
+    if spi_period % 2:
+        raise ValueError('spi_period must be even')
+    return {
+        'sys': sys_period,
+        'spi': (spi_period, 0),
+        'spi_inv': (spi_period, spi_period // 2),
+        'spimem': (spi_period, 0),
+    }
+
+
+def _strip_clock_assigns(stmts: list) -> list:
+    res = []
+    for s in stmts:
+        if isinstance(s, (list, tuple)):
+            res.append(_strip_clock_assigns(s))
+        elif not (isinstance(s, _Assign) and isinstance(s.l, ClockSignal)):
+            res.append(s)
+    return res
+
+
+def emu_run_simulation(dut: Module, spi_gens: list, sys_gens: Optional[list] = None,
+                       sys_period: int = 2, spi_period: int = 20, vcd_name: Optional[str] = None):
+    gens = {'spi': spi_gens}
+    if sys_gens:
+        gens['sys'] = sys_gens
+    # the simulator ticks the SCLK derived domains itself, drop the gateware clock assignments
+    frag = dut.get_fragment()
+    frag.comb = _strip_clock_assigns(frag.comb)
+    run_simulation(frag, gens, clocks=emu_clocks(sys_period, spi_period), vcd_name=vcd_name,
+                   special_overrides=SIM_SPECIAL_OVERRIDES)
+
+
+# single lane mode 0 transfer, run from the spi domain, returns the nrx bytes clocked out after tx
+def spi_xfer(sigs: Union[SPISigs, QSPISigs], tx: bytes, nrx: int = 0) -> Generator:
+    yield sigs.csn.eq(0)
+    rx_bits = []
+    for i, bit in enumerate(b for byte in tx + bytes(nrx) for b in ((byte >> (7 - n)) & 1 for n in range(8))):
+        yield sigs.si.eq(bit)
+        yield
+        if i >= len(tx) * 8:
+            rx_bits.append((yield sigs.so))
+    yield sigs.csn.eq(1)
+    yield sigs.si.eq(0)
+    for _ in range(2):
+        yield
+    rx = bytearray()
+    for i in range(0, len(rx_bits), 8):
+        byte = 0
+        for b in rx_bits[i:i+8]:
+            byte = (byte << 1) | b
+        rx.append(byte)
+    return bytes(rx)
+
+
+def spi_read(sigs: Union[SPISigs, QSPISigs], addr: int, sz: int, cmd: int = 0x03, dummy_bytes: int = 0) -> Generator:
+    return (yield from spi_xfer(sigs, bytes([cmd]) + addr.to_bytes(3, 'big') + bytes(dummy_bytes), sz))
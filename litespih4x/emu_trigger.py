@@ -0,0 +1,80 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from __future__ import annotations
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+
+
+class FlashEmuTrigger(Module, AutoCSR):
+    def __init__(self, csn_sys: Signal, txn_cmd: Signal, txn_addr: Signal, txn_has_addr: Signal,
+                 base_width: int, num_triggers: int):
+        if num_triggers < 1:
+            raise ValueError('num_triggers must be >= 1')
+        self.num_triggers = n = num_triggers
+
+        # new image base for the emulator, strobed inside the CS# gap that follows the matching transaction
+        self.base_we = base_we = Signal()
+        self.base_dat = base_dat = Signal(base_width)
+
+        self.csn_sys_d = csn_sys_d = Signal(reset=1)
+        self.txn_end = txn_end = Signal()
+        self.sync += csn_sys_d.eq(csn_sys)
+        self.comb += txn_end.eq(csn_sys & ~csn_sys_d)
+
+        self.fired = fired = CSRStatus(n, description="Sticky per trigger fired flags, cleared by re-arming")
+        fire = Signal(n)
+
+        for i in range(n):
+            ctrl = CSRStorage(fields=[
+                CSRField("enable", size=1, description="Arm this trigger, writing ctrl re-arms and clears the hit count"),
+                CSRField("match_op", size=1, description="Compare the opcode against ``opcode``"),
+                CSRField("match_addr", size=1, description="Require the address to be within ``addr_lo``..``addr_hi``"),
+                CSRField("set_base", size=1, description="Switch the image base to ``base`` when fired"),
+            ], name=f'trig{i}_ctrl')
+            opcode = CSRStorage(8, name=f'trig{i}_opcode')
+            addr_lo = CSRStorage(txn_addr.nbits, name=f'trig{i}_addr_lo')
+            addr_hi = CSRStorage(txn_addr.nbits, reset=2**txn_addr.nbits - 1, name=f'trig{i}_addr_hi')
+            count = CSRStorage(16, name=f'trig{i}_count', description="Fire on the count+1th matching transaction")
+            base = CSRStorage(base_width, name=f'trig{i}_base')
+            hits = CSRStatus(16, name=f'trig{i}_hits', description="Matching transactions seen since arming")
+            for csr in (ctrl, opcode, addr_lo, addr_hi, count, base, hits):
+                setattr(self, csr.name, csr)
+
+            armed = Signal(name=f'trig{i}_armed')
+            match = Signal(name=f'trig{i}_match')
+            self.comb += [
+                match.eq(armed &
+                    (~ctrl.fields.match_op | (txn_cmd == opcode.storage)) &
+                    (~ctrl.fields.match_addr | (txn_has_addr & (txn_addr >= addr_lo.storage) & (txn_addr <= addr_hi.storage)))
+                ),
+                fire[i].eq(txn_end & match & (hits.status == count.storage)),
+            ]
+            self.sync += [
+                If(ctrl.re,
+                    armed.eq(ctrl.fields.enable),
+                    hits.status.eq(0),
+                    fired.status[i].eq(0),
+                ).Elif(fire[i],
+                    armed.eq(0),
+                    fired.status[i].eq(1),
+                ).Elif(txn_end & match,
+                    hits.status.eq(hits.status + 1),
+                ),
+            ]
+
+        # lowest numbered trigger wins when several fire on the same transaction
+        base_sel = None
+        for i in reversed(range(n)):
+            ctrl = getattr(self, f'trig{i}_ctrl')
+            base = getattr(self, f'trig{i}_base')
+            sel = If(fire[i] & ctrl.fields.set_base,
+                base_we.eq(1),
+                base_dat.eq(base.storage),
+            )
+            if base_sel is not None:
+                sel = sel.Else(base_sel)
+            base_sel = sel
+        self.comb += base_sel
@@ -0,0 +1,180 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Delta image upload over Etherbone. The image is compared page by page against the DRAMPageHasher CRCs:
+# a coarse pass sized so the whole image fits the hasher's table, then fine pages inside the coarse pages
+# that differ, and only the fine pages that differ are written. A reload costs a few table reads plus the
+# diff instead of the whole image. verify_image checks a load against a single DRAMRangeCRC32 digest.
+
+from __future__ import annotations
+
+import math
+import time
+import zlib
+from typing import Callable, Final, Optional, Sequence
+
+import attr
+
+from .emu_hash import CSR_MEM_MAX_WORDS
+
+MAIN_RAM_BASE: Final = 0x40000000
+BURST_WORDS: Final = 255 # Etherbone record counts are 8 bits
+FILL: Final = 0xff # erased flash, pads the image to whole pages
+
+
+def pad_image(image: bytes, page_bytes: int) -> bytes:
+    return image + bytes([FILL]) * (-len(image) % page_bytes)
+
+
+def page_crcs(image: bytes, page_bytes: int) -> list[int]:
+    return [zlib.crc32(image[off:off + page_bytes]) for off in range(0, len(image), page_bytes)]
+
+
+def coalesce(pages: Sequence[int]) -> list[tuple[int, int]]:
+    # sorted page indices to (first, count) runs
+    runs: list[tuple[int, int]] = []
+    for pg in pages:
+        if runs and runs[-1][0] + runs[-1][1] == pg:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((pg, 1))
+    return runs
+
+
+def read_words(bus, addr: int, n: int) -> list[int]:
+    words = []
+    for off in range(0, n, BURST_WORDS):
+        words += bus.read(addr + 4 * off, min(BURST_WORDS, n - off))
+    return words
+
+
+def write_bytes(bus, addr: int, data: bytes):
+    if addr % 4 or len(data) % 4:
+        raise ValueError('Etherbone writes are whole 32 bit words')
+    words = [int.from_bytes(data[i:i + 4], 'little') for i in range(0, len(data), 4)]
+    for off in range(0, len(words), BURST_WORDS):
+        bus.write(addr + 4 * off, words[off:off + BURST_WORDS])
+
+
+class PageHashRemote:
+    def __init__(self, bus, name: str = 'page_hash', max_pages: int = CSR_MEM_MAX_WORDS, timeout: float = 10.0):
+        self.bus = bus
+        self.name = name
+        self.max_pages = max_pages
+        self.timeout = timeout
+
+    def _reg(self, reg: str):
+        return getattr(self.bus.regs, f'{self.name}_{reg}')
+
+    def crcs(self, base: int, page_shift: int, npages: int) -> list[int]:
+        # CRCs of npages pages of 2**page_shift bytes from DRAM byte offset base, in table sized runs
+        out = []
+        for first in range(0, npages, self.max_pages):
+            n = min(self.max_pages, npages - first)
+            self._reg('base').write(base + (first << page_shift))
+            self._reg('page_shift').write(page_shift)
+            self._reg('npages').write(n)
+            self._reg('start').write(1)
+            deadline = time.monotonic() + self.timeout
+            while self._reg('status').read() & 1:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'{self.name} still busy after {self.timeout}s')
+            out += read_words(self.bus, getattr(self.bus.bases, f'{self.name}_table'), n)
+        return out
+
+
+class RangeCRCRemote:
+    def __init__(self, bus, name: str = 'image_crc', timeout: float = 10.0):
+        self.bus = bus
+        self.name = name
+        self.timeout = timeout
+
+    def _reg(self, reg: str):
+        return getattr(self.bus.regs, f'{self.name}_{reg}')
+
+    def crc32(self, base: int, length: int) -> tuple[int, int]:
+        # (CRC32, sys clocks taken) of length bytes from DRAM byte offset base, both word aligned
+        self._reg('base').write(base)
+        self._reg('length').write(length)
+        self._reg('start').write(1)
+        deadline = time.monotonic() + self.timeout
+        while self._reg('status').read() & 1:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'{self.name} still busy after {self.timeout}s')
+        return self._reg('digest').read(), self._reg('cycles').read()
+
+
+@attr.s(auto_attribs=True)
+class VerifyResult:
+    length: int # bytes hashed, the image padded to whole words
+    expected: int
+    actual: int
+    cycles: int
+
+    @property
+    def ok(self) -> bool:
+        return self.expected == self.actual
+
+
+def verify_image(bus, image: bytes, image_base: int = 0, word_bytes: int = 16,
+                 engine: Optional[RangeCRCRemote] = None) -> VerifyResult:
+    # word_bytes is the engine's native port width, the tail is padded the way uploads pad it
+    engine = engine or RangeCRCRemote(bus)
+    if image_base % word_bytes:
+        raise ValueError(f'image_base must be aligned to the {word_bytes} byte DRAM word')
+    image = pad_image(image, word_bytes)
+    actual, cycles = engine.crc32(image_base, len(image))
+    return VerifyResult(len(image), zlib.crc32(image), actual, cycles)
+
+
+@attr.s(auto_attribs=True)
+class UploadStats:
+    image_bytes: int
+    coarse_page: int
+    fine_page: int
+    coarse_dirty: int = 0
+    pages_sent: int = 0
+    bytes_sent: int = 0
+
+
+def delta_upload(bus, image: bytes, image_base: int = 0, ram_base: int = MAIN_RAM_BASE, fine_shift: int = 12,
+                 hasher: Optional[PageHashRemote] = None, full: bool = False,
+                 progress: Optional[Callable[[int], None]] = None) -> UploadStats:
+    # image_base is the DRAM byte offset of the image slot (FlashEmuLite image_base), ram_base where DRAM
+    # sits on the bus; progress gets the bytes sent after every written run
+    hasher = hasher or PageHashRemote(bus)
+    fine = 1 << fine_shift
+    if image_base % fine:
+        raise ValueError(f'image_base must be aligned to the {fine} byte page')
+    image = pad_image(image, fine)
+    npages_fine = len(image) // fine
+    coarse_shift = max(fine_shift, math.ceil(math.log2(max(npages_fine, 1) / hasher.max_pages)) + fine_shift)
+    per_coarse = 1 << (coarse_shift - fine_shift)
+    stats = UploadStats(len(image), 1 << coarse_shift, fine)
+
+    local = page_crcs(image, fine)
+    if full:
+        dirty = list(range(npages_fine))
+    else:
+        # coarse pages past the image end compare against a local copy padded the same way
+        coarse_local = page_crcs(pad_image(image, 1 << coarse_shift), 1 << coarse_shift)
+        coarse_remote = hasher.crcs(image_base, coarse_shift, len(coarse_local))
+        coarse_dirty = [i for i, (a, b) in enumerate(zip(coarse_local, coarse_remote)) if a != b]
+        stats.coarse_dirty = len(coarse_dirty)
+        dirty = []
+        for first, count in coalesce(coarse_dirty):
+            lo = first * per_coarse
+            hi = min((first + count) * per_coarse, npages_fine)
+            if per_coarse == 1:
+                dirty += range(lo, hi)
+                continue
+            remote = hasher.crcs(image_base + lo * fine, fine_shift, hi - lo)
+            dirty += [lo + i for i, crc in enumerate(remote) if crc != local[lo + i]]
+
+    for first, count in coalesce(dirty):
+        write_bytes(bus, ram_base + image_base + first * fine, image[first * fine:(first + count) * fine])
+        stats.pages_sent += count
+        stats.bytes_sent += count * fine
+        if progress is not None:
+            progress(stats.bytes_sent)
+    return stats
@@ -0,0 +1,144 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Self-running READ workload for the Verilator sims: a mode 0 SPI master clocked from sys issues READs at
+# pseudo random addresses, counts prefetch underruns and the CS# fall to first DRAM word latency, then
+# prints its counters on a WORKLOAD_TAG line and ends the simulation.
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Final, Optional
+
+from migen import *
+from migen.genlib.cdc import MultiReg
+
+if TYPE_CHECKING:
+    from .emu import SPISigs
+
+WORKLOAD_TAG: Final = 'emu_workload:'
+WORKLOAD_COUNTERS: Final = ('reads', 'underruns', 'lat_sum', 'lat_max', 'cycles')
+LFSR_TAPS: Final = 0xe10000 # x^24 + x^23 + x^22 + x^17 + 1, Galois
+
+
+class SPIReadWorkload(Module):
+    def __init__(self, sigs: SPISigs, underrun: Signal, word_valid: Signal, reads: int, nbytes: int,
+                 div: int = 4, gap: int = 8, seed: int = 1, opcode: int = 0x03, finish: bool = True):
+        # underrun is the emulator's spi domain flag, word_valid a sys domain DRAM read beat
+        if div < 2 or div % 2:
+            raise ValueError('div must be even and >= 2')
+        if reads < 1 or nbytes < 1:
+            raise ValueError('reads and nbytes must be >= 1')
+        if gap < 1:
+            raise ValueError('gap must be >= 1')
+        if not 0 < seed < 2**24:
+            raise ValueError('seed must be a non-zero 24 bit value')
+        half = div // 2
+        nbits = 32 + 8 * nbytes
+
+        self.reads = Signal(32)
+        self.underruns = Signal(32)
+        self.lat_sum = Signal(48)
+        self.lat_max = Signal(32)
+        self.cycles = Signal(48)
+        self.done = done = Signal()
+
+        lfsr = Signal(24, reset=seed)
+        sr = Signal(32)
+        bit_cnt = Signal(max=nbits)
+        ph = Signal(max=div)
+        gap_cnt = Signal(max=gap)
+        underrun_sys = Signal()
+        self.specials += MultiReg(underrun, underrun_sys)
+        hit = Signal()
+        lat = Signal(32)
+        lat_done = Signal()
+
+        self.comb += sigs.si.eq(sr[-1])
+
+        self.submodules.fsm = fsm = FSM(reset_state='GAP')
+        fsm.act('GAP',
+            NextValue(gap_cnt, gap_cnt + 1),
+            If(gap_cnt == gap - 1,
+                NextValue(gap_cnt, 0),
+                NextValue(sr, Cat(lfsr, C(opcode, 8))),
+                NextValue(sigs.csn, 0),
+                NextState('SHIFT'),
+            ),
+        )
+        fsm.act('SHIFT',
+            NextValue(ph, ph + 1),
+            If(ph == half - 1,
+                NextValue(sigs.sclk, 1),
+            ),
+            If(ph == div - 1,
+                NextValue(ph, 0),
+                NextValue(sigs.sclk, 0),
+                NextValue(sr, sr << 1),
+                NextValue(bit_cnt, bit_cnt + 1),
+                If(bit_cnt == nbits - 1,
+                    NextValue(bit_cnt, 0),
+                    NextState('END'),
+                ),
+            ),
+        )
+        fsm.act('END',
+            NextValue(sigs.csn, 1),
+            NextValue(self.reads, self.reads + 1),
+            If(hit | underrun_sys,
+                NextValue(self.underruns, self.underruns + 1),
+            ),
+            NextValue(self.lat_sum, self.lat_sum + lat),
+            If(lat > self.lat_max,
+                NextValue(self.lat_max, lat),
+            ),
+            NextValue(lfsr, Mux(lfsr[0], (lfsr >> 1) ^ LFSR_TAPS, lfsr >> 1)),
+            If(self.reads == reads - 1,
+                NextState('DONE'),
+            ).Else(
+                NextState('GAP'),
+            ),
+        )
+        fsm.act('DONE',
+            done.eq(1),
+        )
+
+        # per read flags, latency stops at the first word, a read that never sees one counts its whole length
+        self.sync += [
+            If(fsm.ongoing('GAP'),
+                hit.eq(0),
+                lat.eq(0),
+                lat_done.eq(0),
+            ).Elif(fsm.ongoing('SHIFT'),
+                If(underrun_sys,
+                    hit.eq(1),
+                ),
+                If(word_valid,
+                    lat_done.eq(1),
+                ).Elif(~lat_done,
+                    lat.eq(lat + 1),
+                ),
+            ),
+            If(~done,
+                self.cycles.eq(self.cycles + 1),
+            ),
+        ]
+
+        reported = Signal()
+        report = [Display(WORKLOAD_TAG + ''.join(f' {n}=%d' for n in WORKLOAD_COUNTERS),
+                          *(getattr(self, n) for n in WORKLOAD_COUNTERS)),
+                  reported.eq(1)]
+        if finish:
+            report.append(Finish())
+        self.sync += If(done & ~reported, *report)
+
+
+def parse_workload(text: str) -> Optional[dict[str, int]]:
+    # counters from the last report line in a sim's output
+    found = None
+    for line in text.splitlines():
+        if line.startswith(WORKLOAD_TAG):
+            found = {k: int(v) for k, v in re.findall(r'(\w+)=(\d+)', line)}
+    if found is not None and set(found) != set(WORKLOAD_COUNTERS):
+        raise ValueError(f'malformed workload report {found}')
+    return found
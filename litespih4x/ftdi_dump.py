@@ -0,0 +1,230 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Full chip SPI flash dump and verify over an FTDI MPSSE port. A whole range is one READ with CS# held low
+# and the data pulled in exchange() chunks sized to a multiple of the chip's USB FIFO, just under pyftdi's
+# per command payload limit. pyftdi blocks per exchange, so USB reads run in their own thread and the main
+# thread copies into a memory-mapped output (or compares) in parallel. Dumps checkpoint their progress next
+# to the output so an interrupted 32 MiB dump picks up where it stopped.
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import queue
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable, Final, Iterable, Iterator, Optional, Union
+
+import attr
+
+DEFAULT_URL: Final = 'ftdi://ftdi:2232h/1'
+PAYLOAD_MAX: Final = 0xff00 # pyftdi SpiController.PAYLOAD_MAX_LENGTH
+OP_RDID: Final = 0x9f
+OP_READ: Final = 0x03
+OP_FAST_READ: Final = 0x0b
+OP_READ4B: Final = 0x13
+OP_FAST_READ4B: Final = 0x0c
+CHECKPOINT_SUFFIX: Final = '.ckpt'
+CHECKPOINT_VERSION: Final = 1
+
+
+def open_port(url: str = DEFAULT_URL, freq: Optional[float] = None, cs: int = 0, mode: int = 0):
+    # returns (controller, port), freq defaults to the fastest MPSSE clock of the device
+    from pyftdi.spi import SpiController
+    spi = SpiController(cs_count=cs + 1)
+    spi.configure(url)
+    port = spi.get_port(cs=cs, freq=freq or spi.frequency_max, mode=mode)
+    return spi, port
+
+
+def usb_chunk(spi=None, fifo: Optional[int] = None) -> int:
+    # largest multiple of the RX FIFO that fits one MPSSE read command
+    if fifo is None:
+        fifo = spi.ftdi.fifo_sizes[1] if spi is not None else 4096
+    return max(PAYLOAD_MAX // fifo, 1) * fifo if fifo <= PAYLOAD_MAX else PAYLOAD_MAX
+
+
+def idcode(port) -> int:
+    return int.from_bytes(port.exchange([OP_RDID], 3), 'big')
+
+
+def read_cmd(addr: int, addr_bytes: int = 4, fast: bool = True) -> bytes:
+    if addr_bytes not in (3, 4):
+        raise ValueError('addr_bytes must be 3 or 4')
+    if addr >= 2**(8 * addr_bytes):
+        raise ValueError(f'address {addr:#x} needs 4 byte addressing')
+    op = {(3, False): OP_READ, (3, True): OP_FAST_READ, (4, False): OP_READ4B, (4, True): OP_FAST_READ4B}[addr_bytes, fast]
+    return bytes([op]) + addr.to_bytes(addr_bytes, 'big') + (bytes(1) if fast else b'')
+
+
+def read_stream(port, addr: int, size: int, chunk: int, addr_bytes: int = 4, fast: bool = True) -> Iterator[bytes]:
+    # one READ transaction, CS# stays low between chunks
+    off = 0
+    while off < size:
+        n = min(chunk, size - off)
+        last = off + n == size
+        if off == 0:
+            data = port.exchange(read_cmd(addr, addr_bytes, fast), n, start=True, stop=last)
+        else:
+            data = port.exchange(b'', n, start=False, stop=last)
+        yield bytes(data)
+        off += n
+
+
+def prefetched(it: Iterable[bytes], depth: int = 4) -> Iterator[bytes]:
+    # runs it in a thread, depth chunks ahead of the consumer; producer errors are re-raised here
+    q: queue.Queue = queue.Queue(depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # gives up once the consumer is gone, it may have left the queue full
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in it:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    t = threading.Thread(target=produce, name='usb-read', daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        t.join()
+
+
+@attr.s(auto_attribs=True)
+class Checkpoint:
+    addr: int
+    size: int
+    idcode: int
+    done: int = 0
+    crc32: int = 0 # of the bytes done so far
+    version: int = CHECKPOINT_VERSION
+
+    @staticmethod
+    def path_for(output: Union[str, Path]) -> Path:
+        return Path(str(output) + CHECKPOINT_SUFFIX)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[Checkpoint]:
+        try:
+            d = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if d.get('version') != CHECKPOINT_VERSION:
+            return None
+        return cls(**d)
+
+    def save(self, path: Path):
+        # atomic so a kill mid write leaves the previous checkpoint
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(attr.asdict(self)))
+        os.replace(tmp, path)
+
+
+@attr.s(auto_attribs=True)
+class DumpResult:
+    path: Path
+    size: int
+    resumed_from: int
+    crc32: int
+
+
+def dump(port, output: Union[str, Path], size: int, addr: int = 0, chunk: Optional[int] = None, addr_bytes: int = 4,
+         fast: bool = True, checkpoint_every: int = 1 << 20, resume: bool = True,
+         progress: Optional[Callable[[int], None]] = None) -> DumpResult:
+    # progress gets the total bytes done after every chunk
+    chunk = chunk or usb_chunk()
+    output = Path(output)
+    ckpt_path = Checkpoint.path_for(output)
+    chip_id = idcode(port)
+    ckpt = Checkpoint.load(ckpt_path) if resume else None
+    if ckpt is None or (ckpt.addr, ckpt.size, ckpt.idcode) != (addr, size, chip_id) or not output.is_file() \
+            or output.stat().st_size != size:
+        ckpt = Checkpoint(addr, size, chip_id)
+    start = ckpt.done
+    with open(output, 'r+b' if start else 'w+b') as f:
+        f.truncate(size)
+        if size == 0:
+            ckpt_path.unlink(missing_ok=True)
+            return DumpResult(output, 0, 0, 0)
+        with mmap.mmap(f.fileno(), size) as mm:
+            off = start
+            since = 0
+            for data in prefetched(read_stream(port, addr + start, size - start, chunk, addr_bytes, fast)):
+                mm[off:off + len(data)] = data
+                ckpt.crc32 = zlib.crc32(data, ckpt.crc32)
+                off += len(data)
+                since += len(data)
+                if since >= checkpoint_every and off < size:
+                    mm.flush()
+                    ckpt.done = off
+                    ckpt.save(ckpt_path)
+                    since = 0
+                if progress is not None:
+                    progress(off)
+            mm.flush()
+    ckpt_path.unlink(missing_ok=True)
+    return DumpResult(output, size, start, ckpt.crc32)
+
+
+@attr.s(auto_attribs=True)
+class Mismatch:
+    offset: int
+    length: int
+
+    def __str__(self) -> str:
+        return f'{self.offset:#010x}+{self.length:#x}'
+
+
+def verify(port, reference: Union[str, Path], addr: int = 0, size: Optional[int] = None, chunk: Optional[int] = None,
+           addr_bytes: int = 4, fast: bool = True, progress: Optional[Callable[[int], None]] = None) -> list[Mismatch]:
+    # differing ranges of the chip against a file, adjacent differing bytes are merged
+    chunk = chunk or usb_chunk()
+    mismatches: list[Mismatch] = []
+    with open(reference, 'rb') as f:
+        ref_size = os.fstat(f.fileno()).st_size
+        size = ref_size if size is None else size
+        if size > ref_size:
+            raise ValueError(f'reference is {ref_size} bytes, shorter than {size}')
+        if size == 0:
+            return mismatches
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as ref:
+            off = 0
+            for data in prefetched(read_stream(port, addr, size, chunk, addr_bytes, fast)):
+                want = ref[off:off + len(data)]
+                if data != want:
+                    for i, (a, b) in enumerate(zip(data, want)):
+                        if a == b:
+                            continue
+                        last = mismatches[-1] if mismatches else None
+                        if last is not None and last.offset + last.length == off + i:
+                            last.length += 1
+                        else:
+                            mismatches.append(Mismatch(off + i, 1))
+                off += len(data)
+                if progress is not None:
+                    progress(off)
+    return mismatches
@@ -0,0 +1,293 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Synthesizable, cycle based stand-in for MX25U25635F.v with the MacronixModel interface, for Verilator
+# and migen sims. SCLK/CS#/SI are oversampled in an internal clock domain that must run at least 4x SCLK.
+# Single lane, 3 byte addressing: READ, FAST_READ, RDID, RDSR, RDCR, WRSR, WREN, WRDI, PP, SE, BE32K,
+# BE, CE and RSTEN/RST. Program/erase run one byte per internal clock with WIP set, BP protection and
+# suspend/resume are not modeled.
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Final, Optional, Union
+
+from migen import *
+
+from .macronix_ref import val4addr_array, ID_MXIC, MEMORY_TYPE, MEMORY_DENSITY, CR_DEFAULT, CR_TB, SR_BP_MASK, SR_QE, SR_SRWD
+from .macronix_ref import PAGE_SZ, SECTOR_SZ, BLOCK32K_SZ, BLOCK_SZ
+from .macronix_model import MacronixTiming
+
+CMD_READ: Final = 0x03
+CMD_FASTREAD: Final = 0x0b
+CMD_RDID: Final = 0x9f
+CMD_RDSR: Final = 0x05
+CMD_RDCR: Final = 0x15
+CMD_WRSR: Final = 0x01
+CMD_WREN: Final = 0x06
+CMD_WRDI: Final = 0x04
+CMD_PP: Final = 0x02
+CMD_SE: Final = 0x20
+CMD_BE32K: Final = 0x52
+CMD_BE: Final = 0xd8
+CMD_CE: Final = 0x60
+CMD_CE2: Final = 0xc7
+CMD_RSTEN: Final = 0x66
+CMD_RST: Final = 0x99
+
+
+def macronix_lite_init(sz: int, init: Optional[Union[bytes, str, Path]] = None) -> list[int]:
+    # flash image file or bytes, short images are padded with erased bytes, default is the val4addr pattern
+    if init is None:
+        return val4addr_array(sz).tolist()
+    if isinstance(init, (str, Path)):
+        init = Path(init).read_bytes()
+    if len(init) > sz:
+        raise ValueError(f'init is {len(init)} bytes, flash is {sz}')
+    return list(init) + [0xff] * (sz - len(init))
+
+
+class MacronixModelLite(Module):
+    def __init__(self, platform, sclk: Signal, rstn: Signal, csn: Signal,
+                 si: Signal, so: Signal, wpn: Signal, sio3: Signal,
+                 sz: int = 2 * 1024 * 1024, init: Optional[Union[bytes, str, Path]] = None, clock_domain: str = 'sys'):
+        # platform is unused, it is only taken to be a drop-in for MacronixModel
+        if sz & (sz - 1) or not BLOCK_SZ <= sz <= 2**24:
+            raise ValueError('sz must be a power of 2 between 64 KiB and 16 MiB')
+        self.sz = sz
+        # no delays to wait out, benches pacing off MacronixModel.timing get the 1 ns minimum everywhere
+        self.timing = MacronixTiming().scaled(1e-9)
+        aw = log2_int(sz)
+        sync = getattr(self.sync, clock_domain)
+
+        self.si_ts = si_ts = TSTriple()
+        self.so_ts = so_ts = TSTriple()
+        self.specials += si_ts.get_tristate(si)
+        self.specials += so_ts.get_tristate(so)
+
+        self.specials.mem = mem = Memory(8, sz, init=macronix_lite_init(sz, init), name='flash_array')
+        self.specials.port = port = mem.get_port(write_capable=True, async_read=True, clock_domain=clock_domain)
+        self.specials.page_buf = page_buf = Memory(8, PAGE_SZ, name='page_buf')
+        self.specials.pb_wr = pb_wr = page_buf.get_port(write_capable=True, clock_domain=clock_domain)
+        self.specials.pb_rd = pb_rd = page_buf.get_port(async_read=True)
+
+        # pin sampling and edge detect, the raw pins are used combinationally so SO moves one clock after SCLK falls
+        active = Signal()
+        sclk_d = Signal()
+        active_d = Signal()
+        rise = Signal()
+        fall = Signal()
+        txn_end = Signal()
+        self.comb += [
+            active.eq(~csn & rstn),
+            rise.eq(active & sclk & ~sclk_d),
+            fall.eq(active & ~sclk & sclk_d),
+            txn_end.eq(~active & active_d),
+        ]
+        sync += [
+            sclk_d.eq(sclk),
+            active_d.eq(active),
+        ]
+
+        # registers
+        self.wip = wip = Signal()
+        self.wel = wel = Signal()
+        sr_nv = Signal(6) # SR[7:2]
+        cr = Signal(8, reset=CR_DEFAULT)
+        rst_en = Signal()
+        status = Signal(8)
+        self.comb += status.eq(Cat(wip, wel, sr_nv))
+
+        # transaction state
+        in_sreg = Signal(7)
+        out_sreg = Signal(8, reset=0xff)
+        bit_cnt = Signal(3)
+        byte_idx = Signal(max=8) # saturating count of complete bytes
+        cmd = Signal(8)
+        addr = Signal(24)
+        wrsr_dat = Signal(16)
+        id_ptr = Signal(2)
+        pp_mask = Signal(PAGE_SZ)
+        in_byte = Signal(8)
+        self.comb += [
+            in_byte.eq(Cat(si_ts.i, in_sreg)),
+            so_ts.o.eq(out_sreg[7]),
+            so_ts.oe.eq(active),
+            si_ts.oe.eq(0),
+        ]
+
+        # program/erase engine
+        eng_prog = Signal()
+        eng_erase = Signal()
+        eng_adr = Signal(aw)
+        eng_cnt = Signal(aw + 1)
+        pb_i = Signal(log2_int(PAGE_SZ))
+
+        # output byte for the one about to be shifted out, only RDSR is answered while WIP
+        id_bytes = Array(C(b, 8) for b in (ID_MXIC, MEMORY_TYPE, MEMORY_DENSITY))
+        next_out = Signal(8)
+        data_phase = Signal()
+        self.comb += [
+            data_phase.eq(((cmd == CMD_READ) & (byte_idx >= 4)) | ((cmd == CMD_FASTREAD) & (byte_idx >= 5))),
+            next_out.eq(0xff),
+            If(byte_idx != 0,
+                If(cmd == CMD_RDSR,
+                    next_out.eq(status),
+                ).Elif(~wip,
+                    If(cmd == CMD_RDCR,
+                        next_out.eq(cr),
+                    ).Elif(cmd == CMD_RDID,
+                        next_out.eq(id_bytes[id_ptr]),
+                    ).Elif(data_phase,
+                        next_out.eq(port.dat_r),
+                    )
+                )
+            ),
+        ]
+
+        # shift in on rising, out on falling SCLK
+        sync += [
+            If(~active,
+                bit_cnt.eq(0),
+                byte_idx.eq(0),
+                id_ptr.eq(0),
+                out_sreg.eq(0xff),
+            ).Else(
+                If(rise,
+                    in_sreg.eq(in_byte[:7]),
+                    bit_cnt.eq(bit_cnt + 1),
+                    If(bit_cnt == 7,
+                        If(byte_idx != 7,
+                            byte_idx.eq(byte_idx + 1),
+                        ),
+                        If(byte_idx == 0,
+                            cmd.eq(in_byte),
+                            If(~wip,
+                                pp_mask.eq(0),
+                            )
+                        ).Elif(cmd == CMD_WRSR,
+                            If(byte_idx == 1,
+                                wrsr_dat[:8].eq(in_byte),
+                            ).Elif(byte_idx == 2,
+                                wrsr_dat[8:].eq(in_byte),
+                            )
+                        ).Elif((byte_idx <= 3) & ~wip,
+                            addr.eq(Cat(in_byte, addr[:16])),
+                        ).Elif((cmd == CMD_PP) & ~wip,
+                            # page offset wraps, a later byte for the same offset replaces the earlier one
+                            pp_mask.eq(pp_mask | (C(1, PAGE_SZ) << addr[:8])),
+                            addr[:8].eq(addr[:8] + 1),
+                        )
+                    )
+                ),
+                If(fall & (bit_cnt == 0),
+                    out_sreg.eq(next_out),
+                    If(data_phase & ~wip,
+                        addr.eq(addr + 1),
+                    ),
+                    If(cmd == CMD_RDID,
+                        id_ptr.eq(Mux(id_ptr == 2, 0, id_ptr + 1)),
+                    ),
+                ).Elif(fall,
+                    out_sreg.eq(Cat(C(1, 1), out_sreg[:7])),
+                )
+            )
+        ]
+        self.comb += [
+            pb_wr.adr.eq(addr[:8]),
+            pb_wr.dat_w.eq(in_byte),
+            pb_wr.we.eq(rise & (bit_cnt == 7) & (byte_idx >= 4) & (cmd == CMD_PP) & ~wip),
+        ]
+
+        # commands take effect on CS# rising on a byte boundary
+        complete = Signal()
+        self.comb += complete.eq(txn_end & (bit_cnt == 0) & ~wip)
+
+        def start_erase(size: int):
+            return [
+                wip.eq(1),
+                wel.eq(0),
+                eng_erase.eq(1),
+                eng_adr.eq(addr[:aw] & ((sz - 1) & ~(size - 1))),
+                eng_cnt.eq(size),
+            ]
+
+        sync += [
+            If(complete & (byte_idx == 1),
+                If(cmd == CMD_WREN,
+                    wel.eq(1),
+                ).Elif(cmd == CMD_WRDI,
+                    wel.eq(0),
+                ).Elif((cmd == CMD_CE) | (cmd == CMD_CE2),
+                    If(wel, *start_erase(sz)),
+                ).Elif((cmd == CMD_RST) & rst_en,
+                    # SR[7:2] and CR[3] are non-volatile
+                    wel.eq(0),
+                    cr.eq((cr & CR_TB) | CR_DEFAULT),
+                ),
+                rst_en.eq(cmd == CMD_RSTEN),
+            ).Elif(complete & (byte_idx >= 2) & (cmd == CMD_WRSR),
+                If(wel,
+                    sr_nv.eq(wrsr_dat[2:8] & ((SR_BP_MASK | SR_QE | SR_SRWD) >> 2)),
+                    If(byte_idx >= 3,
+                        cr[:4].eq(wrsr_dat[8:12]),
+                    ),
+                ),
+                wel.eq(0),
+                rst_en.eq(0),
+            ).Elif(complete & (byte_idx == 4) & (cmd == CMD_SE),
+                If(wel, *start_erase(SECTOR_SZ)),
+                rst_en.eq(0),
+            ).Elif(complete & (byte_idx == 4) & (cmd == CMD_BE32K),
+                If(wel, *start_erase(BLOCK32K_SZ)),
+                rst_en.eq(0),
+            ).Elif(complete & (byte_idx == 4) & (cmd == CMD_BE),
+                If(wel, *start_erase(BLOCK_SZ)),
+                rst_en.eq(0),
+            ).Elif(complete & (byte_idx >= 5) & (cmd == CMD_PP),
+                If(wel,
+                    wip.eq(1),
+                    wel.eq(0),
+                    eng_prog.eq(1),
+                    eng_adr.eq(Cat(C(0, 8), addr[8:aw])),
+                    eng_cnt.eq(PAGE_SZ),
+                    pb_i.eq(0),
+                ),
+                rst_en.eq(0),
+            ).Elif(complete,
+                rst_en.eq(0),
+            ),
+
+            If(eng_erase,
+                eng_adr.eq(eng_adr + 1),
+                eng_cnt.eq(eng_cnt - 1),
+                If(eng_cnt == 1,
+                    eng_erase.eq(0),
+                    wip.eq(0),
+                )
+            ),
+            If(eng_prog,
+                pb_i.eq(pb_i + 1),
+                eng_cnt.eq(eng_cnt - 1),
+                If(eng_cnt == 1,
+                    eng_prog.eq(0),
+                    wip.eq(0),
+                )
+            ),
+        ]
+
+        # the engine owns the array port while WIP, the SPI side only answers RDSR then
+        self.comb += [
+            pb_rd.adr.eq(pb_i),
+            If(eng_erase,
+                port.adr.eq(eng_adr),
+                port.dat_w.eq(0xff),
+                port.we.eq(1),
+            ).Elif(eng_prog,
+                port.adr.eq(eng_adr | pb_i),
+                port.dat_w.eq(port.dat_r & pb_rd.dat_r),
+                port.we.eq((pp_mask >> pb_i)[0]),
+            ).Else(
+                port.adr.eq(addr[:aw]),
+            )
+        ]
@@ -3,7 +3,9 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 from __future__ import annotations
-from typing import Final
+from typing import Final, Optional
+
+import attr
 
 from rich import print
 
@@ -16,9 +18,64 @@ _MODEL_VERILOG_NAME: Final = 'MX25U25635F.v'
 _MODEL_TAP_VERILOG_PATH: Final = files(data_mod).joinpath(_MODEL_VERILOG_NAME)
 
 
+_SPECIFY_ONLY_TIMING: Final = frozenset({'tRLRH', 'tRHSL'})
+# the model counts erases in ERS_CLK periods (Clock*2*500 ns) and tells a suspended erase's kind by its count
+_ERASE_TIMING: Final = ('tSE', 'tBE32', 'tBE')
+ERASE_TICK_NS: Final = 50_000
+
+
+# AC parameters of MX25U25635F.v that can be overridden per instance, ns unless noted. The defaults are
+# the datasheet values, the vendored model ships with some of them hand-shrunk (see VENDORED_TIMING).
+@attr.s(auto_attribs=True, frozen=True)
+class MacronixTiming:
+    tVSL: int = 1_500_000 # power up to CS# allowed
+    tBP: int = 12_000 # byte program
+    tPP: int = 1_000_000 # page program
+    tSE: int = 45_000_000 # 4KB sector erase
+    tBE32: int = 200_000_000 # 32KB block erase
+    tBE: int = 400_000_000 # 64KB block erase
+    tCE: int = 200_000 # chip erase, ms
+    tW: int = 40_000_000 # write status
+    tWREAR: int = 40 # write extended address register
+    tWRFBR: int = 1_000_000 # write fast boot register
+    tREADY2_P: int = 310_000 # reset recovery, program
+    tREADY2_SE: int = 12_000_000 # reset recovery, sector erase
+    tREADY2_BE: int = 25_000_000 # reset recovery, block erase
+    tREADY2_CE: int = 100_000_000 # reset recovery, chip erase
+    tREADY2_R: int = 40_000 # reset recovery, read
+    tREADY2_D: int = 40_000 # reset recovery, instruction decode
+    tREADY2_W: int = 40_000_000 # reset recovery, WRSR
+    tESL: int = 20_000 # erase suspend latency
+    tPSL: int = 20_000 # program suspend latency
+    tPRS: int = 100_000 # program resume to next suspend
+    tERS: int = 200_000 # erase resume to next suspend
+    # specify block timing checks, not parameters, only used by benches to pace RESET#
+    tRLRH: int = 10_000 # RESET# pulse width
+    tRHSL: int = 10_000 # RESET# high before CS# low
+
+    def scaled(self, factor: float) -> MacronixTiming:
+        if factor <= 0:
+            raise ValueError('time scale factor must be > 0')
+        # the specify block checks stay fixed in the .v, scaling them would pace RESET# below its $width
+        d = {k: v if k in _SPECIFY_ONLY_TIMING else max(1, round(v * factor)) for k, v in attr.asdict(self).items()}
+        # erases are floored to distinct, ordered tick counts so ERS_Count_* don't all truncate to 0
+        ticks = 0
+        for k in _ERASE_TIMING:
+            ticks = max(ticks + 1, d[k] // ERASE_TICK_NS)
+            d[k] = max(d[k], ticks * ERASE_TICK_NS)
+        return MacronixTiming(**d)
+
+    def params(self) -> dict[str, int]:
+        return {k: v for k, v in attr.asdict(self).items() if k not in _SPECIFY_ONLY_TIMING}
+
+
+# what MX25U25635F.v uses when no parameters are passed
+VENDORED_TIMING: Final = MacronixTiming(tVSL=10, tW=40, tREADY2_R=40, tREADY2_D=40, tREADY2_W=40, tRLRH=10, tRHSL=10)
+
+
 class MacronixModelImpl(Module):
     def __init__(self, sclk: Signal, rstn: Signal, csn: Signal,
-                 si: Signal, so: Signal, wpn: Signal, sio3: Signal):
+                 si: Signal, so: Signal, wpn: Signal, sio3: Signal, params: Optional[dict] = None):
         # self.rstn = rstn = ~rst
 
         # # #
@@ -31,6 +88,8 @@ class MacronixModelImpl(Module):
                                   io_SO = so,
                                   io_WP = wpn,
                                   io_SIO3 = sio3,
+                                  # plain integers like the vendored defaults, not sized constants
+                                  **{f'p_{k}': Instance.PreformattedParam(str(v)) for k, v in (params or {}).items()},
                                   # i_SI_i = si.i,
                                   # i_SO_i = so.i,
                                   # i_WP_i = wp.i,
@@ -48,8 +107,9 @@ class MacronixModelImpl(Module):
 
 class MacronixModelSpecial(Special):
     def __init__(self, platform, sclk: Signal, rstn: Signal, csn: Signal,
-                 si: Signal, so: Signal, wpn: Signal, sio3: Signal):
+                 si: Signal, so: Signal, wpn: Signal, sio3: Signal, params: Optional[dict] = None):
         super().__init__()
+        self.params = params
         self.sclk = sclk
         self.rst = rstn
         self.csn = csn
@@ -62,11 +122,22 @@ class MacronixModelSpecial(Special):
 
     @staticmethod
     def lower(dr):
-        return MacronixModelImpl(dr.sclk, dr.rst, dr.csn, dr.si, dr.so, dr.wpn, dr.sio3)
+        return MacronixModelImpl(dr.sclk, dr.rst, dr.csn, dr.si, dr.so, dr.wpn, dr.sio3, dr.params)
 
 class MacronixModel(Module):
     def __init__(self, platform, sclk: Signal, rstn: Signal, csn: Signal,
-                 si: Signal, so: Signal, wpn: Signal, sio3: Signal):
+                 si: Signal, so: Signal, wpn: Signal, sio3: Signal,
+                 timing: Optional[MacronixTiming] = None, time_scale: Optional[float] = None):
+        # without timing/time_scale the vendored parameter values are left alone
+        params = None
+        if timing is None and time_scale is None:
+            self.timing = VENDORED_TIMING
+        else:
+            self.timing = timing or MacronixTiming()
+            if time_scale is not None:
+                self.timing = self.timing.scaled(time_scale)
+            params = self.timing.params()
+
         # # #
 
-        self.specials += MacronixModelSpecial(platform, sclk, rstn, csn, si, so, wpn, sio3)
+        self.specials += MacronixModelSpecial(platform, sclk, rstn, csn, si, so, wpn, sio3, params)
@@ -0,0 +1,261 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Transaction level NumPy golden model of the MX25U25635F command set, used as a fast oracle for the
+# emulator gateware and the vendored MX25U25635F.v. Every transaction is answered with one slice or
+# fancy-indexing operation on the flash array. Program/erase complete instantly, so WIP always reads 0.
+
+from __future__ import annotations
+
+from typing import Final, Optional, Union
+
+import attr
+import numpy as np
+
+from .emu_sfdp import SFDP_DEPTH, load_sfdp_hex
+
+SZ_BYTES: Final = 32 * 1024 * 1024
+PAGE_SZ: Final = 256
+SECTOR_SZ: Final = 4 * 1024
+BLOCK32K_SZ: Final = 32 * 1024
+BLOCK_SZ: Final = 64 * 1024
+SFDP_SZ: Final = SFDP_DEPTH
+
+ID_MXIC: Final = 0xc2
+ID_DEVICE: Final = 0x39
+MEMORY_TYPE: Final = 0x25
+MEMORY_DENSITY: Final = 0x39
+
+SR_WIP: Final = 1 << 0
+SR_WEL: Final = 1 << 1
+SR_BP_SHIFT: Final = 2
+SR_BP_MASK: Final = 0xf << SR_BP_SHIFT
+SR_QE: Final = 1 << 6
+SR_SRWD: Final = 1 << 7
+CR_TB: Final = 1 << 3
+CR_4BYTE: Final = 1 << 5
+CR_DEFAULT: Final = 0b00111
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CmdInfo:
+    name: str
+    addr: Optional[int] = None # None = no address, 0 = follow 3/4 byte mode, else fixed byte count
+    dummy: int = 0 # dummy bytes on a single lane transfer
+    kind: str = 'ctrl'
+
+
+CMDS: Final = {
+    0x03: CmdInfo('READ', 0, 0, 'read'),
+    0x13: CmdInfo('READ4B', 4, 0, 'read'),
+    0x0b: CmdInfo('FASTREAD', 0, 1, 'read'),
+    0x0c: CmdInfo('FASTREAD4B', 4, 1, 'read'),
+    0x3b: CmdInfo('DREAD', 0, 1, 'read'),
+    0x3c: CmdInfo('DREAD4B', 4, 1, 'read'),
+    0x6b: CmdInfo('QREAD', 0, 1, 'read'),
+    0x6c: CmdInfo('QREAD4B', 4, 1, 'read'),
+    0x5a: CmdInfo('RDSFDP', 3, 1, 'sfdp'),
+    0x9f: CmdInfo('RDID', kind='rdid'),
+    0xab: CmdInfo('RES', 3, kind='res'),
+    0x90: CmdInfo('REMS', 3, kind='rems'),
+    0x05: CmdInfo('RDSR', kind='rdsr'),
+    0x15: CmdInfo('RDCR', kind='rdcr'),
+    0x01: CmdInfo('WRSR', kind='wrsr'),
+    0x06: CmdInfo('WREN', kind='wren'),
+    0x04: CmdInfo('WRDI', kind='wrdi'),
+    0xb7: CmdInfo('EN4B', kind='en4b'),
+    0xe9: CmdInfo('EX4B', kind='ex4b'),
+    0x02: CmdInfo('PP', 0, kind='pp'),
+    0x12: CmdInfo('PP4B', 4, kind='pp'),
+    0x20: CmdInfo('SE', 0, kind='erase'),
+    0x21: CmdInfo('SE4B', 4, kind='erase'),
+    0x52: CmdInfo('BE32K', 0, kind='erase'),
+    0x5c: CmdInfo('BE32K4B', 4, kind='erase'),
+    0xd8: CmdInfo('BE', 0, kind='erase'),
+    0xdc: CmdInfo('BE4B', 4, kind='erase'),
+    0x60: CmdInfo('CE', kind='erase'),
+    0xc7: CmdInfo('CE', kind='erase'),
+    0x66: CmdInfo('RSTEN', kind='rsten'),
+    0x99: CmdInfo('RST', kind='rst'),
+}
+
+ERASE_SZ: Final = {
+    0x20: SECTOR_SZ, 0x21: SECTOR_SZ,
+    0x52: BLOCK32K_SZ, 0x5c: BLOCK32K_SZ,
+    0xd8: BLOCK_SZ, 0xdc: BLOCK_SZ,
+}
+
+
+def val4addr_array(sz: int) -> np.ndarray:
+    # same power-on pattern as MX25U25635F.v and FlashEmu
+    a = np.arange(sz, dtype=np.uint32)
+    return ((a ^ (a >> 8) ^ (a >> 16) ^ (a >> 24)) & 0xff).astype(np.uint8)
+
+
+def load_sfdp_table() -> np.ndarray:
+    # same table the emulators serve
+    return np.array(load_sfdp_hex(), dtype=np.uint8)
+
+
+class MacronixRef:
+    def __init__(self, sz: int = SZ_BYTES, init: Optional[Union[bytes, np.ndarray]] = None):
+        if sz % BLOCK_SZ:
+            raise ValueError(f'sz must be a multiple of {BLOCK_SZ}')
+        self.sz = sz
+        if init is None:
+            self.array = val4addr_array(sz)
+        else:
+            self.array = np.frombuffer(bytes(init), dtype=np.uint8).copy() if not isinstance(init, np.ndarray) \
+                         else init.astype(np.uint8).copy()
+            if self.array.size != sz:
+                raise ValueError(f'init is {self.array.size} bytes, expected {sz}')
+        self.sfdp = load_sfdp_table()
+        self.sr = 0
+        self.cr = CR_DEFAULT
+        self.reset()
+
+    def reset(self):
+        # SR[7:2] and CR[3] are non-volatile, everything else comes back at its power-on value
+        self.sr &= SR_BP_MASK | SR_QE | SR_SRWD
+        self.cr = (self.cr & CR_TB) | CR_DEFAULT
+        self.rst_en = False
+
+    @property
+    def wel(self) -> bool:
+        return bool(self.sr & SR_WEL)
+
+    @property
+    def four_byte(self) -> bool:
+        return bool(self.cr & CR_4BYTE)
+
+    def addr_bytes(self, cmd: int) -> int:
+        n = CMDS[cmd].addr
+        if n == 0:
+            return 4 if self.four_byte else 3
+        return n
+
+    def protected_range(self) -> tuple[int, int]:
+        bp = (self.sr & SR_BP_MASK) >> SR_BP_SHIFT
+        if bp == 0:
+            return 0, 0
+        nblk = min(2**(bp - 1), self.sz // BLOCK_SZ)
+        if self.cr & CR_TB:
+            return 0, nblk * BLOCK_SZ
+        return self.sz - nblk * BLOCK_SZ, self.sz
+
+    def is_protected(self, addr: int, sz: int) -> bool:
+        lo, hi = self.protected_range()
+        return addr < hi and addr + sz > lo
+
+    # one array op per transaction ----------------------------------------------------------------
+
+    def read(self, addr: int, sz: int) -> np.ndarray:
+        addr %= self.sz
+        if addr + sz <= self.sz:
+            return self.array[addr:addr + sz].copy()
+        return np.take(self.array, np.arange(addr, addr + sz), mode='wrap')
+
+    def read_sfdp(self, addr: int, sz: int) -> np.ndarray:
+        return np.take(self.sfdp, np.arange(addr, addr + sz), mode='wrap')
+
+    def program(self, addr: int, data: Union[bytes, np.ndarray]) -> bool:
+        # NOR program only clears bits, addresses wrap inside the page and only the last 256 bytes count
+        data = np.frombuffer(bytes(data), dtype=np.uint8) if not isinstance(data, np.ndarray) else data.astype(np.uint8)
+        if not self.wel:
+            return False
+        self.sr &= ~SR_WEL
+        addr %= self.sz
+        if self.is_protected(addr & ~(PAGE_SZ - 1), PAGE_SZ):
+            return False
+        skip = max(0, data.size - PAGE_SZ)
+        data = data[skip:]
+        page = addr & ~(PAGE_SZ - 1)
+        idx = page + (np.arange(data.size) + (addr - page) + skip) % PAGE_SZ
+        self.array[idx] &= data
+        return True
+
+    def erase(self, addr: int, sz: int) -> bool:
+        if not self.wel:
+            return False
+        self.sr &= ~SR_WEL
+        base = (addr % self.sz) & ~(sz - 1)
+        if self.is_protected(base, sz):
+            return False
+        self.array[base:base + sz] = 0xff
+        return True
+
+    def chip_erase(self) -> bool:
+        if not self.wel:
+            return False
+        self.sr &= ~SR_WEL
+        if self.protected_range() != (0, 0):
+            return False
+        self.array[:] = 0xff
+        return True
+
+    # byte level SPI framing --------------------------------------------------------------------------
+
+    def transact(self, cmd: int, addr: Optional[int] = None, data: bytes = b'', nrx: int = 0) -> bytes:
+        if cmd not in CMDS:
+            return b'\xff' * nrx
+        info = CMDS[cmd]
+        if info.kind != 'rst':
+            self.rst_en = False
+        k = info.kind
+        if k == 'read':
+            return self.read(addr, nrx).tobytes()
+        if k == 'sfdp':
+            return self.read_sfdp(addr, nrx).tobytes()
+        if k == 'rdid':
+            return np.resize(np.array([ID_MXIC, MEMORY_TYPE, MEMORY_DENSITY], dtype=np.uint8), nrx).tobytes()
+        if k == 'res':
+            return bytes([ID_DEVICE]) * nrx
+        if k == 'rems':
+            ids = [ID_MXIC, ID_DEVICE] if not (addr & 1) else [ID_DEVICE, ID_MXIC]
+            return np.resize(np.array(ids, dtype=np.uint8), nrx).tobytes()
+        if k == 'rdsr':
+            return bytes([self.sr]) * nrx
+        if k == 'rdcr':
+            return bytes([self.cr]) * nrx
+        if k == 'wren':
+            self.sr |= SR_WEL
+        elif k == 'wrdi':
+            self.sr &= ~SR_WEL
+        elif k == 'wrsr':
+            if self.wel and data:
+                self.sr = (data[0] & (SR_BP_MASK | SR_QE | SR_SRWD)) | (self.sr & SR_WIP)
+                if len(data) > 1:
+                    self.cr = (self.cr & ~0x0f) | (data[1] & 0x0f)
+                self.sr &= ~SR_WEL
+        elif k == 'en4b':
+            self.cr |= CR_4BYTE
+        elif k == 'ex4b':
+            self.cr &= ~CR_4BYTE
+        elif k == 'pp':
+            self.program(addr, data)
+        elif k == 'erase':
+            if cmd in ERASE_SZ:
+                self.erase(addr, ERASE_SZ[cmd])
+            else:
+                self.chip_erase()
+        elif k == 'rsten':
+            self.rst_en = True
+        elif k == 'rst':
+            if self.rst_en:
+                self.reset()
+        return b'\xff' * nrx
+
+    def xfer(self, tx: bytes, nrx: int = 0) -> bytes:
+        # full single lane transaction as the SPI master sees it: opcode, address, dummy, payload
+        cmd = tx[0]
+        if cmd not in CMDS:
+            return b'\xff' * nrx
+        info = CMDS[cmd]
+        addr = None
+        off = 1
+        if info.addr is not None:
+            nab = self.addr_bytes(cmd)
+            addr = int.from_bytes(tx[off:off + nab], 'big')
+            off += nab
+        off += info.dummy
+        return self.transact(cmd, addr, tx[off:], nrx)
@@ -0,0 +1,120 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Content hashed reuse of compiled simulators. The digest covers the generated gateware dir sources, any
+# sources pulled in from elsewhere (C++ sim modules, vendored Verilog) and the build options, so a rerun
+# after a harness-only change skips the Verilator compile.
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Final, Iterable, Optional
+
+CACHE_MANIFEST: Final = '.sim_cache.json'
+DIGEST_TAG: Final = 'sim_cache digest:'
+SOURCE_SUFFIXES: Final = frozenset({'.v', '.sv', '.vh', '.svh', '.c', '.cc', '.cpp', '.h', '.hpp', '.mak', '.init', '.hex'})
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_source(path: Path) -> bool:
+    return path.suffix in SOURCE_SUFFIXES or path.name == 'Makefile' or (path.name.startswith('build_') and path.suffix == '.sh')
+
+
+class SimBuildCache:
+    def __init__(self, gateware_dir: Path, options: Optional[dict] = None, extra_files: Iterable[Path] = (),
+                 extra_dirs: Iterable[Path] = ()):
+        self.gateware_dir = Path(gateware_dir)
+        self.options = options or {}
+        self.extra_files = [Path(p) for p in extra_files]
+        self.extra_dirs = [Path(p) for p in extra_dirs]
+        self.manifest_path = self.gateware_dir / CACHE_MANIFEST
+        self._files = None
+
+    def sources(self) -> list[Path]:
+        # compiler outputs live in subdirs (obj_dir, sim_build), only the top level is generated input
+        srcs = [p for p in self.gateware_dir.iterdir() if p.is_file() and _is_source(p)]
+        for d in self.extra_dirs:
+            srcs += [p for p in d.rglob('*') if p.is_file() and _is_source(p)]
+        srcs += [p for p in self.extra_files if p.is_file()]
+        return sorted({p.resolve() for p in srcs})
+
+    def files(self) -> dict[str, str]:
+        if self._files is None:
+            self._files = {str(p): file_digest(p) for p in self.sources()}
+        return self._files
+
+    def digest(self) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps(self.options, sort_keys=True, default=str).encode())
+        for path, d in self.files().items():
+            h.update(f'{path}\0{d}\n'.encode())
+        return h.hexdigest()
+
+    def load_manifest(self) -> dict:
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def valid(self, artifact: Path) -> bool:
+        artifact = self.gateware_dir / artifact
+        return artifact.is_file() and self.load_manifest().get('digest') == self.digest()
+
+    def save(self):
+        files = {p: [d, os.stat(p).st_mtime_ns] for p, d in self.files().items()}
+        self.manifest_path.write_text(json.dumps({'digest': self.digest(), 'files': files}))
+
+    def restore_mtimes(self) -> int:
+        # regenerated but unchanged files get their old mtime back so make based flows stay incremental
+        old = self.load_manifest().get('files', {})
+        n = 0
+        for p, d in self.files().items():
+            if p in old and old[p][0] == d and os.stat(p).st_mtime_ns != old[p][1]:
+                os.utime(p, ns=(old[p][1], old[p][1]))
+                n += 1
+        return n
+
+
+def parse_digest(text: str) -> Optional[str]:
+    # last digest a build script reported with DIGEST_TAG
+    digest = None
+    for line in text.splitlines():
+        if line.startswith(DIGEST_TAG):
+            digest = line[len(DIGEST_TAG):].strip() or None
+    return digest
+
+
+def verilator_sim_cache(builder, options: Optional[dict] = None) -> SimBuildCache:
+    from litex.build.sim.verilator import core_directory
+    gateware_dir = Path(builder.gateware_dir)
+    extra_files = [p if p.is_absolute() else gateware_dir / p for p in (Path(s[0]) for s in builder.soc.platform.sources)]
+    return SimBuildCache(gateware_dir, options, extra_files=extra_files, extra_dirs=[Path(core_directory)])
+
+
+def verilator_compile(cache: SimBuildCache, build_name: str = 'sim', verbose: bool = False) -> bool:
+    # returns True when the cached model was reused
+    if cache.valid(Path('obj_dir') / 'Vsim'):
+        return True
+    r = subprocess.run(['bash', f'build_{build_name}.sh'], cwd=cache.gateware_dir,
+                       stdout=None if verbose else subprocess.PIPE, stderr=subprocess.STDOUT)
+    if r.returncode != 0:
+        out = r.stdout.decode(errors='replace') if r.stdout else ''
+        raise OSError(f'Verilator build failed with {r.returncode}\n' + '\n'.join(l for l in out.splitlines() if 'error' in l.lower()))
+    cache.save()
+    return False
+
+
+def verilator_run(cache: SimBuildCache, as_root: bool = False) -> int:
+    cmd = (['sudo'] if as_root else []) + [str(Path('obj_dir') / 'Vsim')]
+    return subprocess.call(cmd, cwd=cache.gateware_dir)
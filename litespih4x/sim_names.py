@@ -0,0 +1,108 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Verilog names of the requested pads and the CSR region layout, saved by the build so the cocotb
+# process can resolve its handles locally instead of asking the build process over rpyc per signal.
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Final, Optional
+
+import attr
+
+from migen import Record
+
+SIM_NAMES_FILE: Final = 'sim_names.json'
+SIM_NAMES_ENV: Final = 'LITESPIH4X_SIM_NAMES'
+SIM_NAMES_VERSION: Final = 1
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class SimCSRRegion:
+    origin: int
+    busword: int
+
+    @property
+    def wb_base(self) -> int:
+        return self.origin // (self.busword // 8)
+
+
+def sim_names_dict(platform, soc, ns, info: Optional[dict] = None) -> dict:
+    pads = []
+    for resource, obj in platform.constraint_manager.matched:
+        if isinstance(obj, Record):
+            sigs = {name: ns.pnd[getattr(obj, name)] for name, *_ in obj.layout}
+        else:
+            sigs = {'': ns.pnd[obj]}
+        pads.append({'name': resource[0], 'number': resource[1], 'sigs': sigs})
+    regions = {}
+    if hasattr(soc, 'csr'):
+        regions = {name: {'origin': r.origin, 'busword': r.busword} for name, r in soc.csr.regions.items()}
+    return {
+        'version': SIM_NAMES_VERSION,
+        'pads': pads,
+        'csr_regions': regions,
+        'info': info or {},
+    }
+
+
+def save_sim_names(path: Path, platform, soc, ns, info: Optional[dict] = None) -> Path:
+    path = Path(path)
+    path.write_text(json.dumps(sim_names_dict(platform, soc, ns, info), separators=(',', ':')))
+    return path
+
+
+def sim_names_for_run(gateware_dir: Path, build: bool, platform=None, soc=None, ns=None,
+                      info: Optional[dict] = None) -> Path:
+    # builder.build() only returns the namespace when it builds, a run-only pass (e.g. a shard's copy of a
+    # prebuilt sim) uses the map the build left next to the sources
+    path = Path(gateware_dir) / SIM_NAMES_FILE
+    if build:
+        return save_sim_names(path, platform, soc, ns, info)
+    if not path.is_file():
+        raise FileNotFoundError(f'{path} is missing, build the sim first (--build)')
+    return path
+
+
+class SimNames:
+    def __init__(self, d: dict):
+        if d.get('version') != SIM_NAMES_VERSION:
+            raise ValueError(f'sim name map version {d.get("version")} != {SIM_NAMES_VERSION}, rebuild the sim')
+        self.pads = d['pads']
+        self.csr_regions = {name: SimCSRRegion(**r) for name, r in d['csr_regions'].items()}
+        self.info = d['info']
+
+    @classmethod
+    def from_json(cls, s: str) -> SimNames:
+        return cls(json.loads(s))
+
+    def pad_names(self, name: str, number: Optional[int] = None) -> dict[str, str]:
+        for p in self.pads:
+            if p['name'] == name and (number is None or p['number'] == number):
+                return p['sigs']
+        raise KeyError(f'pad {name}:{number} was not requested by the SoC')
+
+    def pad(self, name: str, number: Optional[int] = None) -> str:
+        return self.pad_names(name, number)['']
+
+    def pad_handles(self, top: Any, name: str, number: Optional[int] = None) -> dict[str, Any]:
+        return {sub: getattr(top, vname) for sub, vname in self.pad_names(name, number).items()}
+
+
+def load_sim_names(path: Optional[Path] = None) -> Optional[SimNames]:
+    # explicit path, then $LITESPIH4X_SIM_NAMES, then the sim's working directory
+    candidates = [path] if path is not None else [os.environ.get(SIM_NAMES_ENV), SIM_NAMES_FILE]
+    for p in candidates:
+        if p is not None and Path(p).is_file():
+            return SimNames.from_json(Path(p).read_text())
+    return None
+
+
+def fetch_sim_names(srv, info_fn=None) -> SimNames:
+    # one round trip for the whole map when no saved file is around
+    def helper(platform, soc, ns):
+        return json.dumps(sim_names_dict(platform, soc, ns, info_fn(soc) if info_fn else None))
+    return SimNames.from_json(str(srv.root.call_on_server(helper)))
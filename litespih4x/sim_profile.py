@@ -0,0 +1,202 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Opt-in wall clock profiler for the cocotb benches. Set $LITESPIH4X_SIM_PROFILE to an output path (emu_sim.py
+# --profile does this) and the coroutines decorated with @profiled record their Python time, inclusive wall
+# and sim time and the triggers they await. Time spent in rpyc requests is recorded separately and whatever
+# is left of the wall clock is charged to the simulator. Output is folded stacks (flamegraph.pl, speedscope,
+# inferno) in microseconds of wall time plus a JSON summary. With the variable unset @profiled is a no-op.
+
+from __future__ import annotations
+
+import atexit
+import functools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Final, Optional
+
+import attr
+
+PROFILE_ENV: Final = 'LITESPIH4X_SIM_PROFILE'
+SIM_FRAME: Final = '[simulator]'
+RPYC_FRAME: Final = '[rpyc]'
+
+
+def cocotb_sim_time_ns() -> float:
+    from cocotb.utils import get_sim_time
+    return get_sim_time('ns')
+
+
+@attr.s(auto_attribs=True)
+class FrameStats:
+    calls: int = 0
+    self_s: float = 0.0
+    wall_s: float = 0.0
+    sim_ns: float = 0.0
+
+
+class _Profiled:
+    # drives the wrapped coroutine one scheduler step at a time so only the Python time of each step is charged
+    def __init__(self, prof: SimProfiler, name: str, coro):
+        self.prof = prof
+        self.name = name
+        self.coro = coro
+
+    def __await__(self):
+        prof = self.prof
+        parent = prof._stack[-1][0] if prof._stack else ()
+        path = parent + (self.name,)
+        stats = prof.frames.setdefault(path, FrameStats())
+        stats.calls += 1
+        wall0, sim0 = prof.wall(), prof.sim_time_ns()
+        val, exc = None, None
+        try:
+            while True:
+                frame = [path, 0.0]
+                prof._stack.append(frame)
+                prof._step_counted = False
+                t0 = prof.wall()
+                try:
+                    trig = self.coro.send(val) if exc is None else self.coro.throw(exc)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    dt = prof.wall() - t0
+                    prof._stack.pop()
+                    stats.self_s += dt - frame[1]
+                    if prof._stack:
+                        prof._stack[-1][1] += dt
+                # the innermost profiled coroutine counts the trigger, its callers see the same object go by
+                if not prof._step_counted:
+                    prof._step_counted = True
+                    key = type(trig).__name__
+                    prof.triggers[key] = prof.triggers.get(key, 0) + 1
+                try:
+                    val, exc = (yield trig), None
+                except BaseException as e:
+                    val, exc = None, e
+        finally:
+            stats.wall_s += prof.wall() - wall0
+            stats.sim_ns += prof.sim_time_ns() - sim0
+
+
+class SimProfiler:
+    def __init__(self, sim_time_ns: Callable[[], float] = cocotb_sim_time_ns, wall: Callable[[], float] = time.perf_counter):
+        self.sim_time_ns = sim_time_ns
+        self.wall = wall
+        self.frames: dict[tuple[str, ...], FrameStats] = {}
+        self.triggers: dict[str, int] = {}
+        self.rpyc: dict[str, FrameStats] = {}
+        self._stack: list[list] = []
+        self._step_counted = False
+        self.wall0 = wall()
+        self.sim_ns0 = None
+
+    def profiled(self, fn: Optional[Callable] = None, *, name: Optional[str] = None):
+        def deco(fn):
+            fname = name or fn.__name__
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if self.sim_ns0 is None:
+                    self.sim_ns0 = self.sim_time_ns()
+                return await _Profiled(self, fname, fn(*args, **kwargs))
+            return wrapper
+        return deco if fn is None else deco(fn)
+
+    def wrap_rpyc(self, conn):
+        # every netref access and remote call funnels through Connection.sync_request
+        try:
+            from rpyc.core import consts
+            handlers = {getattr(consts, n): n[len('HANDLE_'):].lower() for n in dir(consts) if n.startswith('HANDLE_')}
+        except ImportError:
+            handlers = {}
+        orig = conn.sync_request
+
+        @functools.wraps(orig)
+        def sync_request(handler, *args):
+            t0 = self.wall()
+            try:
+                return orig(handler, *args)
+            finally:
+                dt = self.wall() - t0
+                stats = self.rpyc.setdefault(handlers.get(handler, str(handler)), FrameStats())
+                stats.calls += 1
+                stats.self_s += dt
+                stats.wall_s += dt
+                # a request from inside a profiled coroutine isn't that coroutine's Python time
+                if self._stack:
+                    self._stack[-1][1] += dt
+        conn.sync_request = sync_request
+        return conn
+
+    def python_s(self) -> float:
+        return sum(f.self_s for f in self.frames.values())
+
+    def rpyc_s(self) -> float:
+        return sum(f.self_s for f in self.rpyc.values())
+
+    def summary(self) -> dict:
+        wall_s = self.wall() - self.wall0
+        sim_ns = self.sim_time_ns() - (self.sim_ns0 or 0.0)
+        return {
+            'wall_s': wall_s,
+            'sim_ns': sim_ns,
+            'sim_ns_per_wall_s': sim_ns / wall_s if wall_s else None,
+            'python_s': self.python_s(),
+            'rpyc_s': self.rpyc_s(),
+            'simulator_s': max(0.0, wall_s - self.python_s() - self.rpyc_s()),
+            'triggers': dict(sorted(self.triggers.items(), key=lambda kv: -kv[1])),
+            'coroutines': {';'.join(p): attr.asdict(f) for p, f in sorted(self.frames.items(), key=lambda kv: -kv[1].wall_s)},
+            'rpyc': {n: attr.asdict(f) for n, f in self.rpyc.items()},
+        }
+
+    def folded(self) -> list[str]:
+        # self time per stack, so each frame's width in the graph is its inclusive Python time
+        lines = [f'{";".join(p)} {round(f.self_s * 1e6)}' for p, f in self.frames.items()]
+        lines += [f'{RPYC_FRAME};{n} {round(f.self_s * 1e6)}' for n, f in self.rpyc.items()]
+        lines.append(f'{SIM_FRAME} {round(self.summary()["simulator_s"] * 1e6)}')
+        return [l for l in lines if not l.endswith(' 0')]
+
+    def used(self) -> bool:
+        return bool(self.frames or self.rpyc)
+
+    def write(self, path: Path) -> Path:
+        path = Path(path)
+        path.write_text('\n'.join(self.folded()) + '\n')
+        path.with_suffix(path.suffix + '.json').write_text(json.dumps(self.summary(), indent=2) + '\n')
+        return path
+
+
+_profiler: Optional[SimProfiler] = None
+
+
+def enable_profiling(path: Path, **kwargs) -> SimProfiler:
+    # the simulator finalizes the embedded interpreter when it exits, atexit writes the profile then. The
+    # build process imports the bench too, it mustn't clobber the sim's profile with an empty one.
+    global _profiler
+    prof = _profiler = SimProfiler(**kwargs)
+    atexit.register(lambda: prof.used() and prof.write(Path(path)))
+    return prof
+
+
+def active_profiler() -> Optional[SimProfiler]:
+    global _profiler
+    if _profiler is None and os.environ.get(PROFILE_ENV):
+        enable_profiling(Path(os.environ[PROFILE_ENV]))
+    return _profiler
+
+
+def profiled(fn: Optional[Callable] = None, *, name: Optional[str] = None):
+    # decorator for async functions, returns them untouched when profiling is off
+    prof = active_profiler()
+    if prof is None:
+        return (lambda f: f) if fn is None else fn
+    return prof.profiled(fn, name=name)
+
+
+def profile_rpyc(conn: Any) -> Any:
+    prof = active_profiler()
+    return conn if prof is None else prof.wrap_rpyc(conn)
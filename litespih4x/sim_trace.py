@@ -0,0 +1,194 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Waveform capture limited to chosen submodules and to windows around interesting events. A TraceWindow
+# opens on the rising edge of any of its events (or while force is held, e.g. from cocotb) and closes
+# `cycles` sys clocks after the last one. Scopes are attribute paths from the SoC ("spi_emu",
+# "flash_dram_port") to Modules, Records or Signals. The cocotb/Icarus flow gets both from ScopedVCDDumper,
+# a $dumpvars/$dumpon/$dumpoff block. Verilator's flat netlist can't be scoped by $dumpvars, there
+# filter_verilog_tracing fences the other declarations with tracing_off metacomments and the window
+# drives the LiteX sim_trace pin through add_windowed_debug.
+
+from __future__ import annotations
+
+import functools
+import re
+from pathlib import Path
+from typing import Any, Final, Iterable, Mapping, Optional, Sequence
+
+from migen import *
+from migen.fhdl.specials import Special, SPECIAL_INPUT
+from migen.fhdl.tools import list_signals
+
+from .argtypes import parse_int
+
+TRACE_EVENTS: Final = ('bad_cmd_err', 'underrun', 'addr=<addr>[/<mask>]')
+
+
+class TraceWindow(Module):
+    def __init__(self, events: Mapping[str, Any], cycles: int = 256):
+        if cycles < 1:
+            raise ValueError('cycles must be >= 1')
+        self.events = dict(events)
+        self.cycles = cycles
+        self.force = Signal()
+        self.active = Signal()
+        # events that opened or extended the current window, bit i is the i-th event
+        self.cause = cause = Signal(max(len(self.events), 1))
+        self.remaining = remaining = Signal(max=cycles + 1)
+
+        if self.events:
+            ev = Signal(len(self.events))
+            ev_d = Signal(len(self.events))
+            rise = Signal(len(self.events))
+            self.comb += [
+                ev.eq(Cat(*self.events.values())),
+                rise.eq(ev & ~ev_d),
+            ]
+            self.sync += [
+                ev_d.eq(ev),
+                If(rise != 0,
+                    remaining.eq(cycles),
+                    If(remaining == 0,
+                        cause.eq(rise),
+                    ).Else(
+                        cause.eq(cause | rise),
+                    )
+                ).Elif(remaining != 0,
+                    remaining.eq(remaining - 1),
+                )
+            ]
+        self.comb += self.active.eq(self.force | (remaining != 0))
+
+
+def emu_trace_events(emu: Module, specs: Iterable[str]) -> dict[str, Any]:
+    # specs from TRACE_EVENTS, underrun and address matching need FlashEmuLite
+    events = {}
+    for spec in specs:
+        name, _, arg = spec.partition('=')
+        if name == 'bad_cmd_err':
+            events[name] = emu.bad_cmd_err
+        elif name == 'underrun':
+            if not hasattr(emu, 'underrun'):
+                raise ValueError(f'{type(emu).__name__} has no prefetch underrun flag')
+            events[name] = emu.underrun
+        elif name == 'addr':
+            if not hasattr(emu, 'txn_addr'):
+                raise ValueError(f'{type(emu).__name__} does not latch transaction addresses')
+            addr, _, mask = arg.partition('/')
+            addr, mask = parse_int(addr), parse_int(mask) if mask else 0xffffff
+            events[spec] = emu.txn_has_addr & ((emu.txn_addr & mask) == (addr & mask))
+        else:
+            raise ValueError(f'unknown trace event {spec!r}, expected one of {", ".join(TRACE_EVENTS)}')
+    return events
+
+
+def resolve_scope(root: Any, path: str) -> Any:
+    try:
+        return functools.reduce(getattr, path.split('.'), root)
+    except AttributeError:
+        raise ValueError(f'trace scope {path!r} not found on {type(root).__name__}') from None
+
+
+def scope_signals(obj: Any) -> set[Signal]:
+    if isinstance(obj, Signal):
+        return {obj}
+    if isinstance(obj, Record):
+        return set(obj.flatten())
+    if isinstance(obj, Module):
+        # once the design is finalized this is the module's fragment with its submodules merged in
+        frag = obj._fragment if obj.get_fragment_called else obj.get_fragment()
+        sigs = set(list_signals(frag.comb))
+        for stmts in frag.sync.values():
+            sigs |= list_signals(stmts)
+        for special in frag.specials:
+            sigs |= special.list_ios(True, True, True)
+        return sigs
+    # plain containers of Signals/Records, e.g. a LiteDRAM native port
+    sigs = set()
+    for v in vars(obj).values():
+        if isinstance(v, (Signal, Record)):
+            sigs |= scope_signals(v)
+    return sigs
+
+
+def scope_signal_names(ns, scopes: Iterable[Any]) -> list[str]:
+    sigs = set()
+    for s in scopes:
+        sigs |= scope_signals(s)
+    return sorted(ns.pnd[s] for s in sigs if s in ns.pnd)
+
+
+class ScopedVCDDumper(Special):
+    def __init__(self, filename: str = 'dump.vcd', scopes: Sequence[Any] = (), window: Optional[Signal] = None):
+        Special.__init__(self)
+        self.filename = filename
+        self.scopes = list(scopes)
+        self.window = window
+
+    def iter_expressions(self):
+        if self.window is not None:
+            yield self, 'window', SPECIAL_INPUT
+
+    @staticmethod
+    def emit_verilog(dumper, ns, add_data_file):
+        names = scope_signal_names(ns, dumper.scopes)
+        r = 'initial begin\n'
+        r += f'\t$dumpfile("{dumper.filename}");\n'
+        if dumper.scopes:
+            r += '\t$dumpvars(0, ' + ', '.join(names) + ');\n'
+        else:
+            r += '\t$dumpvars;\n'
+        if dumper.window is not None:
+            window = ns.get_name(dumper.window)
+            r += '\t$dumpoff;\nend\n'
+            r += f'always @(posedge {window}) $dumpon;\n'
+            r += f'always @(negedge {window}) $dumpoff;\n\n'
+        else:
+            r += 'end\n\n'
+        return r
+
+
+_DECL_RE: Final = re.compile(r'^\s*(?:\(\*.*?\*\)\s*)?(?:reg|wire)\b(?:\s+signed)?\s*(?:\[[^\]]*\])?\s*(\\?[\w$]+)')
+_TRACING_OFF: Final = '/*verilator tracing_off*/'
+_TRACING_ON: Final = '/*verilator tracing_on*/'
+
+
+def filter_verilog_tracing(path: Path, keep: Iterable[str]) -> int:
+    # returns the number of declarations hidden from the Verilator tracer, ports are always traced
+    keep = set(keep)
+    if not keep:
+        raise ValueError('no signals to keep, check the trace scopes')
+    path = Path(path)
+    out = []
+    tracing = True
+    hidden = 0
+    for line in path.read_text().splitlines():
+        if line.strip() in (_TRACING_OFF, _TRACING_ON):
+            continue
+        m = _DECL_RE.match(line)
+        if m:
+            want = m.group(1) in keep
+            hidden += not want
+            if want != tracing:
+                out.append(_TRACING_ON if want else _TRACING_OFF)
+                tracing = want
+        elif not tracing and not line.strip():
+            out.append(_TRACING_ON)
+            tracing = True
+        out.append(line)
+    if not tracing:
+        out.append(_TRACING_ON)
+    path.write_text('\n'.join(out) + '\n')
+    return hidden
+
+
+def add_windowed_debug(platform, module: Module, window: Signal, reset: int = 0):
+    # SimPlatform.add_debug with the window ORed into the Verilator tracer's enable
+    from litex.build.sim.platform import SimTrace, SimMarker, SimFinish
+    trace_csr = Signal()
+    module.submodules.sim_trace = SimTrace(trace_csr, reset=reset)
+    module.submodules.sim_marker = SimMarker()
+    module.submodules.sim_finish = SimFinish()
+    module.comb += platform.trace.eq(trace_csr | window)
+    platform.trace = None
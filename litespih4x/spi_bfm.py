@@ -0,0 +1,269 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Sim-only single lane mode 0 SPI master. The bench pushes a whole frame into the TX FIFO, strobes start
+# and pops the response from the RX FIFO, so the cocotb side costs a couple of simulator round trips per
+# FIFO word instead of several per SCLK edge.
+
+from __future__ import annotations
+
+from migen import *
+from migen.genlib.fifo import SyncFIFO
+
+from litex.build.generic_platform import Subsignal, Pins
+
+from typing import Final, Union
+
+import cocotb
+from cocotb.triggers import RisingEdge, FallingEdge, ReadOnly
+
+from .emu import SPISigs, QSPISigs, SigType
+
+LEN_BITS: Final = 24
+
+
+def spi_bfm_ctrl_layout(word_bytes: int) -> list:
+    return [
+        ("tx_data",  8*word_bytes), # first byte on the wire in the LSBs
+        ("tx_valid", 1),
+        ("tx_ready", 1),
+        ("rx_data",  8*word_bytes),
+        ("rx_valid", 1),
+        ("rx_ready", 1),
+        ("tx_len",   LEN_BITS),
+        ("rx_len",   LEN_BITS),
+        ("rx_wm",    LEN_BITS), # rx_avail threshold in words
+        ("rx_avail", 1),
+        ("start",    1),
+        ("busy",     1),
+    ]
+
+
+def spi_bfm_io(word_bytes: int = 16) -> list:
+    return [
+        ("spi_bfm", 0,
+            *[Subsignal(name, Pins(nbits)) for name, nbits in spi_bfm_ctrl_layout(word_bytes)]
+        ),
+    ]
+
+
+class SPIMasterBFM(Module):
+    def __init__(self, pads: Union[SPISigs, QSPISigs], ctrl: Record, word_bytes: int = 16, fifo_depth: int = 256,
+                 div: int = 2):
+        if div < 1:
+            raise ValueError('div must be >= 1')
+        self.word_bytes = W = word_bytes
+        self.fifo_depth = fifo_depth
+
+        self.submodules.tx_fifo = tx_fifo = SyncFIFO(8*W, fifo_depth)
+        self.submodules.rx_fifo = rx_fifo = SyncFIFO(8*W, fifo_depth)
+        self.comb += [
+            tx_fifo.din.eq(ctrl.tx_data),
+            tx_fifo.we.eq(ctrl.tx_valid),
+            ctrl.tx_ready.eq(tx_fifo.writable),
+            ctrl.rx_data.eq(rx_fifo.dout),
+            ctrl.rx_valid.eq(rx_fifo.readable),
+            rx_fifo.re.eq(ctrl.rx_ready),
+            ctrl.rx_avail.eq((rx_fifo.level >= ctrl.rx_wm) & (ctrl.rx_wm != 0)),
+        ]
+
+        # the BFM drives its ends of the shared nets, the emulator's tristates stay in place
+        self.si_ts = si_ts = TSTriple()
+        self.so_ts = so_ts = TSTriple()
+        self.specials += si_ts.get_tristate(pads.si)
+        self.specials += so_ts.get_tristate(pads.so)
+
+        sclk = Signal()
+        csn = Signal(reset=1)
+        self.comb += [
+            pads.sclk.eq(sclk),
+            pads.csn.eq(csn),
+            si_ts.oe.eq(1),
+            so_ts.oe.eq(0),
+        ]
+
+        tx_left = Signal(LEN_BITS)
+        rx_left = Signal(LEN_BITS)
+        tx_idx = Signal(max=W)
+        rx_idx = Signal(max=W)
+        sreg = Signal(8)
+        rreg = Signal(8)
+        rword = Signal(8*W)
+        rx_phase = Signal()
+        bit_cnt = Signal(3)
+        div_cnt = Signal(max=div+1)
+        tx_byte = Array(tx_fifo.dout[8*i:8*(i+1)] for i in range(W))[tx_idx]
+
+        self.comb += si_ts.o.eq(sreg[7])
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(ctrl.start,
+                NextValue(tx_left, ctrl.tx_len),
+                NextValue(rx_left, ctrl.rx_len),
+                NextValue(tx_idx, 0),
+                NextValue(rx_idx, 0),
+                NextValue(csn, 0),
+                NextValue(div_cnt, div - 1),
+                NextState("CSN_SETUP"),
+            )
+        )
+        fsm.act("CSN_SETUP",
+            ctrl.busy.eq(1),
+            NextValue(div_cnt, div_cnt - 1),
+            If(div_cnt == 0,
+                NextState("LOAD"),
+            )
+        )
+        fsm.act("LOAD",
+            ctrl.busy.eq(1),
+            NextValue(bit_cnt, 0),
+            If(tx_left != 0,
+                # stretches SCLK low if the bench has not pushed the rest of the frame yet
+                If(tx_fifo.readable,
+                    NextValue(sreg, tx_byte),
+                    NextValue(rx_phase, 0),
+                    NextValue(tx_left, tx_left - 1),
+                    NextValue(tx_idx, tx_idx + 1),
+                    If((tx_idx == W - 1) | (tx_left == 1),
+                        tx_fifo.re.eq(1),
+                        NextValue(tx_idx, 0),
+                    ),
+                    NextValue(div_cnt, div - 1),
+                    NextState("SCLK_LOW"),
+                )
+            ).Elif(rx_left != 0,
+                NextValue(sreg, 0),
+                NextValue(rx_phase, 1),
+                NextValue(div_cnt, div - 1),
+                NextState("SCLK_LOW"),
+            ).Else(
+                NextValue(div_cnt, div - 1),
+                NextState("CSN_HOLD"),
+            )
+        )
+        fsm.act("SCLK_LOW",
+            ctrl.busy.eq(1),
+            NextValue(div_cnt, div_cnt - 1),
+            If(div_cnt == 0,
+                NextValue(sclk, 1),
+                NextValue(div_cnt, div - 1),
+                NextState("SCLK_HIGH"),
+            )
+        )
+        fsm.act("SCLK_HIGH",
+            ctrl.busy.eq(1),
+            NextValue(div_cnt, div_cnt - 1),
+            If(div_cnt == 0,
+                # SO changes on the falling edge, sample it at the end of the high phase
+                NextValue(rreg, Cat(so_ts.i, rreg[:7])),
+                NextValue(sreg, Cat(C(0, 1), sreg[:7])),
+                NextValue(sclk, 0),
+                NextValue(bit_cnt, bit_cnt + 1),
+                NextValue(div_cnt, div - 1),
+                If(bit_cnt == 7,
+                    If(rx_phase,
+                        NextState("RX_BYTE"),
+                    ).Else(
+                        NextState("LOAD"),
+                    )
+                ).Else(
+                    NextState("SCLK_LOW"),
+                )
+            )
+        )
+        fsm.act("RX_BYTE",
+            ctrl.busy.eq(1),
+            Case(rx_idx, {i: NextValue(rword[8*i:8*(i+1)], rreg) for i in range(W)}),
+            NextValue(rx_left, rx_left - 1),
+            NextValue(rx_idx, rx_idx + 1),
+            If((rx_idx == W - 1) | (rx_left == 1),
+                NextValue(rx_idx, 0),
+                NextState("RX_PUSH"),
+            ).Else(
+                NextState("LOAD"),
+            )
+        )
+        fsm.act("RX_PUSH",
+            ctrl.busy.eq(1),
+            rx_fifo.din.eq(rword),
+            # a full RX FIFO stretches SCLK low until the bench pops
+            If(rx_fifo.writable,
+                rx_fifo.we.eq(1),
+                NextValue(rword, 0),
+                NextState("LOAD"),
+            )
+        )
+        fsm.act("CSN_HOLD",
+            ctrl.busy.eq(1),
+            NextValue(div_cnt, div_cnt - 1),
+            If(div_cnt == 0,
+                NextValue(csn, 1),
+                NextValue(div_cnt, 2*div - 1),
+                NextState("CSN_IDLE"),
+            )
+        )
+        fsm.act("CSN_IDLE",
+            ctrl.busy.eq(1),
+            NextValue(div_cnt, div_cnt - 1),
+            If(div_cnt == 0,
+                NextState("IDLE"),
+            )
+        )
+
+
+# cocotb side of SPIMasterBFM, the handles come from the top level spi_bfm pads
+class SPIMasterBFMDriver:
+    def __init__(self, clk: SigType, ctrl: dict, word_bytes: int = 16, fifo_depth: int = 256):
+        self.clk = clk
+        self.c = ctrl
+        self.word_bytes = word_bytes
+        self.fifo_depth = fifo_depth
+
+    def idle_lines(self):
+        c = self.c
+        for n in ('tx_valid', 'rx_ready', 'start', 'rx_wm'):
+            c[n].value = 0
+
+    async def xfer(self, tx: bytes, nrx: int = 0) -> bytes:
+        c = self.c
+        W = self.word_bytes
+        tx_words = [tx[i:i+W] for i in range(0, len(tx), W)]
+        if len(tx_words) > self.fifo_depth:
+            raise ValueError(f'tx frame of {len(tx)} bytes does not fit in the {self.fifo_depth * W} byte TX FIFO')
+
+        # whole TX frame first, the BFM never has to wait on us
+        c['tx_valid'].value = 1
+        for w in tx_words:
+            c['tx_data'].value = int.from_bytes(w, 'little')
+            await RisingEdge(self.clk)
+        c['tx_valid'].value = 0
+        c['tx_len'].value = len(tx)
+        c['rx_len'].value = nrx
+        c['start'].value = 1
+        await RisingEdge(self.clk)
+        c['start'].value = 0
+
+        rx = bytearray()
+        nrx_words = (nrx + W - 1) // W
+        while nrx_words:
+            n = min(nrx_words, self.fifo_depth)
+            c['rx_wm'].value = n
+            await ReadOnly()
+            if not c['rx_avail'].value:
+                await RisingEdge(c['rx_avail'])
+            await RisingEdge(self.clk)
+            c['rx_wm'].value = 0
+            c['rx_ready'].value = 1
+            for _ in range(n):
+                await ReadOnly()
+                rx += int(c['rx_data'].value).to_bytes(W, 'little')
+                await RisingEdge(self.clk)
+            c['rx_ready'].value = 0
+            nrx_words -= n
+
+        await ReadOnly()
+        if c['busy'].value:
+            await FallingEdge(c['busy'])
+        await RisingEdge(self.clk)
+        return bytes(rx[:nrx])
@@ -0,0 +1,196 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Pipelined asyncio client for the sim's serial2udp SPI bridge. A datagram is one CS# framed transaction and
+# the reply carries the MISO byte clocked for every MOSI byte, with no header of its own. Requests are still
+# numbered and matched: a READ can clock out extra bytes harmlessly, so every in-flight READ gets a distinct
+# number of trailing pad bytes and its reply is found by length. Large reads are split into frames, up to
+# `window` frames are in flight and a frame whose reply doesn't show up within `timeout` is resent.
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable, Final, Optional
+
+import attr
+
+DEFAULT_BRIDGE: Final = ('127.0.0.1', 2443)
+OP_READ: Final = 0x03
+OP_READ4B: Final = 0x13
+OP_RDID: Final = 0x9f
+
+
+@attr.s(auto_attribs=True)
+class BridgeStats:
+    requests: int = 0
+    retries: int = 0
+    unmatched: int = 0 # replies nothing was waiting for, late duplicates of retried requests
+    bytes_read: int = 0
+    max_in_flight: int = 0
+
+
+@attr.s(auto_attribs=True)
+class _Pending:
+    seq: int
+    datagram: bytes
+    reply: asyncio.Future
+    retried: bool = False
+
+
+class _BridgeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client: SPIBridgeClient):
+        self.client = client
+
+    def datagram_received(self, data: bytes, addr):
+        self.client._reply(data)
+
+    def error_received(self, exc: Exception):
+        # ICMP port unreachable while the sim is still starting up, the retry covers it
+        pass
+
+
+class SPIBridgeClient:
+    def __init__(self, addr: tuple[str, int] = DEFAULT_BRIDGE, window: int = 8, max_frame: int = 1024,
+                 timeout: float = 1.0, retries: int = 5):
+        if window < 1 or max_frame < 1:
+            raise ValueError('window and max_frame must be >= 1')
+        self.addr = addr
+        self.window = window
+        self.max_frame = max_frame
+        self.timeout = timeout
+        self.retries = retries
+        self.stats = BridgeStats()
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._pending: dict[int, _Pending] = {} # reply length -> request
+        self._quarantine: dict[int, float] = {} # reply length -> when a late duplicate can no longer arrive
+        self._changed: Optional[asyncio.Condition] = None
+        self._exclusive = 0 # xfers waiting or in flight
+        self._seq = 0
+
+    async def open(self) -> SPIBridgeClient:
+        loop = asyncio.get_running_loop()
+        self._changed = asyncio.Condition()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: _BridgeProtocol(self), remote_addr=self.addr)
+        return self
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    async def __aenter__(self) -> SPIBridgeClient:
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _reply(self, data: bytes):
+        p = self._pending.pop(len(data), None)
+        if p is None or p.reply.done():
+            self.stats.unmatched += 1
+            return
+        if p.retried:
+            # the first send's reply may still be in the bridge, don't hand its length out for a while
+            self._quarantine[len(data)] = time.monotonic() + self.timeout * (self.retries + 1)
+        p.reply.set_result(data)
+
+    def _free(self, n: int) -> bool:
+        exp = self._quarantine.get(n)
+        if exp is not None and exp <= time.monotonic():
+            del self._quarantine[n]
+            exp = None
+        return n not in self._pending and exp is None
+
+    async def _claim(self, base: int, max_pad: int, exclusive: bool) -> int:
+        # pad bytes giving a reply length no other request in flight (or recently retried) uses; exclusive
+        # requests wait for the bridge to drain and hold off new ones until they are done
+        async with self._changed:
+            while True:
+                if exclusive:
+                    ready = not self._pending
+                else:
+                    ready = len(self._pending) < self.window and not self._exclusive
+                if ready:
+                    for pad in range(max_pad + 1):
+                        if self._free(base + pad):
+                            return pad
+                # quarantine expiry isn't signalled, poll on it
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self.timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _transact(self, head: bytes, n: int, pad_ok: bool) -> bytes:
+        # head + n clocked bytes, returns the n bytes clocked back after head
+        if self._transport is None:
+            raise ValueError('client is not open')
+        exclusive = not pad_ok
+        if exclusive:
+            # counted while still waiting so READs started meanwhile queue behind it
+            self._exclusive += 1
+        p = None
+        try:
+            pad = await self._claim(len(head) + n, 2 * self.window if pad_ok else 0, exclusive)
+            datagram = head + bytes(n + pad)
+            loop = asyncio.get_running_loop()
+            p = _Pending(self._seq, datagram, loop.create_future())
+            self._seq += 1
+            self._pending[len(datagram)] = p
+            self.stats.requests += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, len(self._pending))
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.stats.retries += 1
+                    p.retried = True
+                self._transport.sendto(datagram)
+                try:
+                    rsp = await asyncio.wait_for(asyncio.shield(p.reply), self.timeout)
+                    return rsp[len(head):len(head) + n]
+                except asyncio.TimeoutError:
+                    continue
+            raise TimeoutError(f'no reply to request {p.seq} ({len(datagram)} bytes) after {self.retries + 1} tries')
+        finally:
+            if exclusive:
+                self._exclusive -= 1
+            if p is not None and self._pending.get(len(p.datagram)) is p:
+                del self._pending[len(p.datagram)]
+                # given up on (or cancelled), its reply may still be on the way
+                self._quarantine[len(p.datagram)] = time.monotonic() + self.timeout * (self.retries + 1)
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def xfer(self, tx: bytes, nrx: int = 0) -> bytes:
+        # arbitrary transaction (writes, erases), runs alone and unpadded, returns the nrx bytes after tx
+        return await self._transact(bytes(tx), nrx, pad_ok=False)
+
+    async def idcode(self) -> int:
+        return int.from_bytes(await self.xfer(bytes([OP_RDID]), 3), 'big')
+
+    async def read(self, addr: int, size: int, opcode: Optional[int] = None, addr_bytes: int = 3, dummy: int = 0,
+                   progress: Optional[Callable[[int], None]] = None) -> bytes:
+        # dummy is in bytes, progress gets the byte count of every finished frame
+        if addr_bytes not in (3, 4):
+            raise ValueError('addr_bytes must be 3 or 4')
+        if opcode is None:
+            opcode = OP_READ if addr_bytes == 3 else OP_READ4B
+        out = bytearray(size)
+        offsets = iter(range(0, size, self.max_frame))
+
+        async def worker():
+            # offsets is shared, each worker keeps one frame in flight
+            for off in offsets:
+                n = min(self.max_frame, size - off)
+                head = bytes([opcode]) + ((addr + off) % 2**(8 * addr_bytes)).to_bytes(addr_bytes, 'big') + bytes(dummy)
+                out[off:off + n] = await self._transact(head, n, pad_ok=True)
+                self.stats.bytes_read += n
+                if progress is not None:
+                    progress(n)
+
+        tasks = [asyncio.ensure_future(worker()) for _ in range(min(self.window, -(-size // self.max_frame)))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+        return bytes(out)
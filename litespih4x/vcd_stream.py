@@ -0,0 +1,344 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Streaming VCD reader and SPI/JTAG decoders. The reader yields one timestamp's worth of value changes at
+# a time and the decoders are generators over that stream, so memory stays bounded by the longest
+# transaction whatever the trace size. Edges are found by comparing against the previous timestamp and
+# data is sampled from the previous timestamp too, i.e. just before the edge.
+
+from __future__ import annotations
+
+import gzip
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Final, IO, Iterable, Iterator, Optional, Union
+
+import attr
+
+from .macronix_ref import CMDS
+
+TIME_UNITS_PS: Final = {'s': 10**12, 'ms': 10**9, 'us': 10**6, 'ns': 10**3, 'ps': 1, 'fs': 1e-3}
+
+Value = Union[int, float, str, None] # None for any x/z bit
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class VCDVar:
+    ident: str
+    name: str # hierarchical, scopes joined with '.'
+    width: int
+    kind: str
+
+
+@attr.s(auto_attribs=True)
+class VCDStep:
+    time: int # in timescale units
+    changes: dict[str, Value] # ident -> new value
+
+
+def find_name(names: Iterable[str], name: str) -> str:
+    # exact hierarchical name, or a unique suffix of one (pad names without the top scope)
+    names = list(names)
+    if name in names:
+        return name
+    hits = [n for n in names if n.endswith('.' + name) or n.endswith('_' + name)]
+    exact = [n for n in hits if n.rsplit('.', 1)[-1] == name]
+    hits = exact or hits
+    if len(hits) != 1:
+        raise KeyError(f'{name!r} matches {len(hits)} signals' + (f': {", ".join(hits[:8])}' if hits else ''))
+    return hits[0]
+
+
+def _parse_value(v: str) -> Value:
+    try:
+        return int(v, 2)
+    except ValueError:
+        return None
+
+
+class VCDReader:
+    def __init__(self, f: Union[str, Path, IO[str], Iterable[str]]):
+        self._proc = None
+        if isinstance(f, (str, Path)):
+            path = Path(f)
+            if path.suffix == '.fst':
+                # GTKWave's converter streams VCD text, no need to expand the FST on disk
+                if shutil.which('fst2vcd') is None:
+                    raise ValueError('reading FST traces needs fst2vcd from GTKWave on $PATH')
+                self._proc = subprocess.Popen(['fst2vcd', str(path)], stdout=subprocess.PIPE, text=True)
+                f = self._proc.stdout
+            elif path.suffix == '.gz':
+                f = gzip.open(path, 'rt')
+            else:
+                f = open(path)
+        self.f = f
+        self.vars: dict[str, list[VCDVar]] = {} # an ident can be aliased by several names
+        self.by_name: dict[str, VCDVar] = {}
+        self.timescale_ps: float = 1
+        self._tokens = self._token_iter()
+        self._read_header()
+
+    def _token_iter(self) -> Iterator[str]:
+        for line in self.f:
+            yield from line.split()
+
+    def _until_end(self) -> list[str]:
+        toks = []
+        for t in self._tokens:
+            if t == '$end':
+                return toks
+            toks.append(t)
+        raise ValueError('VCD ended inside a header section')
+
+    def _read_header(self):
+        scope = []
+        for t in self._tokens:
+            if t == '$enddefinitions':
+                self._until_end()
+                return
+            elif t == '$scope':
+                toks = self._until_end()
+                scope.append(toks[-1])
+            elif t == '$upscope':
+                self._until_end()
+                scope.pop()
+            elif t == '$var':
+                kind, width, ident, ref, *bitsel = self._until_end()
+                # keep single bit selects (bus[3]) in the name, drop the range of whole vectors
+                if bitsel and ':' not in bitsel[0]:
+                    ref += bitsel[0]
+                var = VCDVar(ident, '.'.join(scope + [ref]), int(width), kind)
+                self.vars.setdefault(ident, []).append(var)
+                self.by_name[var.name] = var
+            elif t == '$timescale':
+                ts = ''.join(self._until_end())
+                num = ts.rstrip('munpfs')
+                self.timescale_ps = int(num) * TIME_UNITS_PS[ts[len(num):]]
+            elif t.startswith('$'):
+                self._until_end()
+        raise ValueError('VCD has no $enddefinitions')
+
+    def find(self, name: str) -> VCDVar:
+        return self.by_name[find_name(self.by_name, name)]
+
+    def steps(self, idents: Optional[Iterable[str]] = None) -> Iterator[VCDStep]:
+        # one VCDStep per timestamp with any change to the selected idents (all if None)
+        wanted = None if idents is None else set(idents)
+        time = 0
+        changes: dict[str, Value] = {}
+        toks = self._tokens
+        for t in toks:
+            c = t[0]
+            if c == '#':
+                if changes:
+                    yield VCDStep(time, changes)
+                    changes = {}
+                time = int(t[1:])
+            elif c in '01xzXZ':
+                ident = t[1:]
+                if wanted is None or ident in wanted:
+                    changes[ident] = int(c) if c in '01' else None
+            elif c in 'bB':
+                ident = next(toks)
+                if wanted is None or ident in wanted:
+                    changes[ident] = _parse_value(t[1:])
+            elif c in 'rR':
+                ident = next(toks)
+                if wanted is None or ident in wanted:
+                    changes[ident] = float(t[1:])
+            elif c in 'sS':
+                ident = next(toks)
+                if wanted is None or ident in wanted:
+                    changes[ident] = t[1:]
+            # $dumpvars/$dumpon/$dumpoff/$end and $comment bodies carry nothing we need
+            elif t == '$comment':
+                self._until_end()
+        if changes:
+            yield VCDStep(time, changes)
+
+    def close(self):
+        # any iterable of lines works as a source, e.g. a generator following a growing dump
+        close = getattr(self.f, 'close', None)
+        if close is not None:
+            close()
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def track(steps: Iterable[VCDStep], signals: dict[str, str]) -> Iterator[tuple[int, dict, dict]]:
+    # (time, values before this timestamp, values after) keyed by the caller's names for the idents
+    ident2names: dict[str, list[str]] = {}
+    for name, ident in signals.items():
+        ident2names.setdefault(ident, []).append(name)
+    cur: dict[str, Value] = {name: None for name in signals}
+    for step in steps:
+        prev = dict(cur)
+        for ident, v in step.changes.items():
+            for name in ident2names.get(ident, ()):
+                cur[name] = v
+        yield step.time, prev, cur
+
+
+def _bits_to_bytes(bits: list[int]) -> bytes:
+    return bytes(int(''.join(map(str, bits[i:i+8])), 2) for i in range(0, len(bits) - 7, 8))
+
+
+@attr.s(auto_attribs=True)
+class SPITransaction:
+    start: int # CS# fall, in timescale units
+    end: int # CS# rise
+    mosi: bytes
+    miso: bytes
+    nclk: int
+    first_clk: Optional[int] = None
+    min_clk_period: Optional[int] = None
+    addr_bytes: int = 3
+    complete: bool = True # False when the trace ended with CS# still asserted
+
+    @property
+    def opcode(self) -> Optional[int]:
+        return self.mosi[0] if self.mosi else None
+
+    @property
+    def name(self) -> str:
+        info = CMDS.get(self.opcode)
+        return info.name if info else f'0x{self.opcode:02x}' if self.opcode is not None else 'empty'
+
+    @property
+    def addr(self) -> Optional[int]:
+        info = CMDS.get(self.opcode)
+        if info is None or info.addr is None or len(self.mosi) < 1 + self.addr_bytes:
+            return None
+        return int.from_bytes(self.mosi[1:1 + self.addr_bytes], 'big')
+
+    @property
+    def data(self) -> bytes:
+        # bytes after opcode, address and dummy cycles: MISO for reads, MOSI for writes
+        info = CMDS.get(self.opcode)
+        if info is None:
+            return self.miso[1:]
+        hdr = 1 + (self.addr_bytes if info.addr is not None else 0) + info.dummy
+        if info.kind in ('pp', 'wrsr'):
+            return self.mosi[hdr:]
+        return self.miso[hdr:]
+
+
+def spi_transactions(steps: Iterable[VCDStep], sclk: str, csn: str, mosi: str, miso: str) -> Iterator[SPITransaction]:
+    # single lane mode 0/3, both lines sampled on SCLK rising; EN4B/EX4B switch the address width
+    four_byte = False
+    in_txn = False
+    start = first_clk = last_clk = min_per = None
+    mosi_bits: list[int] = []
+    miso_bits: list[int] = []
+    def finish(end, complete=True):
+        nonlocal four_byte
+        txn = SPITransaction(start, end, _bits_to_bytes(mosi_bits), _bits_to_bytes(miso_bits), len(mosi_bits),
+                             first_clk, min_per, 4 if four_byte else 3, complete)
+        info = CMDS.get(txn.opcode)
+        if info is not None:
+            if info.addr not in (None, 0):
+                txn.addr_bytes = info.addr
+            if info.kind == 'en4b':
+                four_byte = True
+            elif info.kind in ('ex4b', 'rst'):
+                four_byte = False
+        return txn
+
+    time = 0
+    for time, prev, cur in track(steps, {'sclk': sclk, 'csn': csn, 'mosi': mosi, 'miso': miso}):
+        if prev['csn'] != 0 and cur['csn'] == 0:
+            in_txn = True
+            start, first_clk, last_clk, min_per = time, None, None, None
+            mosi_bits, miso_bits = [], []
+        elif in_txn and prev['sclk'] == 0 and cur['sclk'] == 1 and prev['csn'] == 0:
+            mosi_bits.append(prev['mosi'] or 0)
+            miso_bits.append(prev['miso'] or 0)
+            if first_clk is None:
+                first_clk = time
+            elif min_per is None or time - last_clk < min_per:
+                min_per = time - last_clk
+            last_clk = time
+        if in_txn and cur['csn'] == 1:
+            in_txn = False
+            yield finish(time)
+    if in_txn:
+        yield finish(time, complete=False)
+
+
+# IEEE 1149.1 TAP, next state for TMS=0/1
+TAP_NEXT: Final = {
+    'TEST_LOGIC_RESET': ('RUN_TEST_IDLE', 'TEST_LOGIC_RESET'),
+    'RUN_TEST_IDLE': ('RUN_TEST_IDLE', 'SELECT_DR_SCAN'),
+    'SELECT_DR_SCAN': ('CAPTURE_DR', 'SELECT_IR_SCAN'),
+    'CAPTURE_DR': ('SHIFT_DR', 'EXIT1_DR'),
+    'SHIFT_DR': ('SHIFT_DR', 'EXIT1_DR'),
+    'EXIT1_DR': ('PAUSE_DR', 'UPDATE_DR'),
+    'PAUSE_DR': ('PAUSE_DR', 'EXIT2_DR'),
+    'EXIT2_DR': ('SHIFT_DR', 'UPDATE_DR'),
+    'UPDATE_DR': ('RUN_TEST_IDLE', 'SELECT_DR_SCAN'),
+    'SELECT_IR_SCAN': ('CAPTURE_IR', 'TEST_LOGIC_RESET'),
+    'CAPTURE_IR': ('SHIFT_IR', 'EXIT1_IR'),
+    'SHIFT_IR': ('SHIFT_IR', 'EXIT1_IR'),
+    'EXIT1_IR': ('PAUSE_IR', 'UPDATE_IR'),
+    'PAUSE_IR': ('PAUSE_IR', 'EXIT2_IR'),
+    'EXIT2_IR': ('SHIFT_IR', 'UPDATE_IR'),
+    'UPDATE_IR': ('RUN_TEST_IDLE', 'SELECT_DR_SCAN'),
+}
+
+
+@attr.s(auto_attribs=True)
+class JTAGOperation:
+    kind: str # 'reset', 'ir' or 'dr'
+    start: int
+    end: int
+    tdi: int = 0 # LSB first, as shifted
+    tdo: int = 0
+    nbits: int = 0
+
+    def __str__(self) -> str:
+        if self.kind == 'reset':
+            return 'reset'
+        w = (self.nbits + 3) // 4
+        return f'{self.kind.upper()}[{self.nbits}] tdi=0x{self.tdi:0{w}x} tdo=0x{self.tdo:0{w}x}'
+
+
+def jtag_operations(steps: Iterable[VCDStep], tck: str, tms: str, tdi: str, tdo: str,
+                    state: str = 'TEST_LOGIC_RESET') -> Iterator[JTAGOperation]:
+    # one operation per completed IR/DR scan (at UPDATE), plus entries into Test-Logic-Reset
+    op = None
+    for time, prev, cur in track(steps, {'tck': tck, 'tms': tms, 'tdi': tdi, 'tdo': tdo}):
+        if not (prev['tck'] == 0 and cur['tck'] == 1):
+            continue
+        if state in ('SHIFT_IR', 'SHIFT_DR'):
+            op.tdi |= (prev['tdi'] or 0) << op.nbits
+            op.tdo |= (prev['tdo'] or 0) << op.nbits
+            op.nbits += 1
+        nxt = TAP_NEXT[state][prev['tms'] or 0]
+        if nxt in ('CAPTURE_IR', 'CAPTURE_DR'):
+            op = JTAGOperation(nxt[-2:].lower(), time, time)
+        elif nxt in ('UPDATE_IR', 'UPDATE_DR') and op is not None:
+            op.end = time
+            yield op
+            op = None
+        elif nxt == 'TEST_LOGIC_RESET' and state != 'TEST_LOGIC_RESET':
+            op = None
+            yield JTAGOperation('reset', time, time)
+        state = nxt
+
+
+def open_spi(reader: VCDReader, sclk: str, csn: str, mosi: str, miso: str) -> Iterator[SPITransaction]:
+    ids = {n: reader.find(n).ident for n in (sclk, csn, mosi, miso)}
+    return spi_transactions(reader.steps(ids.values()), *(ids[n] for n in (sclk, csn, mosi, miso)))
+
+
+def open_jtag(reader: VCDReader, tck: str, tms: str, tdi: str, tdo: str) -> Iterator[JTAGOperation]:
+    ids = {n: reader.find(n).ident for n in (tck, tms, tdi, tdo)}
+    return jtag_operations(reader.steps(ids.values()), *(ids[n] for n in (tck, tms, tdi, tdo)))
@@ -0,0 +1,233 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# WaveDrom timing diagrams generated from a WaveStore, in the style of the hand drawn docs/timing-*.json.
+# Signals are grouped in lanes, each sampled on a regular grid of its clock: the first lane's clock is the
+# base (period 1) and slower lanes get a WaveDrom period and phase so their columns line up with it. A
+# gated clock (SCLK between transactions) keeps its grid and is drawn at its idle level where it has no
+# edges. Latencies are measured edge to edge in base clock cycles and drawn as node arrows.
+
+from __future__ import annotations
+
+import json
+import string
+from pathlib import Path
+from typing import Final, Optional, Sequence, Union
+
+import attr
+import numpy as np
+
+from .wavestore import EDGE_KINDS, WaveStore
+
+NODE_NAMES: Final = string.ascii_lowercase
+
+
+def parse_signal(spec: str) -> tuple[str, str]:
+    # 'label=signal' or 'signal', the label defaults to the last path component
+    label, _, sig = spec.rpartition('=')
+    return (label or sig.rsplit('.', 1)[-1]), sig
+
+
+def parse_edge(spec: str) -> tuple[str, str]:
+    # 'signal' or 'signal:falling', rising by default, 'any' for vectors
+    sig, _, kind = spec.partition(':')
+    kind = kind or 'rising'
+    if kind not in EDGE_KINDS:
+        raise ValueError(f'edge kind must be one of {", ".join(EDGE_KINDS)}, got {spec!r}')
+    return sig, kind
+
+
+@attr.s(auto_attribs=True)
+class Lane:
+    clock: str # parse_signal spec
+    signals: list[str] = attr.Factory(list) # parse_signal specs
+
+
+@attr.s(auto_attribs=True)
+class Latency:
+    name: str
+    start: str # parse_edge specs
+    end: str
+    nth: int = 0 # which start edge in the window
+
+
+@attr.s(auto_attribs=True)
+class Measured:
+    name: str
+    start: int
+    end: int
+    cycles: int
+    ns: Optional[float] = None
+
+    def __str__(self) -> str:
+        ns = f' ({self.ns:.1f} ns)' if self.ns is not None else ''
+        return f'{self.name} {self.cycles} clk{ns}'
+
+
+def measure(store: WaveStore, lat: Latency, clock: str, start: Optional[int] = None, end: Optional[int] = None,
+            clk_freq: Optional[float] = None) -> Optional[Measured]:
+    # first end edge at or after the nth start edge, counted in rising edges of clock after the start
+    ssig, skind = parse_edge(lat.start)
+    esig, ekind = parse_edge(lat.end)
+    starts = store[ssig].edges(skind, start, end)
+    if len(starts) <= lat.nth:
+        return None
+    t0 = int(starts[lat.nth])
+    ends = store[esig].edges(ekind, t0, end)
+    if not len(ends):
+        return None
+    t1 = int(ends[0])
+    cycles = len(store[clock].edges('rising', t0 + 1, t1))
+    return Measured(lat.name, t0, t1, cycles, cycles / clk_freq * 1e9 if clk_freq else None)
+
+
+def _grid(store: WaveStore, clock: str, start: int, end: int) -> Optional[np.ndarray]:
+    # sample times every median clock period from the first rising edge in the window
+    edges = store[clock].edges('rising', start, end)
+    if len(edges) < 2:
+        return None
+    return np.arange(edges[0], end + 1, float(np.median(np.diff(edges))))
+
+
+def _num(x: float) -> Union[int, float]:
+    return int(x) if x == int(x) else x
+
+
+def _levels(vals: Sequence, known: Sequence[bool], width: int, color: str) -> tuple[str, list[str]]:
+    wave, data = [], []
+    prev = None
+    for v, k in zip(vals, known):
+        cur = int(v) if k else None
+        if wave and cur == prev:
+            wave.append('.')
+        elif cur is None:
+            wave.append('x')
+        elif width == 1:
+            wave.append(str(cur))
+        else:
+            wave.append(color)
+            data.append(f'{cur:x}')
+        prev = cur
+    return ''.join(wave), data
+
+
+def _clock_wave(store: WaveStore, clock: str, grid: np.ndarray, period: float) -> str:
+    # 'P' while the clock really toggles around the grid point, its level otherwise
+    edges = store[clock].edges('rising', int(grid[0] - period / 2), int(grid[-1] + period / 2))
+    near = np.zeros(len(grid), dtype=bool)
+    if len(edges):
+        idx = np.clip(np.searchsorted(edges, grid), 0, len(edges) - 1)
+        near = np.abs(edges[idx] - grid) <= period / 4
+        prev = np.clip(idx - 1, 0, len(edges) - 1)
+        near |= np.abs(edges[prev] - grid) <= period / 4
+    vals, known = store[clock].values_at(grid.astype(np.int64) - 1)
+    wave = []
+    last = None
+    for i, (n, v, k) in enumerate(zip(near, vals, known)):
+        c = 'P' if n else (str(int(v)) if k else 'x')
+        wave.append('.' if i and c == last else c)
+        last = c
+    return ''.join(wave)
+
+
+def timing_diagram(store: WaveStore, lanes: Sequence[Lane], start: int, end: int, latencies: Sequence[Latency] = (),
+                   clk_freq: Optional[float] = None, title: Optional[str] = None,
+                   colors: Optional[dict[str, str]] = None) -> tuple[dict, list[Measured]]:
+    # returns the WaveDrom source and the measured latencies, clk_freq is the base clock in Hz
+    if not lanes:
+        raise ValueError('need at least one lane')
+    colors = colors or {}
+    base_clock = parse_signal(lanes[0].clock)[1]
+    # nothing after the base clock's last edge can be drawn
+    base_edges = store[base_clock].edges('rising', start, end)
+    if len(base_edges):
+        end = int(base_edges[-1])
+    base = _grid(store, base_clock, start, end)
+    if base is None:
+        raise ValueError(f'{base_clock} has fewer than 2 rising edges in [{start}, {end}]')
+    base_period = float(base[1] - base[0])
+    rows: list[dict] = []
+    nodes: dict[str, tuple[int, np.ndarray, int]] = {} # signal -> (row, sample times, padding columns)
+    for li, lane in enumerate(lanes):
+        clk_label, clk = parse_signal(lane.clock)
+        if li:
+            rows.append({})
+            grid = _grid(store, clk, start, end)
+            if grid is None:
+                continue
+        else:
+            grid = base
+        period = float(grid[1] - grid[0]) if len(grid) > 1 else base_period
+        # whole lane columns before the first edge become padding, the remainder is the phase
+        offset = (grid[0] - base[0]) / base_period
+        lane_period = _num(round(period / base_period * 2) / 2)
+        pad = max(int(offset // lane_period), 0) if li else 0
+        phase = _num(round(-(offset - pad * lane_period) * 2) / 2) if li else 0
+        extra = {} if not li else {'period': lane_period, **({'phase': phase} if phase else {})}
+        pad_wave = ('x' + '.' * (pad - 1)) if pad else ''
+        clk_wave = _clock_wave(store, clk, grid, period)
+        clk_pad = ('0' + '.' * (pad - 1)) if pad else ''
+        rows.append({'name': clk_label, 'wave': clk_pad + clk_wave, **extra})
+        nodes.setdefault(store.find(clk), (len(rows) - 1, grid, pad))
+        for spec in lane.signals:
+            label, sig = parse_signal(spec)
+            w = store[sig]
+            vals, known = w.values_at(grid.astype(np.int64))
+            wave, data = _levels(vals, known, w.width, colors.get(label, '='))
+            row = {'name': label, 'wave': pad_wave + wave, **extra}
+            if data:
+                row['data'] = data
+            rows.append(row)
+            nodes.setdefault(store.find(sig), (len(rows) - 1, grid, pad))
+
+    measured = []
+    edges = []
+    marks: dict[int, list[str]] = {}
+    names = iter(NODE_NAMES)
+    for lat in latencies:
+        m = measure(store, lat, base_clock, start, end, clk_freq)
+        if m is None:
+            continue
+        measured.append(m)
+        ends = []
+        for sig_spec, t in ((lat.start, m.start), (lat.end, m.end)):
+            # signals outside the diagram get their node on the base clock
+            row, grid, pad = nodes.get(store.find(parse_edge(sig_spec)[0]), nodes[store.find(base_clock)])
+            # the first sample showing the change
+            col = pad + min(int(np.searchsorted(grid, t, side='left')), len(grid) - 1)
+            mark = marks.setdefault(row, [])
+            mark.extend('.' * (col + 1 - len(mark)))
+            # latencies chained on the same edge share its node
+            if mark[col] == '.':
+                mark[col] = next(names)
+            ends.append(mark[col])
+        edges.append(f'{ends[0]}~>{ends[1]} {m}')
+    for row, mark in marks.items():
+        rows[row]['node'] = ''.join(mark)
+
+    src: dict = {'signal': rows}
+    if edges:
+        src['edge'] = edges
+    if title:
+        src['head'] = {'text': title}
+    return src, measured
+
+
+def dumps(src: dict) -> str:
+    # one signal per line like the hand written diagrams
+    lines = ['{"signal": [']
+    lines += [f'  {json.dumps(row)},' for row in src['signal']]
+    lines[-1] = lines[-1].rstrip(',')
+    lines.append(']')
+    for k, v in src.items():
+        if k != 'signal':
+            lines[-1] += ','
+            lines.append(f'"{k}": {json.dumps(v)}')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_timing(path: Union[str, Path], src: dict) -> Path:
+    path = Path(path)
+    path.write_text(dumps(src))
+    return path
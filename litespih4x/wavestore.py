@@ -0,0 +1,236 @@
+# Copyright (c) 2021 Jevin Sweval <jevinsweval@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Columnar on-disk waveform store. convert() streams a VCD (or FST through fst2vcd) once and writes every
+# selected signal as raw change arrays: <stem>.t int64 timestamps, <stem>.v values and <stem>.x unknown
+# flags, described by index.json. WaveStore maps them back with np.memmap so queries only touch the pages
+# they search, a value lookup is a binary search over the timestamps. Only real changes are stored, dumps
+# that repeat every value at every timestamp (the scope captures) shrink a lot.
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Final, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from .vcd_stream import VCDReader, VCDVar, find_name
+
+WAVESTORE_VERSION: Final = 1
+INDEX_NAME: Final = 'index.json'
+EDGE_KINDS: Final = ('rising', 'falling', 'any')
+
+
+def value_dtype(var: VCDVar) -> np.dtype:
+    if var.kind == 'real':
+        return np.dtype(np.float64)
+    for dt in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if var.width <= np.iinfo(dt).bits:
+            return np.dtype(dt)
+    # wider vectors are stored big endian, one row of bytes per change
+    return np.dtype((np.uint8, (var.width + 7) // 8))
+
+
+class _ColumnWriter:
+    def __init__(self, stem: Path, dtype: np.dtype, chunk: int):
+        self.dtype = dtype
+        self.chunk = chunk
+        self.files = [open(stem.with_suffix(ext), 'wb') for ext in ('.t', '.v', '.x')]
+        self.t: list[int] = []
+        self.v: list = []
+        self.x: list[bool] = []
+        self.last = object()
+        self.count = 0
+
+    def add(self, time: int, val):
+        if val == self.last:
+            return
+        self.last = val
+        self.t.append(time)
+        self.x.append(val is None)
+        if val is None:
+            val = 0
+        if self.dtype.shape:
+            val = np.frombuffer(val.to_bytes(self.dtype.shape[0], 'big'), np.uint8)
+        self.v.append(val)
+        if len(self.t) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self.t:
+            return
+        # rows of wide values stack into a 2D uint8 array, the subarray dtype would broadcast them
+        for f, vals, dt in zip(self.files, (self.t, self.v, self.x), (np.int64, self.dtype.base, np.bool_)):
+            f.write(np.array(vals, dtype=dt).tobytes())
+        self.count += len(self.t)
+        self.t, self.v, self.x = [], [], []
+
+    def close(self):
+        self.flush()
+        for f in self.files:
+            f.close()
+
+
+def convert(src: Union[str, Path, VCDReader], out_dir: Union[str, Path], signals: Optional[Sequence[str]] = None,
+            chunk: int = 1 << 16) -> WaveStore:
+    # signals are names or unique suffixes as for VCDReader.find, all of them if None
+    reader = src if isinstance(src, VCDReader) else VCDReader(src)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if signals is None:
+        vars = [v for v in reader.by_name.values() if v.kind != 'string']
+    else:
+        vars = [reader.find(s) for s in signals]
+    # aliased names share one set of columns
+    writers: dict[str, _ColumnWriter] = {}
+    stems: dict[str, str] = {}
+    index = {}
+    for var in vars:
+        if var.ident not in writers:
+            stems[var.ident] = stem = f's{len(writers)}'
+            writers[var.ident] = _ColumnWriter(out_dir / stem, value_dtype(var), chunk)
+        index[var.name] = {'stem': stems[var.ident], 'width': var.width, 'kind': var.kind}
+    end = 0
+    try:
+        for step in reader.steps(writers.keys()):
+            end = step.time
+            for ident, val in step.changes.items():
+                writers[ident].add(step.time, val)
+    finally:
+        for w in writers.values():
+            w.close()
+        if not isinstance(src, VCDReader):
+            reader.close()
+    for var in vars:
+        w = writers[var.ident]
+        index[var.name].update(count=w.count, dtype=w.dtype.base.str, shape=list(w.dtype.shape))
+    meta = {'version': WAVESTORE_VERSION, 'source': str(getattr(src, 'name', src)), 'timescale_ps': reader.timescale_ps,
+            'end_time': end, 'signals': index}
+    (out_dir / INDEX_NAME).write_text(json.dumps(meta, indent=1) + '\n')
+    return WaveStore(out_dir)
+
+
+def _map(path: Path, dtype: np.dtype, count: int) -> np.ndarray:
+    # np.memmap refuses empty files
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+class Wave:
+    def __init__(self, name: str, width: int, kind: str, t: np.ndarray, v: np.ndarray, x: np.ndarray):
+        self.name = name
+        self.width = width
+        self.kind = kind
+        self.t = t # change times, sorted
+        self.v = v # value from t[i] until t[i + 1]
+        self.x = x # True where the value has x/z bits
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    def _py(self, i: int):
+        if self.x[i]:
+            return None
+        v = self.v[i]
+        if self.kind == 'real':
+            return float(v)
+        if self.v.ndim == 2:
+            return int.from_bytes(v.tobytes(), 'big')
+        return int(v)
+
+    def index_at(self, time: int) -> int:
+        # index of the change in effect at time, -1 before the first one
+        return int(np.searchsorted(self.t, time, side='right')) - 1
+
+    def value_at(self, time: int):
+        i = self.index_at(time)
+        return None if i < 0 else self._py(i)
+
+    def values_at(self, times: Iterable[int]) -> tuple[np.ndarray, np.ndarray]:
+        # (values, known) for many times at once, narrow signals only
+        if self.v.ndim == 2:
+            raise ValueError(f'{self.name} is {self.width} bits wide, use value_at')
+        idx = np.searchsorted(self.t, np.asarray(times), side='right') - 1
+        known = idx >= 0
+        safe = np.maximum(idx, 0)
+        if len(self.t) == 0:
+            return np.zeros(len(idx), dtype=self.v.dtype), known
+        return self.v[safe], known & ~self.x[safe]
+
+    def _bounds(self, start: Optional[int], end: Optional[int]) -> tuple[int, int]:
+        lo = 0 if start is None else int(np.searchsorted(self.t, start, side='left'))
+        hi = len(self.t) if end is None else int(np.searchsorted(self.t, end, side='right'))
+        return lo, hi
+
+    def window(self, start: Optional[int] = None, end: Optional[int] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (t, v, x) views of the changes in [start, end] led by the one in effect at start, so t[0] may be < start
+        lo, hi = self._bounds(start, end)
+        if start is not None and (lo == len(self.t) or self.t[lo] != start):
+            lo = max(lo - 1, 0)
+        return self.t[lo:hi], self.v[lo:hi], self.x[lo:hi]
+
+    def edges(self, kind: str = 'rising', start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        # times of the edges in [start, end], transitions to or from x don't count
+        if kind not in EDGE_KINDS:
+            raise ValueError(f'edge kind must be one of {", ".join(EDGE_KINDS)}')
+        if kind != 'any' and self.width != 1:
+            raise ValueError(f'{self.name} is {self.width} bits wide, only "any" edges make sense')
+        lo, hi = self._bounds(start, end)
+        if hi <= lo:
+            return np.empty(0, dtype=np.int64)
+        plo = max(lo - 1, 0)
+        t, v, x = self.t[plo:hi], self.v[plo:hi], self.x[plo:hi]
+        prev_v, cur_v = v[:-1], v[1:]
+        ok = ~x[:-1] & ~x[1:]
+        if kind == 'any':
+            hit = ok
+        elif kind == 'rising':
+            hit = ok & (prev_v == 0) & (cur_v == 1)
+        else:
+            hit = ok & (prev_v == 1) & (cur_v == 0)
+        # with lo == 0 the first change has no predecessor and can't be an edge
+        return np.asarray(t[1:][hit])
+
+
+class WaveStore:
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        meta = json.loads((self.path / INDEX_NAME).read_text())
+        if meta['version'] != WAVESTORE_VERSION:
+            raise ValueError(f'{self.path} is wavestore version {meta["version"]}, expected {WAVESTORE_VERSION}')
+        self.meta = meta
+        self.source: str = meta['source']
+        self.timescale_ps: float = meta['timescale_ps']
+        self.end_time: int = meta['end_time']
+        self.signals: dict[str, dict] = meta['signals']
+        self._waves: dict[str, Wave] = {}
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.signals)
+
+    def find(self, name: str) -> str:
+        return find_name(self.signals, name)
+
+    def __getitem__(self, name: str) -> Wave:
+        name = self.find(name)
+        if name not in self._waves:
+            info = self.signals[name]
+            stem = self.path / info['stem']
+            dtype = np.dtype((info['dtype'], tuple(info['shape']))) if info['shape'] else np.dtype(info['dtype'])
+            n = info['count']
+            self._waves[name] = Wave(name, info['width'], info['kind'], _map(stem.with_suffix('.t'), np.dtype(np.int64), n),
+                                     _map(stem.with_suffix('.v'), dtype, n), _map(stem.with_suffix('.x'), np.dtype(np.bool_), n))
+        return self._waves[name]
+
+    def __contains__(self, name: str) -> bool:
+        try:
+            self.find(name)
+        except KeyError:
+            return False
+        return True
+
+    def to_ps(self, time):
+        return time * self.timescale_ps
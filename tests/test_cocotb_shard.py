@@ -0,0 +1,92 @@
+import sys
+from pathlib import Path
+
+from litespih4x.cocotb_shard import discover_tests, shard_tests, run_shards, merge_junit, junit_summary
+
+EMU_SIM = Path(__file__).parent.parent / 'emu-tests' / 'emu_sim.py'
+
+# stand-in bench: writes a JUnit file for the tests selected via TESTCASE, fails the ones named *_bad
+FAKE_BENCH = '''
+import os
+cases = ''.join(
+    f'<testcase name="{t}">' + ('<failure/>' if t.endswith('_bad') else '') + '</testcase>'
+    for t in os.environ['TESTCASE'].split(','))
+open(os.environ['COCOTB_RESULTS_FILE'], 'w').write(f'<testsuites><testsuite>{cases}</testsuite></testsuites>')
+'''
+
+
+def test_discover_emu_sim():
+    tests = discover_tests(EMU_SIM)
+    names = [t.name for t in tests]
+    assert names[0] == 'initial_reset'
+    assert 'read_first_four_bytes' in names
+    assert [t.name for t in tests if t.skip][:1] == ['read_wb_soc_id']
+
+
+def test_shard_tests():
+    shards = shard_tests(['init', 'a', 'b', 'c', 'd', 'e'], 2, prologue=['init'])
+    assert shards == [['init', 'a', 'b'], ['init', 'c', 'd', 'e']]
+    assert shard_tests(['a', 'b'], 8) == [['a'], ['b']]
+
+
+def test_run_and_merge(tmp_path):
+    build = tmp_path / 'base'
+    build.mkdir()
+    (build / 'Vsim').write_text('')
+    shards = shard_tests(['init', 'a', 'b_bad', 'c'], 3, prologue=['init'])
+    results = run_shards(shards, [sys.executable, '-c', FAKE_BENCH], build, tmp_path / 'work')
+    assert all((tmp_path / 'work' / f'shard{r.index}' / 'build' / 'Vsim').is_file() for r in results)
+    merged = merge_junit(results, prologue=['init'])
+    assert [c.get('name') for c in merged.iter('testcase')] == ['init', 'a', 'b_bad', 'c']
+    assert junit_summary(merged) == (4, 1, 0)
+
+
+# prologue that only fails in the second shard
+FLAKY_PROLOGUE_BENCH = '''
+import os
+from pathlib import Path
+bad = Path.cwd().name == 'shard1'
+cases = ''.join(
+    f'<testcase name="{t}">' + ('<failure/>' if t == 'init' and bad else '') + '</testcase>'
+    for t in os.environ['TESTCASE'].split(','))
+open(os.environ['COCOTB_RESULTS_FILE'], 'w').write(f'<testsuites><testsuite>{cases}</testsuite></testsuites>')
+'''
+
+
+def test_merge_later_prologue_failure(tmp_path):
+    shards = shard_tests(['init', 'a', 'b', 'c'], 3, prologue=['init'])
+    results = run_shards(shards, [sys.executable, '-c', FLAKY_PROLOGUE_BENCH], None, tmp_path / 'work')
+    merged = merge_junit(results, prologue=['init'])
+    assert [(c.get('name'), c.get('shard')) for c in merged.iter('testcase')] == \
+        [('init', '0'), ('a', '0'), ('init', '1'), ('b', '1'), ('c', '2')]
+    assert junit_summary(merged) == (5, 1, 0)
+
+
+# run-only bench pass the way emu_sim.py does it in a shard: no namespace, the map comes from the copied build
+RUN_ONLY_BENCH = '''
+import os
+from pathlib import Path
+from litespih4x.sim_names import sim_names_for_run, load_sim_names
+names = load_sim_names(sim_names_for_run(Path('build/gateware'), False))
+cases = ''.join(f'<testcase name="{t}"/>' for t in os.environ['TESTCASE'].split(','))
+assert names.pad('sys_clk') == 'sys_clk_pad'
+open(os.environ['COCOTB_RESULTS_FILE'], 'w').write(f'<testsuites><testsuite>{cases}</testsuite></testsuites>')
+'''
+
+
+def test_run_only_shards(tmp_path, monkeypatch):
+    from litex.build.generic_platform import GenericPlatform, Pins
+    from litespih4x.sim_names import sim_names_for_run
+
+    class NS:
+        pnd = {}
+    platform = GenericPlatform("sim", [("sys_clk", 0, Pins(1))])
+    NS.pnd[platform.request("sys_clk")] = 'sys_clk_pad'
+    monkeypatch.setenv('PYTHONPATH', str(EMU_SIM.parent.parent))
+    build = tmp_path / 'base' / 'build'
+    (build / 'gateware').mkdir(parents=True)
+    sim_names_for_run(build / 'gateware', True, platform, object(), NS)
+    results = run_shards(shard_tests(['init', 'a', 'b'], 2, prologue=['init']),
+                         [sys.executable, '-c', RUN_ONLY_BENCH], build, tmp_path / 'work')
+    assert [r.returncode for r in results] == [0, 0]
+    assert junit_summary(merge_junit(results, prologue=['init'])) == (3, 0, 0)
@@ -0,0 +1,56 @@
+import copy
+
+import pytest
+
+from litespih4x.emu_bench import BenchConfig, BENCH_VERSION, bench_config, compare, min_passing, run_read
+
+
+def results(**metrics):
+    base = {'min_sys_per_sclk': 3, 'first_word_sys': 275, 'first_word_slack_sys': 54, 'burst_bytes': 64,
+            'bytes_per_sclk': 0.117, 'bytes_per_ksys': 39.0, 'wall_s': 20.0, 'sys_cycles_per_s': 2000.0}
+    base.update(metrics)
+    return {'version': BENCH_VERSION, 'meta': {}, 'results': {'flashemulite_pf6': base}}
+
+
+def test_compare():
+    base = results()
+    assert compare(base, copy.deepcopy(base)) == []
+    # wall clock noise inside the default tolerance
+    assert compare(base, results(wall_s=24.0, sys_cycles_per_s=1600.0)) == []
+    regs = compare(base, results(min_sys_per_sclk=4, first_word_slack_sys=50, wall_s=30.0))
+    assert {r.metric for r in regs} == {'min_sys_per_sclk', 'first_word_slack_sys', 'wall_s'}
+    # improvements never count
+    assert compare(base, results(min_sys_per_sclk=2, first_word_slack_sys=60)) == []
+    assert compare(base, results(wall_s=22.0), {'wall_s': 0.0})[0].metric == 'wall_s'
+    assert compare(base, {'version': BENCH_VERSION, 'meta': {}, 'results': {}})[0].metric == '*'
+    # unmeasurable metrics are null and never compared
+    unmeasured = results(min_sys_per_sclk=None, bytes_per_ksys=None)
+    assert compare(unmeasured, results(min_sys_per_sclk=9, bytes_per_ksys=1.0)) == []
+
+
+def test_min_passing():
+    calls = []
+    def ok(r):
+        calls.append(r)
+        return r >= 7
+    assert min_passing(ok, 2, 32) == 7
+    assert len(calls) <= 7
+    assert min_passing(lambda r: r >= 7, 2, 32, step=2) == 8
+    assert min_passing(lambda r: False, 2, 32) is None
+
+
+def test_macronix_read():
+    run, expected = run_read(BenchConfig('macronix_lite', 'macronix'), 4, 4)
+    assert run.data == expected
+    assert run.sclks == 8 * 8 + 2
+    # first data bit is sampled at the end of the 33rd SCLK high phase
+    assert 32 * 4 < run.first_sample - run.csn_fall <= 33 * 4 + 2
+
+
+def test_emu_ratio_not_reported():
+    try:
+        res = bench_config(BenchConfig('flashemu', 'emu'), nbytes=4, nominal_sys_per_sclk=4)
+    except ImportError as e:
+        pytest.skip(f'emulator gateware needs the forked migen/litex: {e}')
+    assert res['min_sys_per_sclk'] is None and res['bytes_per_ksys'] is None
+    assert res['bytes_per_sclk'] > 0
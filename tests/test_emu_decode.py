@@ -0,0 +1,14 @@
+from litespih4x.emu_decode import *
+
+
+def test_entry_roundtrip():
+    for op, ent in QSPI_DECODE_TABLE.items():
+        assert DecodeEntry.unpack(ent.pack()) == ent
+
+
+def test_default_table_init():
+    init = decode_table_init()
+    assert len(init) == DECODE_DEPTH
+    assert DecodeEntry.unpack(init[0x03]).src == SRC_MEM
+    assert DecodeEntry.unpack(init[0x9f]).src == SRC_IDCODE
+    assert DecodeEntry.unpack(init[0x6b]).action == ACT_ERR
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from migen import *
+
+try:
+    from litedram.common import LiteDRAMNativeReadPort
+    from litespih4x.emu_dram import FlashEmuDRAMArbiter
+    from litespih4x.dram_model import DRAMNativePortModel
+except ImportError as e:
+    pytest.skip(f'emulator gateware needs the forked migen/litex: {e}', allow_module_level=True)
+
+
+def burst(cp, addr, nwords, start, got, order, i):
+    # one prefetch style burst: nwords back to back reads from addr, all rdata taken as it comes
+    for _ in range(start):
+        yield
+    yield cp.rdata.ready.eq(1)
+    yield cp.cmd.addr.eq(addr)
+    yield cp.cmd.valid.eq(1)
+    yield
+    sent = 0
+    while len(got) < nwords:
+        if sent < nwords and (yield cp.cmd.valid) and (yield cp.cmd.ready):
+            sent += 1
+            if sent == nwords:
+                yield cp.cmd.valid.eq(0)
+            else:
+                yield cp.cmd.addr.eq(addr + sent)
+        if (yield cp.rdata.valid):
+            got.append((yield cp.rdata.data))
+            order.append(i)
+        yield
+
+
+@pytest.mark.parametrize('slacks, second, third', [((64, 32, 8), 2, 1), ((64, 8, 32), 1, 2)])
+def test_arbiter_edf(slacks, second, third):
+    image = os.urandom(0x4000)
+    port = LiteDRAMNativeReadPort(24, 128)
+    model = DRAMNativePortModel(port, image, latency=11)
+    dut = FlashEmuDRAMArbiter(port, 3, slack=64)
+    nwords = 4
+    # client 0 takes the idle port, 1 and 2 queue behind it with different deadlines
+    starts, addrs = (0, 3, 3), (0x10, 0x100, 0x200)
+    got = [[] for _ in range(3)]
+    order = []
+    stats = {}
+
+    def tb():
+        for i, s in enumerate(slacks):
+            yield getattr(dut, f'slack{i}').storage.eq(s)
+        while any(len(g) < nwords for g in got):
+            yield
+        for _ in range(4):
+            yield
+        for i in range(3):
+            stats[i] = ((yield getattr(dut, f'words{i}').status), (yield getattr(dut, f'lat_max{i}').status))
+
+    clients = [burst(dut.ports[i], addrs[i], nwords, starts[i], got[i], order, i) for i in range(3)]
+    run_simulation(dut, [tb(), model.handler(), *clients])
+    for i in range(3):
+        assert got[i] == [model.read_word(addrs[i] + w) for w in range(nwords)]
+    # whole bursts, earliest deadline first instead of lowest index
+    assert order == [0] * nwords + [second] * nwords + [third] * nwords
+    assert [stats[i][0] for i in range(3)] == [nwords] * 3
+    # client 0 only sees the DRAM latency, the others also wait out the bursts granted before them
+    assert model.latency <= stats[0][1] < stats[second][1] < stats[third][1]
@@ -0,0 +1,112 @@
+import os
+import zlib
+
+from migen import *
+
+from litespih4x.dram_model import DRAMNativePortModel
+from litespih4x.emu_hash import CRC32Words, crc32_taps
+
+
+def crc_step(crc, word, width):
+    nxt = 0
+    for i, (smask, dmask) in enumerate(crc32_taps(width)):
+        nxt |= (bin(crc & smask).count('1') + bin(word & dmask).count('1')) % 2 << i
+    return nxt
+
+
+def test_crc32_taps():
+    data = os.urandom(64)
+    for width in (8, 32, 128):
+        crc = 0xffffffff
+        for off in range(0, len(data), width // 8):
+            crc = crc_step(crc, int.from_bytes(data[off:off + width // 8], 'little'), width)
+        assert crc ^ 0xffffffff == zlib.crc32(data)
+
+
+def test_crc32_words():
+    data = os.urandom(16 * 5)
+    dut = CRC32Words(128)
+    got = []
+
+    def tb():
+        # a restart in the middle starts a second CRC over the last two words
+        for i in range(5):
+            yield dut.data.eq(int.from_bytes(data[16 * i:16 * (i + 1)], 'little'))
+            yield dut.ce.eq(1)
+            yield dut.restart.eq(i == 3)
+            yield
+            # reads see the register before this edge
+            if i == 3:
+                got.append((yield dut.digest))
+        yield dut.ce.eq(0)
+        yield
+        yield
+        got.append((yield dut.digest))
+
+    run_simulation(dut, tb())
+    assert got == [zlib.crc32(data[:48]), zlib.crc32(data[48:])]
+
+
+def test_page_hasher():
+    from litedram.common import LiteDRAMNativeReadPort
+    from litespih4x.emu_hash import DRAMPageHasher
+    image = os.urandom(0x4000)
+    port = LiteDRAMNativeReadPort(24, 128)
+    model = DRAMNativePortModel(port, image, latency=11)
+    dut = DRAMPageHasher(port, max_pages=16)
+    got = {}
+
+    def tb():
+        # 1 KiB pages from 0x1000, after a 512 byte pass over the first page
+        for base, shift, n in ((0, 9, 1), (0x1000, 10, 6)):
+            yield dut.base.storage.eq(base)
+            yield dut.page_shift.storage.eq(shift)
+            yield dut.npages.storage.eq(n)
+            yield dut.start.re.eq(1)
+            yield
+            yield dut.start.re.eq(0)
+            yield
+            cycles = 0
+            while (yield dut.status.fields.busy):
+                yield
+                cycles += 1
+            table = []
+            for i in range(n):
+                table.append((yield dut.table[i]))
+            got[base] = (table, cycles)
+
+    run_simulation(dut, [tb(), model.handler()])
+    page = lambda base, sz, i: zlib.crc32(image[base + i * sz:base + (i + 1) * sz])
+    assert got[0][0] == [page(0, 512, 0)]
+    assert got[0x1000][0] == [page(0x1000, 1024, i) for i in range(6)]
+    # one word per clock plus the read latency
+    assert got[0x1000][1] <= 6 * 64 + 11 + 4
+
+
+def test_range_crc32():
+    from litedram.common import LiteDRAMNativeReadPort
+    from litespih4x.emu_hash import DRAMRangeCRC32
+    image = os.urandom(0x4000)
+    port = LiteDRAMNativeReadPort(24, 128)
+    model = DRAMNativePortModel(port, image, latency=11)
+    dut = DRAMRangeCRC32(port)
+    got = []
+
+    def tb():
+        for base, length in ((0x30, 0x10), (0x1000, 0x2a50)):
+            yield dut.base.storage.eq(base)
+            yield dut.length.storage.eq(length)
+            yield dut.start.re.eq(1)
+            yield
+            yield dut.start.re.eq(0)
+            yield
+            while (yield dut.status.fields.busy):
+                yield
+            yield
+            got.append(((yield dut.digest.status), (yield dut.cycles.status)))
+
+    run_simulation(dut, [tb(), model.handler()])
+    assert got[0][0] == zlib.crc32(image[0x30:0x40])
+    assert got[1][0] == zlib.crc32(image[0x1000:0x3a50])
+    # one word per clock plus the read latency
+    assert got[1][1] <= 0x2a50 // 16 + 11 + 4
@@ -0,0 +1,44 @@
+import pytest
+
+from litespih4x.emu_latency import READ_MODES, LatencyParams, dram_read_latency, smallest_prefetch_bits, solve
+
+# FlashEmuLite READ sims: (prefetch_bits, dram_latency, sys_per_sclk) -> first word, FSM idle, first sample,
+# sys clks after CS# falls
+SIM = {
+    (5, 11, 4): (123, 125, 131),
+    (5, 20, 10): (294, 296, 329),
+    (6, 11, 10): (275, 279, 329),
+    (6, 20, 4): (128, 132, 131),
+    (7, 11, 6): (165, 173, 197),
+}
+
+
+@pytest.mark.parametrize('key', SIM)
+def test_matches_sim(key):
+    bits, lat, r = key
+    rep = solve(LatencyParams(sys_clk_freq=r, sclk_freq=1, prefetch_bits=bits, dram_latency=lat, guard_sys=0))
+    assert (rep.first_word_sys, rep.ready_sys, rep.first_sample_sys) == SIM[key]
+
+
+def test_slack():
+    p = LatencyParams(sys_clk_freq=100e6, sclk_freq=25e6)
+    rep = solve(p)
+    assert rep.slack_sys == 3 and rep.ok
+    # max SCLK is exactly where the slack runs out
+    assert solve(LatencyParams(sys_clk_freq=100e6, sclk_freq=rep.max_sclk_freq)).slack_sys == pytest.approx(0)
+    # the pf6 lat20 sim underruns at 4 sys clks per SCLK
+    assert not solve(LatencyParams(sys_clk_freq=4, sclk_freq=1, dram_latency=20)).ok
+    # dummy cycles buy time
+    assert not solve(LatencyParams(sys_clk_freq=100e6, sclk_freq=50e6)).ok
+    assert solve(LatencyParams(sys_clk_freq=100e6, sclk_freq=50e6, mode=READ_MODES['fastread'])).slack_sys == 7
+    assert smallest_prefetch_bits(LatencyParams(sys_clk_freq=100e6, sclk_freq=50e6)) is None
+    assert smallest_prefetch_bits(LatencyParams(sys_clk_freq=100e6, sclk_freq=25e6, dram_latency=14)) == 6
+    with pytest.raises(ValueError):
+        solve(LatencyParams(sys_clk_freq=100e6, sclk_freq=25e6, prefetch_bits=4))
+
+
+def test_dram_read_latency():
+    assert dram_read_latency('MT41K128M16', 100e6, row_miss=False) == 11
+    assert dram_read_latency('MT41K128M16', 100e6) == 11 + 3 + 3
+    with pytest.raises(ValueError):
+        dram_read_latency('NOPE')
@@ -0,0 +1,9 @@
+from litespih4x.emu_sfdp import load_sfdp_hex, SFDP_DEPTH
+
+
+def test_default_sfdp():
+    sfdp = bytes(load_sfdp_hex())
+    assert len(sfdp) == SFDP_DEPTH
+    assert sfdp[:4] == b'SFDP'
+    # first parameter header points at the JEDEC basic flash parameter table
+    assert sfdp[8] == 0x00 and sfdp[0xc] == 0x30
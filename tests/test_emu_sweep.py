@@ -0,0 +1,49 @@
+import sys
+
+import pytest
+
+from litespih4x.emu_sweep import SweepResult, pareto_front, run_point, sweep_points
+
+
+def result(pf, sys_mhz, div, underruns=0, lat=20):
+    counters = {'reads': 10, 'underruns': underruns, 'lat_sum': 10 * lat, 'lat_max': lat, 'cycles': 1000}
+    return SweepResult(sweep_points([pf], [sys_mhz * 1e6], [div])[0], 8, counters)
+
+
+def test_pareto():
+    rs = [
+        result(6, 100, 4),
+        result(7, 100, 4), # same SCLK and latency, bigger window
+        result(5, 100, 2, underruns=3), # fastest but underruns
+        result(6, 100, 2, lat=30), # faster SCLK, slower first word
+        result(6, 50, 2, lat=12), # same SCLK as div4 at half the sys clock, 240 ns
+        SweepResult(sweep_points([6], [200e6], [2])[0], 8, None, returncode=1),
+    ]
+    front = pareto_front(rs)
+    assert [r.point.tag for r in front] == ['pf6_sys100mhz_div2', 'pf6_sys100mhz_div4', 'pf6_sys50mhz_div2']
+    assert rs[0].lat_mean_ns == 200.0 and rs[0].read_mbps == 8.0
+    with pytest.raises(ValueError):
+        sweep_points([6], [100e6], [3])
+
+
+def test_run_point(tmp_path):
+    # a stand-in script that records its arguments, reports the digest of a fake gateware file and, unless
+    # only building, fixed counters
+    script = tmp_path / 'fake.py'
+    gateware = tmp_path / 'gateware.v'
+    gateware.write_text('v1')
+    script.write_text('import sys, hashlib\nopen("args", "a").write(" ".join(sys.argv[1:]) + "\\n")\n'
+                      f'print("sim_cache digest:", hashlib.sha256(open({str(gateware)!r}, "rb").read()).hexdigest())\n'
+                      'if "--build-only" not in sys.argv:\n'
+                      '    print("emu_workload: reads=4 underruns=1 lat_sum=80 lat_max=25 cycles=400")\n')
+    point = sweep_points([6], [100e6], [4])[0]
+    r = run_point(script, point, tmp_path, reads=4, nbytes=8)
+    assert r.counters['underruns'] == 1 and not r.cached
+    args = (tmp_path / point.tag / 'args').read_text().split()
+    assert args[args.index('--spi-div') + 1] == '4' and args[args.index('--workload-reads') + 1] == '4'
+    # reused until the command or the gateware changes
+    assert run_point(script, point, tmp_path, reads=4, nbytes=8).cached
+    gateware.write_text('v2')
+    assert not run_point(script, point, tmp_path, reads=4, nbytes=8).cached
+    assert run_point(script, point, tmp_path, reads=4, nbytes=8).cached
+    assert not run_point(script, point, tmp_path, reads=8, nbytes=8).cached
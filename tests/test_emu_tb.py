@@ -0,0 +1,182 @@
+import pytest
+
+from migen import *
+
+try:
+    from litedram.common import LiteDRAMNativeReadPort
+    from litespih4x.emu import FlashEmu, FlashEmuLite, SPISigs, QSPISigs, IDCODE
+    from litespih4x.emu_dram import FlashEmuDRAMLite
+    from litespih4x.emu_decode import DecodeEntry, ACT_READ, SRC_MEM, LANES_SINGLE, LANES_DUAL, LANES_QUAD
+    from litespih4x.emu_tb import *
+except ImportError as e:
+    pytest.skip(f'emulator gateware needs the forked migen/litex: {e}', allow_module_level=True)
+
+
+def dram_image(sz: int = 0x10000) -> bytes:
+    return bytes(FlashEmuLite.val4addr(a) ^ 0x5a for a in range(sz))
+
+
+def make_lite(prefetch_bits: int = 6, latency: int = 11, num_triggers: int = 0):
+    port = LiteDRAMNativeReadPort(24, 128)
+    sigs = SPISigs(sclk=Signal(), csn=Signal(reset=1), si=Signal(), so=Signal())
+    dut = FlashEmuLite(ClockDomain('sys'), sigs, port, sz_mbit=256, idcode=IDCODE, prefetch_bits=prefetch_bits,
+                       num_triggers=num_triggers)
+    model = DRAMNativePortModel(port, dram_image(), latency=latency)
+    return dut, sigs, model
+
+
+def test_lite_rdid():
+    dut, sigs, model = make_lite()
+    res = {}
+    def master():
+        res['id'] = yield from spi_xfer(sigs, bytes([0x9f]), 3)
+    emu_run_simulation(dut, [master()], [model.handler()])
+    assert res['id'] == IDCODE.to_bytes(3, 'big')
+
+
+@pytest.mark.parametrize('prefetch_bits', [5, 6])
+def test_lite_read(prefetch_bits):
+    dut, sigs, model = make_lite(prefetch_bits)
+    res = {}
+    def master():
+        res['a'] = yield from spi_read(sigs, 0x1234, 8)
+        res['b'] = yield from spi_read(sigs, 0x4, 4)
+    emu_run_simulation(dut, [master()], [model.handler()])
+    assert res['a'] == dram_image()[0x1234:0x1234+8]
+    assert res['b'] == dram_image()[0x4:0x4+4]
+    assert model.stats.words == model.stats.cmds
+
+
+def test_lite_sfdp():
+    dut, sigs, model = make_lite()
+    res = {}
+    def master():
+        res['sig'] = yield from spi_read(sigs, 0x0, 4, cmd=0x5a, dummy_bytes=1)
+    emu_run_simulation(dut, [master()], [model.handler()])
+    assert res['sig'] == b'SFDP'
+    assert model.stats.cmds == 0
+
+
+def test_lite_image_base():
+    dut, sigs, model = make_lite()
+    res = {}
+    def master():
+        yield dut.image_base.storage.eq(0x1000)
+        for _ in range(4):
+            yield
+        res['a'] = yield from spi_read(sigs, 0x20, 4)
+    emu_run_simulation(dut, [master()], [model.handler()])
+    assert res['a'] == dram_image()[0x1020:0x1020+4]
+
+
+@pytest.mark.parametrize('lanes', [LANES_SINGLE, LANES_DUAL, LANES_QUAD])
+def test_lite_decode_lanes(lanes):
+    dut, sigs, model = make_lite()
+    res = {}
+    seen = []
+    def setup():
+        # QREAD written over CSR, only the single lane variant may be served
+        ent = DecodeEntry(action=ACT_READ, src=SRC_MEM, addr_bytes=3, dummy=8, lanes=lanes)
+        yield dut.decoder.decode_adr.storage.eq(0x6b)
+        yield dut.decoder.decode_dat.storage.eq(ent.pack())
+        yield dut.decoder.decode_dat.re.eq(1)
+        yield
+        yield dut.decoder.decode_dat.re.eq(0)
+    @passive
+    def monitor():
+        while True:
+            seen.append((yield dut.bad_cmd_err))
+            yield
+    def master():
+        res['a'] = yield from spi_read(sigs, 0x1234, 4, cmd=0x6b, dummy_bytes=1)
+    emu_run_simulation(dut, [master()], [model.handler(), setup(), monitor()])
+    assert any(seen) == (lanes != LANES_SINGLE)
+    assert (res['a'] == dram_image()[0x1234:0x1238]) == (lanes == LANES_SINGLE)
+
+
+def test_lite_trigger_set_base():
+    dut, sigs, model = make_lite(num_triggers=1)
+    # field decode and write_from_dev are the CSRs' own logic, normally pulled in by the CSR bank
+    for csr in dut.get_csrs():
+        if isinstance(csr, Module):
+            csr.finalize(8, "big")
+            dut.submodules += csr
+    t = dut.trigger
+    res = {}
+    def setup():
+        # the first READ inside 0x20..0x2f switches to the image at 0x2000
+        yield t.trig0_ctrl.storage.eq(0b1111)
+        yield t.trig0_opcode.storage.eq(0x03)
+        yield t.trig0_addr_lo.storage.eq(0x20)
+        yield t.trig0_addr_hi.storage.eq(0x2f)
+        yield t.trig0_base.storage.eq(0x2000)
+        yield t.trig0_ctrl.re.eq(1)
+        yield
+        yield t.trig0_ctrl.re.eq(0)
+    def master():
+        res['rdid'] = yield from spi_xfer(sigs, bytes([0x9f]), 3)
+        res['a'] = yield from spi_read(sigs, 0x20, 4)
+        res['base'] = (yield dut.image_base.storage)
+        res['b'] = yield from spi_read(sigs, 0x20, 4)
+        res['fired'] = (yield t.fired.status)
+    emu_run_simulation(dut, [master()], [model.handler(), setup()])
+    assert res['rdid'] == IDCODE.to_bytes(3, 'big')
+    # the matching READ itself is still served from the old slot
+    assert res['a'] == dram_image()[0x20:0x24]
+    assert res['base'] == 0x2000 and res['fired'] == 1
+    assert res['b'] == dram_image()[0x2020:0x2024]
+
+
+def test_dram_lite_prefetch():
+    port = LiteDRAMNativeReadPort(24, 128)
+    paddr = Signal(24)
+    paddr_valid = Signal()
+    dut = FlashEmuDRAMLite(port, 6, paddr, paddr_valid)
+    model = DRAMNativePortModel(port, dram_image(), latency=5)
+    res = {}
+    def host():
+        yield paddr.eq(0x240)
+        yield paddr_valid.eq(1)
+        yield
+        yield paddr_valid.eq(0)
+        for _ in range(32):
+            yield
+        res['regs'] = []
+        for r in dut.prefetch_regs:
+            res['regs'].append((yield r))
+    run_simulation(dut, [host(), model.handler()])
+    assert res['regs'] == [model.read_word(0x24 + i) for i in range(4)]
+
+
+def test_emu_rdid_read():
+    def qsigs():
+        return QSPISigs(sclk=Signal(), rstn=Signal(reset=1), csn=Signal(reset=1),
+                        si=Signal(), so=Signal(), wpn=Signal(), sio3=Signal())
+    qrs, qes = qsigs(), qsigs()
+    dut = FlashEmu(ClockDomain('sys'), qrs, qes, sz_mbit=256, idcode=IDCODE)
+    res = {}
+    # FlashEmu talks through tristates, drive/sample the emulated side of them
+    sigs = SPISigs(sclk=qes.sclk, csn=qes.csn, si=dut.esi_ts.i, so=dut.eso_ts.o)
+    def master():
+        res['id'] = yield from spi_xfer(sigs, bytes([0x9f]), 3)
+        res['data'] = yield from spi_read(sigs, 0x10, 4)
+        res['sfdp'] = yield from spi_read(sigs, 0x0, 4, cmd=0x5a, dummy_bytes=1)
+    emu_run_simulation(dut, [master()])
+    assert res['id'] == IDCODE.to_bytes(3, 'big')
+    assert res['data'] == bytes(FlashEmu.val4addr(a) for a in range(0x10, 0x14))
+    assert res['sfdp'] == b'SFDP'
+
+
+@pytest.mark.parametrize('spi_period,underrun', [(20, False), (4, True)])
+def test_lite_underrun(spi_period, underrun):
+    dut, sigs, model = make_lite()
+    seen = []
+    def master():
+        yield from spi_read(sigs, 0x1200, 16)
+    @passive
+    def monitor():
+        while True:
+            seen.append((yield dut.underrun))
+            yield
+    emu_run_simulation(dut, [master()], [model.handler(), monitor()], spi_period=spi_period)
+    assert any(seen) == underrun
@@ -0,0 +1,89 @@
+import os
+import zlib
+from types import SimpleNamespace
+
+from litespih4x.emu_upload import MAIN_RAM_BASE, PageHashRemote, coalesce, delta_upload, verify_image
+
+TABLE = 0x8000
+
+
+class Reg:
+    def __init__(self, on_write=None):
+        self.value = 0
+        self.on_write = on_write
+
+    def read(self):
+        return self.value
+
+    def write(self, v):
+        self.value = v
+        if self.on_write:
+            self.on_write(v)
+
+
+class FakeBus:
+    # Etherbone to DRAM at MAIN_RAM_BASE plus a behavioral DRAMPageHasher
+    def __init__(self, dram: bytearray):
+        self.dram = dram
+        self.table = []
+        self.written = 0
+        names = ('base', 'page_shift', 'npages', 'status')
+        crc_names = ('base', 'length', 'status', 'digest', 'cycles')
+        self.regs = SimpleNamespace(**{f'page_hash_{n}': Reg() for n in names}, page_hash_start=Reg(self.hash),
+                                    **{f'image_crc_{n}': Reg() for n in crc_names}, image_crc_start=Reg(self.crc))
+        self.bases = SimpleNamespace(page_hash_table=TABLE)
+
+    def hash(self, _):
+        r = self.regs
+        sz = 1 << r.page_hash_page_shift.value
+        base = r.page_hash_base.value
+        self.table = [zlib.crc32(self.dram[base + i * sz:base + (i + 1) * sz]) for i in range(r.page_hash_npages.value)]
+
+    def crc(self, _):
+        r = self.regs
+        base = r.image_crc_base.value
+        r.image_crc_digest.value = zlib.crc32(self.dram[base:base + r.image_crc_length.value])
+        r.image_crc_cycles.value = r.image_crc_length.value // 16
+
+    def read(self, addr, length):
+        assert length <= 255
+        off = (addr - TABLE) // 4
+        return self.table[off:off + length]
+
+    def write(self, addr, datas):
+        assert len(datas) <= 255
+        off = addr - MAIN_RAM_BASE
+        for i, w in enumerate(datas):
+            self.dram[off + 4 * i:off + 4 * i + 4] = w.to_bytes(4, 'little')
+        self.written += 4 * len(datas)
+
+
+def test_delta_upload():
+    old = bytearray(os.urandom(1 << 20))
+    dram = bytearray(2 << 20)
+    dram[0x10000:0x10000 + len(old)] = old
+    new = bytearray(old)
+    new[0x1234] ^= 0xff # page 1
+    new[0x54000:0x55010] = bytes(0x1010) # pages 0x54 and 0x55
+    new = bytes(new[:-100]) # shorter, the last page gets padded
+    bus = FakeBus(dram)
+    # 64 pages in the table: 16 KiB coarse pages, 4 KiB fine pages
+    stats = delta_upload(bus, new, image_base=0x10000, hasher=PageHashRemote(bus, max_pages=64))
+    assert stats.coarse_page == 16384 and stats.fine_page == 4096
+    assert stats.coarse_dirty == 3 and stats.pages_sent == 4
+    assert bus.written == 4 * 4096
+    assert dram[0x10000:0x10000 + len(new)] == new
+    assert dram[0x10000 + len(new):0x10000 + len(old)] == b'\xff' * 100
+    assert delta_upload(bus, new, image_base=0x10000, hasher=PageHashRemote(bus, max_pages=64)).pages_sent == 0
+    assert coalesce([1, 2, 3, 7, 9, 10]) == [(1, 3), (7, 1), (9, 2)]
+
+
+def test_verify_image():
+    image = os.urandom(0x1000 - 5)
+    dram = bytearray(b'\xff' * 0x4000)
+    dram[0x2000:0x2000 + len(image)] = image
+    bus = FakeBus(dram)
+    r = verify_image(bus, image, 0x2000)
+    assert r.ok and r.length == 0x1000 and r.actual == zlib.crc32(image + b'\xff' * 5)
+    dram[0x2fff] = 0
+    assert not verify_image(bus, image, 0x2000).ok
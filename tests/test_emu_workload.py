@@ -0,0 +1,43 @@
+import contextlib
+import io
+from types import SimpleNamespace
+
+from migen import *
+
+from litespih4x.emu_workload import SPIReadWorkload, parse_workload
+
+
+def test_workload():
+    sigs = SimpleNamespace(sclk=Signal(), csn=Signal(reset=1), si=Signal(), so=Signal())
+    underrun, word_valid = Signal(), Signal()
+    dut = SPIReadWorkload(sigs, underrun, word_valid, reads=3, nbytes=2, div=4, finish=False)
+    bits = []
+
+    def tb():
+        # a DRAM word 20 sys clocks into every read, an underrun in the second read only
+        n, t_fall, prev = 0, None, (1, 0)
+        for cyc in range(700):
+            csn, sclk = (yield sigs.csn), (yield sigs.sclk)
+            if not csn and sclk and not prev[1]:
+                bits.append((yield sigs.si))
+            if csn and not prev[0]:
+                n += 1
+            t_fall = None if csn else cyc if t_fall is None else t_fall
+            yield word_valid.eq(t_fall is not None and cyc - t_fall == 20)
+            yield underrun.eq(n == 1 and t_fall is not None and cyc - t_fall == 100)
+            prev = (csn, sclk)
+            yield
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        run_simulation(dut, tb())
+    assert parse_workload(out.getvalue()) == {'reads': 3, 'underruns': 1, 'lat_sum': 63, 'lat_max': 21, 'cycles': 603}
+    # READ opcode then the LFSR address, MSB first, 16 data clocks
+    assert len(bits) == 3 * 48
+    assert bits[:32] == [int(b) for b in f'{0x03:08b}{1:024b}']
+    assert bits[48:80] == [int(b) for b in f'{0x03:08b}{0xe10000:024b}']
+
+
+def test_parse_workload():
+    assert parse_workload('boot\nnothing here\n') is None
+    assert parse_workload('emu_workload: reads=1 underruns=0 lat_sum=5 lat_max=5 cycles=9\n')['cycles'] == 9
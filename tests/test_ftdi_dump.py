@@ -0,0 +1,73 @@
+import threading
+import time
+import pytest
+
+from litespih4x.ftdi_dump import Checkpoint, dump, prefetched, usb_chunk, verify
+
+IMAGE = bytes((a * 13 + (a >> 9)) & 0xff for a in range(1 << 18))
+
+
+class FakePort:
+    # pyftdi SpiPort.exchange over IMAGE, READ/FAST_READ(4B) and RDID, optionally failing after some chunks
+    def __init__(self, image=IMAGE, fail_after=None):
+        self.image = image
+        self.fail_after = fail_after
+        self.addr = None
+        self.reads = []
+
+    def exchange(self, out=b'', readlen=0, start=True, stop=True):
+        out = bytes(out)
+        if self.fail_after is not None and len(self.reads) >= self.fail_after:
+            raise OSError('USB error')
+        self.reads.append(readlen)
+        if start:
+            op = out[0]
+            if op == 0x9f:
+                return bytes([0xc2, 0x25, 0x39])
+            alen = 4 if op in (0x13, 0x0c) else 3
+            self.addr = int.from_bytes(out[1:1 + alen], 'big')
+        data = self.image[self.addr:self.addr + readlen]
+        self.addr += readlen
+        if stop:
+            self.addr = None
+        return data
+
+
+def test_dump_resume(tmp_path):
+    out = tmp_path / 'dump.bin'
+    with pytest.raises(OSError):
+        dump(FakePort(fail_after=6), out, len(IMAGE), chunk=16384, checkpoint_every=32768)
+    ckpt = Checkpoint.load(Checkpoint.path_for(out))
+    assert ckpt is not None and ckpt.done == 65536
+    port = FakePort()
+    r = dump(port, out, len(IMAGE), chunk=16384)
+    assert r.resumed_from == 65536 and out.read_bytes() == IMAGE
+    # one RDID then the remaining 192 KiB in 16 KiB chunks of one transaction
+    assert port.reads == [3] + [16384] * 12
+    assert not Checkpoint.path_for(out).exists()
+    # a different chip starts over
+    r = dump(FakePort(), tmp_path / 'other.bin', 4096, addr=4096)
+    assert r.resumed_from == 0 and (tmp_path / 'other.bin').read_bytes() == IMAGE[4096:8192]
+
+
+def test_verify(tmp_path):
+    ref = bytearray(IMAGE)
+    ref[100:103] = b'\0\0\0'
+    ref[70000] ^= 1
+    (tmp_path / 'ref.bin').write_bytes(ref)
+    bad = verify(FakePort(), tmp_path / 'ref.bin', chunk=8192)
+    assert [str(m) for m in bad] == ['0x00000064+0x3', '0x00011170+0x1']
+    assert usb_chunk(fifo=4096) == 61440 and usb_chunk(fifo=1024) == 64512
+
+
+def test_prefetched_consumer_abort():
+    # the consumer leaves after one item, by then the producer has filled the queue with the last item and
+    # waits to put its end marker
+    def consume():
+        for _ in prefetched(iter([b'a', b'b']), depth=1):
+            time.sleep(0.3)
+            break
+    t = threading.Thread(target=consume, daemon=True)
+    t.start()
+    t.join(5)
+    assert not t.is_alive()
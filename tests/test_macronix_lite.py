@@ -0,0 +1,75 @@
+from migen import *
+from migen.fhdl.specials import Tristate
+
+from litespih4x.macronix_lite import MacronixModelLite
+from litespih4x.macronix_ref import MacronixRef, SR_WIP
+
+SZ = 64 * 1024
+
+
+class _SimTristate:
+    # the bench drives TSTriple.i and samples TSTriple.o directly
+    @staticmethod
+    def lower(dr):
+        return Module()
+
+
+def spi_xfer(pins, tx: bytes, nrx: int = 0, half: int = 2):
+    # mode 0 bit-bang from the model's own clock domain
+    yield pins['csn'].eq(0)
+    for _ in range(half):
+        yield
+    rx_bits = []
+    for i, bit in enumerate(b for byte in tx + bytes(nrx) for b in ((byte >> (7 - n)) & 1 for n in range(8))):
+        yield pins['si'].eq(bit)
+        for _ in range(half):
+            yield
+        yield pins['sclk'].eq(1)
+        for _ in range(half):
+            yield
+        if i >= len(tx) * 8:
+            rx_bits.append((yield pins['so']))
+        yield pins['sclk'].eq(0)
+    for _ in range(half):
+        yield
+    yield pins['csn'].eq(1)
+    for _ in range(2 * half):
+        yield
+    return bytes(int(''.join(map(str, rx_bits[i:i+8])), 2) for i in range(0, len(rx_bits), 8))
+
+
+def test_lite_vs_ref():
+    sigs = {n: Signal(name=n, reset=int(n in ('csn', 'rstn'))) for n in ('sclk', 'rstn', 'csn', 'si', 'so', 'wpn', 'sio3')}
+    dut = MacronixModelLite(None, *sigs.values(), sz=SZ)
+    pins = dict(sclk=sigs['sclk'], csn=sigs['csn'], si=dut.si_ts.i, so=dut.so_ts.o)
+    ref = MacronixRef(SZ)
+    page = bytes((i * 13) & 0xff for i in range(300))
+    txns = [
+        (b'\x9f', 4),
+        (b'\x03\x00\x12\x34', 8),
+        (b'\x0b\x00\xff\xfe\x00', 4),
+        (b'\x05', 1),
+        (b'\x06', 0),
+        (b'\x05', 1),
+        (b'\x02\x00\x21\xf0' + page, 0),
+        (b'\x05', 1),
+        (b'\x03\x00\x21\x00', 256),
+        (b'\x06', 0),
+        (b'\x20\x00\x31\x23', 0),
+        (b'\x03\x00\x2f\xfe', 4),
+        (b'\x03\x00\x30\x00', 4),
+        (b'\x15', 1),
+    ]
+    res = []
+
+    def master():
+        for tx, nrx in txns:
+            res.append((yield from spi_xfer(pins, tx, nrx)))
+            # wait out program/erase like firmware would
+            while True:
+                sr = yield from spi_xfer(pins, b'\x05', 1)
+                if not sr[0] & SR_WIP:
+                    break
+
+    run_simulation(dut, master(), special_overrides={Tristate: _SimTristate})
+    assert res == [ref.xfer(tx, nrx) for tx, nrx in txns]
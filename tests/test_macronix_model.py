@@ -0,0 +1,47 @@
+import pytest
+
+from migen import *
+from migen.fhdl import verilog
+
+from litespih4x.macronix_model import ERASE_TICK_NS, MacronixModel, MacronixTiming, VENDORED_TIMING
+
+
+class _Platform:
+    def __init__(self):
+        self.sources = []
+
+    def add_source(self, path, language=None):
+        self.sources.append(path)
+
+
+def model_verilog(**kwargs) -> tuple[MacronixModel, str]:
+    sigs = [Signal(name=n) for n in ('sclk', 'rstn', 'csn', 'si', 'so', 'wpn', 'sio3')]
+    m = MacronixModel(_Platform(), *sigs, **kwargs)
+    return m, str(verilog.convert(m, ios=set(sigs)))
+
+
+def test_default_keeps_vendored_parameters():
+    m, v = model_verilog()
+    assert m.timing == VENDORED_TIMING
+    assert '.tVSL(' not in v
+
+
+def test_time_scale():
+    m, v = model_verilog(time_scale=1e-5)
+    assert m.timing.tVSL == 15
+    assert '.tVSL(15)' in v
+    # RESET# pacing follows the fixed specify checks
+    assert (m.timing.tRLRH, m.timing.tRHSL) == (10_000, 10_000)
+    # erases keep distinct ERS_Count_* in their original order
+    t = m.timing
+    assert [x // ERASE_TICK_NS for x in (t.tSE, t.tBE32, t.tBE)] == [1, 2, 3]
+    assert MacronixTiming().scaled(1e-3).tBE == 400_000
+    # specify block checks are not module parameters
+    assert '.tRLRH(' not in v
+
+
+def test_explicit_timing():
+    m, v = model_verilog(timing=MacronixTiming(tPP=100, tSE=1_000_000), time_scale=0.5)
+    assert (m.timing.tPP, m.timing.tSE) == (50, 500_000)
+    with pytest.raises(ValueError):
+        MacronixTiming().scaled(0)
@@ -0,0 +1,43 @@
+from litespih4x.macronix_ref import *
+
+
+def test_read_pattern_and_wrap():
+    m = MacronixRef(sz=4 * BLOCK_SZ)
+    assert m.xfer(bytes([0x03, 0x00, 0x01, 0x02]), 4) == bytes([0x03, 0x02, 0x05, 0x04])
+    assert m.read(m.sz - 2, 4).tolist() == m.array[-2:].tolist() + m.array[:2].tolist()
+    assert m.xfer(bytes([0x0b, 0, 0, 0x10, 0xff]), 2) == m.array[0x10:0x12].tobytes()
+
+
+def test_ids_and_sfdp():
+    m = MacronixRef(sz=BLOCK_SZ)
+    assert m.xfer(bytes([0x9f]), 3) == bytes([0xc2, 0x25, 0x39])
+    assert m.xfer(bytes([0x90, 0, 0, 1]), 2) == bytes([0x39, 0xc2])
+    assert m.xfer(bytes([0x5a, 0, 0, 0, 0]), 4) == b'SFDP'
+
+
+def test_program_erase_need_wel():
+    m = MacronixRef(sz=2 * BLOCK_SZ)
+    m.xfer(bytes([0x20, 0, 0x10, 0]))
+    assert m.array[0x1000] != 0xff
+    m.xfer(bytes([0x06]))
+    assert m.xfer(bytes([0x05]), 1)[0] & SR_WEL
+    m.xfer(bytes([0x20, 0, 0x10, 0x42]))
+    assert (m.array[0x1000:0x2000] == 0xff).all()
+    assert not m.wel
+    m.xfer(bytes([0x06]))
+    m.xfer(bytes([0x02, 0, 0x10, 0xfe]) + bytes([0x0f, 0xf0, 0xaa]))
+    # last byte wraps to the start of the page
+    assert m.array[0x10fe:0x1100].tolist() == [0x0f, 0xf0]
+    assert m.array[0x1000] == 0xaa
+
+
+def test_block_protect_and_4byte():
+    m = MacronixRef(sz=4 * BLOCK_SZ)
+    m.xfer(bytes([0x06]))
+    m.xfer(bytes([0x01, 1 << SR_BP_SHIFT]))
+    assert m.protected_range() == (3 * BLOCK_SZ, 4 * BLOCK_SZ)
+    m.xfer(bytes([0x06]))
+    m.xfer(bytes([0xd8, 0x03, 0x00, 0x00]))
+    assert not (m.array[3 * BLOCK_SZ:] == 0xff).all()
+    m.xfer(bytes([0xb7]))
+    assert m.xfer(bytes([0x03, 0, 0, 0, 0x20]), 1) == m.array[0x20:0x21].tobytes()
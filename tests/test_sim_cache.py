@@ -0,0 +1,45 @@
+import os
+
+from litespih4x.sim_cache import SimBuildCache, parse_digest
+
+
+def make_gateware(d):
+    (d / 'sim.v').write_text('module sim(); endmodule\n')
+    (d / 'sim_init.cpp').write_text('int main() {}\n')
+    (d / 'csr.csv').write_text('ignored\n')
+    (d / 'obj_dir').mkdir()
+    (d / 'obj_dir' / 'Vsim').write_text('')
+
+
+def test_sim_cache_hit_and_miss(tmp_path):
+    make_gateware(tmp_path)
+    cache = SimBuildCache(tmp_path, options={'opt_level': 'O3'})
+    assert not cache.valid('obj_dir/Vsim')
+    cache.save()
+    assert SimBuildCache(tmp_path, options={'opt_level': 'O3'}).valid('obj_dir/Vsim')
+    # non-source files and compiler outputs don't matter
+    (tmp_path / 'csr.csv').write_text('changed\n')
+    (tmp_path / 'obj_dir' / 'Vsim.o').write_text('')
+    assert SimBuildCache(tmp_path, options={'opt_level': 'O3'}).valid('obj_dir/Vsim')
+    assert not SimBuildCache(tmp_path, options={'opt_level': 'O0'}).valid('obj_dir/Vsim')
+    (tmp_path / 'sim.v').write_text('module sim(input a); endmodule\n')
+    assert not SimBuildCache(tmp_path, options={'opt_level': 'O3'}).valid('obj_dir/Vsim')
+
+
+def test_sim_cache_restore_mtimes(tmp_path):
+    make_gateware(tmp_path)
+    v, cpp = tmp_path / 'sim.v', tmp_path / 'sim_init.cpp'
+    os.utime(v, ns=(1_000_000_000, 1_000_000_000))
+    SimBuildCache(tmp_path).save()
+    # regenerate: same sim.v contents, new sim_init.cpp contents
+    v.write_text(v.read_text())
+    cpp.write_text('int main() { return 1; }\n')
+    cpp_mtime = cpp.stat().st_mtime_ns
+    assert SimBuildCache(tmp_path).restore_mtimes() == 1
+    assert v.stat().st_mtime_ns == 1_000_000_000
+    assert cpp.stat().st_mtime_ns == cpp_mtime
+
+
+def test_parse_digest():
+    assert parse_digest('Verilator model reused (abc)\nsim_cache digest: 00ff\nsim_cache digest: abcd\n') == 'abcd'
+    assert parse_digest('Verilator build failed') is None
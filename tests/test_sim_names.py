@@ -0,0 +1,65 @@
+import pytest
+from migen import *
+from migen.fhdl import verilog
+
+from litex.build.generic_platform import GenericPlatform, Pins, Subsignal
+
+from litespih4x.sim_names import SimNames, SimCSRRegion, sim_names_dict, save_sim_names, load_sim_names, sim_names_for_run
+
+
+_io = [
+    ("sys_clk", 0, Pins(1)),
+    ("spi", 0,
+        Subsignal("sclk", Pins(1)),
+        Subsignal("so", Pins(1)),
+    ),
+]
+
+
+def test_sim_names_roundtrip(tmp_path):
+    platform = GenericPlatform("sim", _io)
+    clk = platform.request("sys_clk")
+    spi = platform.request("spi")
+    m = Module()
+    m.sync += spi.so.eq(spi.sclk)
+    ns = verilog.convert(m, ios={clk, spi.sclk, spi.so}).ns
+
+    path = save_sim_names(tmp_path / 'names.json', platform, object(), ns, info={'x': 1})
+    names = load_sim_names(path)
+    assert names.pad('sys_clk') == ns.pnd[clk]
+    assert names.pad_names('spi', 0) == {'sclk': ns.pnd[spi.sclk], 'so': ns.pnd[spi.so]}
+    assert names.info == {'x': 1}
+    assert names.csr_regions == {}
+
+    class Top:
+        pass
+    top = Top()
+    for n in names.pad_names('spi').values():
+        setattr(top, n, n.upper())
+    assert names.pad_handles(top, 'spi') == {'sclk': ns.pnd[spi.sclk].upper(), 'so': ns.pnd[spi.so].upper()}
+
+
+def test_sim_names_csr_regions():
+    d = sim_names_dict(GenericPlatform("sim", []), object(), None)
+    d['csr_regions'] = {'qspi_emu': {'origin': 0x82000800, 'busword': 32}}
+    names = SimNames(d)
+    assert names.csr_regions['qspi_emu'] == SimCSRRegion(0x82000800, 32)
+    assert names.csr_regions['qspi_emu'].wb_base == 0x82000800 // 4
+
+
+def test_sim_names_missing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('LITESPIH4X_SIM_NAMES', raising=False)
+    assert load_sim_names() is None
+
+
+def test_sim_names_for_run(tmp_path):
+    platform = GenericPlatform("sim", _io)
+    clk = platform.request("sys_clk")
+    ns = verilog.convert(Module(), ios={clk}).ns
+    with pytest.raises(FileNotFoundError, match='--build'):
+        sim_names_for_run(tmp_path, False)
+    path = sim_names_for_run(tmp_path, True, platform, object(), ns)
+    # run-only passes get no namespace from builder.build()
+    assert sim_names_for_run(tmp_path, False, platform, object(), None) == path
+    assert load_sim_names(path).pad('sys_clk') == ns.pnd[clk]
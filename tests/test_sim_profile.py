@@ -0,0 +1,106 @@
+from litespih4x.sim_profile import SimProfiler, SIM_FRAME, RPYC_FRAME
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class Timer:
+    def __init__(self, ns):
+        self.ns = ns
+
+    def __await__(self):
+        yield self
+
+
+class Edge:
+    def __await__(self):
+        yield self
+
+
+def run(coro, wall: FakeClock, sim: FakeClock):
+    # minimal scheduler: every trigger advances sim time, the wall clock moves 10 ms per simulated ns
+    try:
+        trig = coro.send(None)
+        while True:
+            ns = trig.ns if isinstance(trig, Timer) else 1
+            sim.t += ns
+            wall.t += ns * 0.01
+            trig = coro.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+def test_profiler():
+    wall, sim = FakeClock(), FakeClock()
+    prof = SimProfiler(sim_time_ns=sim, wall=wall)
+
+    @prof.profiled
+    async def tick(n):
+        for _ in range(n):
+            wall.t += 0.001
+            await Timer(10)
+        return n
+
+    @prof.profiled(name='read')
+    async def read_flash():
+        wall.t += 0.002
+        n = await tick(3)
+        await Edge()
+        return n
+
+    class Conn:
+        def sync_request(self, handler, *args):
+            wall.t += 0.5
+            return handler
+
+    conn = prof.wrap_rpyc(Conn())
+
+    @prof.profiled
+    async def test(dut):
+        assert conn.sync_request(1) == 1
+        return await read_flash() + await tick(1)
+
+    assert run(test(None), wall, sim) == 4
+    f = prof.frames
+    assert f[('test', 'read', 'tick')].calls == 1
+    assert f[('test', 'tick')].calls == 1
+    assert abs(f[('test', 'read', 'tick')].self_s - 0.003) < 1e-9
+    assert abs(f[('test', 'read')].self_s - 0.002) < 1e-9
+    # the rpyc request is charged to rpyc, not the coroutine that made it
+    assert abs(f[('test',)].self_s) < 1e-9
+    assert f[('test', 'read')].sim_ns == 31
+    assert prof.triggers == {'Timer': 4, 'Edge': 1}
+    s = prof.summary()
+    assert s['sim_ns'] == 41
+    assert abs(s['rpyc_s'] - 0.5) < 1e-9
+    assert abs(s['simulator_s'] - 0.41) < 1e-9
+    folded = dict(l.rsplit(' ', 1) for l in prof.folded())
+    assert folded['test;read;tick'] == '3000'
+    assert folded[SIM_FRAME] == '410000'
+    assert any(k.startswith(RPYC_FRAME) for k in folded)
+
+
+def test_profiler_exception():
+    wall, sim = FakeClock(), FakeClock()
+    prof = SimProfiler(sim_time_ns=sim, wall=wall)
+
+    @prof.profiled
+    async def boom():
+        await Timer(5)
+        raise ValueError('boom')
+
+    @prof.profiled
+    async def test():
+        try:
+            await boom()
+        except ValueError:
+            return 'caught'
+
+    assert run(test(), wall, sim) == 'caught'
+    assert prof.frames[('test', 'boom')].sim_ns == 5
+    assert not prof._stack
@@ -0,0 +1,64 @@
+from migen import *
+from migen.fhdl import verilog
+
+from litespih4x.sim_trace import TraceWindow, ScopedVCDDumper, filter_verilog_tracing, scope_signal_names
+
+
+def test_trace_window():
+    ev_a, ev_b = Signal(), Signal()
+    dut = TraceWindow({'a': ev_a, 'b': ev_b}, cycles=4)
+    trace = []
+    def gen():
+        # a level event only opens the window on its rising edge
+        for a, b, force in [(0, 0, 0), (1, 0, 0), (1, 0, 0), (1, 0, 0), (1, 0, 0), (1, 0, 0), (1, 0, 0),
+                            (0, 0, 0), (0, 1, 0), (0, 0, 0), (1, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+                            (0, 0, 0), (0, 0, 0), (0, 0, 1), (0, 0, 0)]:
+            yield ev_a.eq(a)
+            yield ev_b.eq(b)
+            yield dut.force.eq(force)
+            yield
+            trace.append(((yield dut.active), (yield dut.cause)))
+    run_simulation(dut, gen())
+    active = ''.join(str(a) for a, _ in trace)
+    # open for 4 cycles after a rises, a held high doesn't reopen; b opens, a extends; force is immediate
+    assert active == '001111000111111010'
+    assert trace[9][1] == 0b10 and trace[11][1] == 0b11
+
+
+class Leaf(Module):
+    def __init__(self):
+        self.x = Signal(8)
+        self.y = Signal(8)
+        self.sync += self.y.eq(self.x + 1)
+
+
+class Top(Module):
+    def __init__(self):
+        self.submodules.keep = Leaf()
+        self.submodules.drop = Leaf()
+        self.win = Signal()
+        self.specials.dumper = ScopedVCDDumper('t.vcd', scopes=[self.keep], window=self.win)
+
+
+def test_scoped_dumper(tmp_path):
+    top = Top()
+    v = verilog.convert(top, ios={top.keep.x, top.drop.x, top.win})
+    src = str(v)
+    dumpvars = next(l for l in src.splitlines() if '$dumpvars' in l)
+    keep = scope_signal_names(v.ns, [top.keep])
+    assert keep and all(n in dumpvars for n in keep)
+    assert v.ns.pnd[top.drop.y] not in dumpvars
+    assert '$dumpon' in src and '$dumpoff' in src
+
+    path = tmp_path / 'top.v'
+    path.write_text(src)
+    assert filter_verilog_tracing(path, keep) > 0
+    # idempotent, the fences from the first pass are replaced
+    once = path.read_text()
+    filter_verilog_tracing(path, keep)
+    assert path.read_text() == once
+    lines = once.splitlines()
+    drop_y = v.ns.pnd[top.drop.y]
+    i = next(i for i, l in enumerate(lines) if drop_y in l and l.lstrip().startswith('reg'))
+    fence = [l for l in lines[:i] if 'verilator tracing_' in l]
+    assert fence[-1] == '/*verilator tracing_off*/'
@@ -0,0 +1,67 @@
+import pytest
+
+from migen import *
+
+try:
+    from litespih4x.emu import SPISigs
+    from litespih4x.emu_tb import SIM_SPECIAL_OVERRIDES
+    from litespih4x.spi_bfm import SPIMasterBFM, spi_bfm_ctrl_layout
+except ImportError as e:
+    pytest.skip(f'emulator gateware needs the forked migen/litex: {e}', allow_module_level=True)
+
+
+def resp_byte(i: int) -> int:
+    return (i * 7 + 3) & 0xff
+
+
+@pytest.mark.parametrize('word_bytes,ntx,nrx', [(4, 4, 9), (4, 5, 0), (16, 1, 40), (4, 2, 40)])
+def test_bfm_frame(word_bytes, ntx, nrx):
+    sigs = SPISigs(sclk=Signal(), csn=Signal(reset=1), si=Signal(), so=Signal())
+    ctrl = Record(spi_bfm_ctrl_layout(word_bytes))
+    dut = SPIMasterBFM(sigs, ctrl, word_bytes=word_bytes, fifo_depth=4, div=2)
+    tx = bytes(0xa0 + i for i in range(ntx))
+    res = {'mosi': []}
+
+    def slave():
+        # mode 0 slave, next SO bit after CS# falls and after every falling SCLK edge
+        sclk_d, csn_d, nbit = 0, 1, 0
+        while True:
+            sclk, csn = (yield sigs.sclk), (yield sigs.csn)
+            if not csn and csn_d:
+                nbit = 0
+            if not csn and sclk and not sclk_d:
+                res['mosi'].append((yield dut.si_ts.o))
+            if not csn and sclk_d and not sclk:
+                nbit += 1
+            yield dut.so_ts.i.eq((resp_byte(nbit // 8) >> (7 - nbit % 8)) & 1)
+            sclk_d, csn_d = sclk, csn
+            yield
+
+    def master():
+        for i in range(0, ntx, word_bytes):
+            yield ctrl.tx_data.eq(int.from_bytes(tx[i:i+word_bytes], 'little'))
+            yield ctrl.tx_valid.eq(1)
+            yield
+        yield ctrl.tx_valid.eq(0)
+        yield ctrl.tx_len.eq(ntx)
+        yield ctrl.rx_len.eq(nrx)
+        yield ctrl.start.eq(1)
+        yield
+        yield ctrl.start.eq(0)
+        yield
+        rx = bytearray()
+        while (yield ctrl.busy) or (yield ctrl.rx_valid):
+            if (yield ctrl.rx_valid):
+                rx += (yield ctrl.rx_data).to_bytes(word_bytes, 'little')
+                yield ctrl.rx_ready.eq(1)
+                yield
+                yield ctrl.rx_ready.eq(0)
+            yield
+        res['rx'] = bytes(rx[:nrx])
+        res['csn'] = (yield sigs.csn)
+
+    run_simulation(dut, [master(), passive(slave)()], special_overrides=SIM_SPECIAL_OVERRIDES)
+    mosi = bytes(int(''.join(map(str, res['mosi'][i:i+8])), 2) for i in range(0, len(res['mosi']), 8))
+    assert mosi == tx + bytes(nrx)
+    assert res['rx'] == bytes(resp_byte(ntx + i) for i in range(nrx))
+    assert res['csn'] == 1
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from litespih4x.udp_spi import SPIBridgeClient
+
+IMAGE = bytes((a * 7 + (a >> 8)) & 0xff for a in range(1 << 16))
+
+
+class FakeBridge(asyncio.DatagramProtocol):
+    # serves READ/RDID from IMAGE, in order after `delay` (or delays[index]), dropping the requests whose
+    # index is in `drop`; log records ('rx'|'tx', opcode) as the bridge sees them
+    def __init__(self, drop=(), delay=0.002, delays=None):
+        self.drop = set(drop)
+        self.delay = delay
+        self.delays = delays or {}
+        self.n = 0
+        self.queue = asyncio.Queue()
+        self.log = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.task = asyncio.ensure_future(self.serve())
+
+    def datagram_received(self, data, addr):
+        if self.n not in self.drop:
+            self.queue.put_nowait((data, addr, self.delays.get(self.n, self.delay)))
+            self.log.append(('rx', data[0]))
+        self.n += 1
+
+    async def serve(self):
+        while True:
+            data, addr, delay = await self.queue.get()
+            await asyncio.sleep(delay)
+            if data[0] == 0x03:
+                a = int.from_bytes(data[1:4], 'big')
+                rsp = bytes(4) + (IMAGE * 2)[a:a + len(data) - 4]
+            else:
+                rsp = bytes(1) + bytes([0xc2, 0x25, 0x39]) + bytes(len(data) - 4)
+            self.log.append(('tx', data[0]))
+            self.transport.sendto(rsp[:len(data)], addr)
+
+
+async def with_bridge(fn, bridge_kw=None, **kw):
+    loop = asyncio.get_running_loop()
+    transport, bridge = await loop.create_datagram_endpoint(lambda: FakeBridge(**(bridge_kw or {})),
+                                                            local_addr=('127.0.0.1', 0))
+    try:
+        async with SPIBridgeClient(transport.get_extra_info('sockname'), **kw) as c:
+            return await fn(c, bridge)
+    finally:
+        bridge.task.cancel()
+        transport.close()
+
+
+async def session(drop=(), **kw):
+    async def fn(c, bridge):
+        got = await c.read(0xff00, 5000)
+        idcode = await c.idcode()
+        return got, idcode, c.stats
+    return await with_bridge(fn, {'drop': drop}, **kw)
+
+
+def test_pipelined_read():
+    got, idcode, stats = asyncio.run(session(window=4, max_frame=512))
+    assert got == (IMAGE * 2)[0xff00:0xff00 + 5000]
+    assert idcode == 0xc22539
+    assert stats.requests == 11 and stats.retries == 0 and stats.max_in_flight == 4
+
+
+def test_retry():
+    # lose the 2nd and 5th datagrams, their frames are resent after the timeout
+    got, _, stats = asyncio.run(session(drop=(1, 4), window=3, max_frame=1024, timeout=0.1))
+    assert got == (IMAGE * 2)[0xff00:0xff00 + 5000]
+    assert stats.retries == 2 and stats.unmatched == 0
+
+
+def test_gives_up():
+    with pytest.raises(TimeoutError):
+        asyncio.run(session(drop=range(100), window=2, timeout=0.02, retries=2))
+
+
+def test_xfer_runs_alone():
+    async def fn(c, bridge):
+        async def xfer_first():
+            return await asyncio.gather(c.idcode(), c.read(0, 4096))
+        async def read_first():
+            read = asyncio.ensure_future(c.read(0, 4096))
+            await asyncio.sleep(0)
+            return await asyncio.gather(c.idcode(), read)
+        return [await xfer_first(), await read_first()], bridge.log
+    results, log = asyncio.run(with_bridge(fn, window=4, max_frame=512))
+    for idcode, got in results:
+        assert idcode == 0xc22539 and got == IMAGE[:4096]
+    # nothing else reaches the bridge while an RDID is outstanding and it is only sent to an idle bridge
+    outstanding = 0
+    for i, (ev, op) in enumerate(log):
+        if ev == 'rx' and op == 0x9f:
+            assert outstanding == 0 and log[i + 1] == ('tx', 0x9f)
+        outstanding += 1 if ev == 'rx' else -1
+
+
+def test_late_reply_after_giving_up():
+    # the first READ's reply shows up after the client gave up on it, it must not answer the second one
+    async def fn(c, bridge):
+        with pytest.raises(TimeoutError):
+            await c.read(0x100, 8)
+        got = await c.read(0x200, 8)
+        await asyncio.sleep(0.1)
+        return got, c.stats
+    got, stats = asyncio.run(with_bridge(fn, {'delays': {0: 0.08}}, timeout=0.05, retries=0))
+    assert got == IMAGE[0x200:0x208]
+    assert stats.unmatched == 1
@@ -0,0 +1,102 @@
+import io
+import itertools
+
+from litespih4x.vcd_stream import VCDReader, open_jtag, open_spi
+
+HEADER = '''$timescale 1 ns $end
+$scope module top $end
+$var wire 1 ! spiflash_emu_sclk $end
+$var wire 1 " spiflash_emu_csn $end
+$var wire 1 # spiflash_emu_si $end
+$var wire 1 $ spiflash_emu_so $end
+$var wire 1 % tck $end
+$var wire 1 & tms $end
+$var wire 1 ' tdi $end
+$var wire 1 ( tdo $end
+$var wire 8 ) cnt [7:0] $end
+$upscope $end
+$enddefinitions $end
+$dumpvars
+x!
+1"
+0#
+0$
+0%
+0&
+0'
+0(
+bxxxxxxxx )
+$end
+'''
+
+
+def spi_lines(t, mosi: bytes, miso: bytes):
+    # mode 0, 10ns SCLK, data changes on the falling edge
+    yield f'#{t}\n0"\n'
+    t += 5
+    mosi_bits = ''.join(f'{b:08b}' for b in mosi)
+    miso_bits = ''.join(f'{b:08b}' for b in miso).ljust(len(mosi_bits), '0')
+    for si, so in zip(mosi_bits, miso_bits):
+        yield f'#{t}\n0!\n{si}#\n{so}$\nb{t & 0xff:b} )\n'
+        yield f'#{t + 5}\n1!\n'
+        t += 10
+    yield f'#{t}\n0!\n1"\n'
+
+
+def jtag_lines(t, tms_tdi_tdo):
+    for tms, tdi, tdo in tms_tdi_tdo:
+        yield f'#{t}\n0%\n{tms}&\n{tdi}\'\n{tdo}(\n'
+        yield f'#{t + 5}\n1%\n'
+        t += 10
+
+
+def test_spi():
+    rd = bytes([0x03, 0x12, 0x34, 0x56, 0, 0, 0, 0])
+    rd4 = bytes([0x03, 0x01, 0x12, 0x34, 0x56, 0, 0])
+    vcd = HEADER + ''.join(itertools.chain(
+        spi_lines(100, rd, bytes(4) + b'\xde\xad\xbe\xef'),
+        spi_lines(1000, b'\xb7', b''),
+        spi_lines(2000, rd4, bytes(5) + b'\xca\xfe'),
+        spi_lines(3000, b'\xe9', b''),
+        spi_lines(4000, b'\x02\x00\x01\x00\xaa\x55', b''),
+    ))
+    with VCDReader(io.StringIO(vcd)) as r:
+        assert r.timescale_ps == 1000
+        assert r.find('cnt').name == 'top.cnt'
+        txns = list(open_spi(r, 'sclk', 'csn', 'si', 'so'))
+    assert [t.name for t in txns] == ['READ', 'EN4B', 'READ', 'EX4B', 'PP']
+    assert txns[0].addr == 0x123456 and txns[0].data == b'\xde\xad\xbe\xef'
+    assert txns[0].nclk == 64 and txns[0].min_clk_period == 10
+    assert txns[0].start == 100 and txns[0].end == 100 + 5 + 64 * 10
+    # EN4B switches the following READ to a 4 byte address
+    assert txns[2].addr_bytes == 4 and txns[2].addr == 0x01123456 and txns[2].data == b'\xca\xfe'
+    assert txns[4].addr == 0x000100 and txns[4].data == b'\xaa\x55'
+
+
+def test_jtag():
+    ir = [(1, 0, 0)] * 5 + [(0, 0, 0), (1, 0, 0), (1, 0, 0), (0, 0, 0), (0, 0, 0)]
+    # 6 bit IR 0x09 LSB first with TDO returning 0b000001, last bit leaves Shift-IR
+    ir += [(0, 1, 1), (0, 0, 0), (0, 0, 0), (0, 1, 0), (0, 0, 0), (1, 0, 0), (1, 0, 0), (0, 0, 0)]
+    dr = [(1, 0, 0), (0, 0, 0), (0, 0, 0)]
+    dr += [(0, b, b ^ 1) for b in (1, 0, 1, 1, 0, 1, 1)] + [(1, 1, 0), (0, 0, 0), (1, 0, 0), (1, 0, 0), (0, 0, 0)]
+    vcd = HEADER + ''.join(jtag_lines(100, ir + dr))
+    with VCDReader(io.StringIO(vcd)) as r:
+        ops = list(open_jtag(r, 'tck', 'tms', 'tdi', 'tdo'))
+    assert [o.kind for o in ops] == ['ir', 'dr']
+    assert (ops[0].nbits, ops[0].tdi, ops[0].tdo) == (6, 0x09, 0x01)
+    assert (ops[1].nbits, ops[1].tdi, ops[1].tdo) == (8, 0b11101101, 0b00010010)
+    # Pause-DR and back doesn't split the scan
+    assert str(ops[1]) == 'DR[8] tdi=0xed tdo=0x12'
+
+
+def test_streaming():
+    # an endless trace still yields transactions as they complete
+    def lines():
+        yield HEADER
+        t = 100
+        while True:
+            yield from spi_lines(t, b'\x05\x00', b'\x00\x42')
+            t += 500
+    r = VCDReader(lines())
+    txns = list(itertools.islice(open_spi(r, 'sclk', 'csn', 'si', 'so'), 3))
+    assert [(t.name, t.data, t.complete) for t in txns] == [('RDSR', b'\x42', True)] * 3
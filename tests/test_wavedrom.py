@@ -0,0 +1,56 @@
+import io
+import json
+
+from litespih4x.emu_bench import BenchConfig, bench_timing
+from litespih4x.vcd_stream import VCDReader
+from litespih4x.wavedrom import Lane, Latency, timing_diagram
+from litespih4x.wavestore import convert
+
+
+def vcd():
+    # sys clock period 2 rising on even times, SCLK period 8 rising from t=7, req -> ack after 5 sys clocks
+    lines = ['$timescale 1ns $end', '$var wire 1 ! clk $end', '$var wire 1 " sclk $end', '$var wire 1 # req $end',
+             '$var wire 1 $ ack $end', '$var wire 4 % cnt $end', '$enddefinitions $end']
+    sclk = 0
+    for t in range(0, 48):
+        lines.append(f'#{t}')
+        lines.append(f'{(t + 1) % 2}!')
+        if t == 0 or (t >= 7 and (t - 7) % 4 == 0):
+            sclk ^= t > 0
+            lines.append(f'{sclk}"')
+        if t in (0, 11, 21, 31):
+            lines.append(f'{int(t == 11)}#')
+        if t in (0, 21):
+            lines.append(f'{int(t == 21)}$')
+        if t % 8 == 1:
+            lines.append(f'b{(t // 8):b} %')
+    return '\n'.join(lines) + '\n'
+
+
+def test_timing_diagram(tmp_path):
+    store = convert(VCDReader(io.StringIO(vcd())), tmp_path / 'ws')
+    src, measured = timing_diagram(store, [Lane('clk', ['req', 'n=cnt']), Lane('sclk', ['ack'])], 0, 47,
+                                   [Latency('ack', 'req', 'ack')], clk_freq=100e6, title='t')
+    rows = src['signal']
+    # the first change has no predecessor, the grid starts at the rising edge at t=2
+    assert rows[0] == {'name': 'clk', 'wave': 'P' + '.' * 22}
+    assert rows[1]['wave'] == '0....1....0............'
+    assert rows[2]['name'] == 'n' and rows[2]['data'] == ['0', '1', '2', '3', '4', '5']
+    assert rows[3] == {}
+    # SCLK lane columns are 4 sys clocks wide and start 2.5 base columns in
+    assert rows[4] == {'name': 'sclk', 'wave': 'P....', 'period': 4, 'phase': -2.5}
+    assert rows[5]['wave'] == '0.1..'
+    assert [m.cycles for m in measured] == [5] and measured[0].ns == 50.0
+    # nodes sit on the first column showing each change
+    assert rows[1]['node'] == '.....a' and rows[5]['node'] == '..b'
+    assert src['edge'] == ['a~>b ack 5 clk (50.0 ns)']
+    assert src['head'] == {'text': 't'}
+
+
+def test_bench_timing(tmp_path):
+    path, measured = bench_timing(BenchConfig('macronix_lite', 'macronix'), tmp_path, sys_per_sclk=4, nbytes=1)
+    src = json.loads(path.read_text())
+    assert path.name == 'timing-macronix_lite.json'
+    assert [r.get('name') for r in src['signal']] == ['sys_clk', 'csn', 'data_phase', None, 'sclk', 'copi', 'cipo']
+    # opcode and address take 32 SCLKs of 4 sys clocks
+    assert [(m.name, m.cycles) for m in measured] == [('first data', 129)]
@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pytest
+
+from litespih4x.vcd_stream import VCDReader
+from litespih4x.wavestore import WaveStore, convert
+
+VCD = '''$timescale 10 ns $end
+$scope module top $end
+$var wire 1 ! clk $end
+$var wire 1 ! clk_alias $end
+$var wire 8 " cnt [7:0] $end
+$var wire 72 # wide [71:0] $end
+$var real 64 $ vdd $end
+$var wire 1 % other $end
+$upscope $end
+$enddefinitions $end
+$dumpvars
+0!
+bx "
+b0 #
+r1.8 $
+0%
+$end
+#5
+1!
+b0 "
+#10
+0!
+b1 "
+#15
+1!
+#20
+0!
+b10 "
+b100000000000000000000000000000000000000000000000000000000000000001 #
+#25
+1!
+bx "
+#30
+0!
+b11 "
+'''
+
+
+@pytest.fixture
+def store(tmp_path):
+    # tiny chunks to exercise the incremental flush
+    return convert(VCDReader(io.StringIO(VCD)), tmp_path / 'ws', ['clk', 'clk_alias', 'cnt', 'wide', 'vdd'], chunk=2)
+
+
+def test_convert(store, tmp_path):
+    assert store.timescale_ps == 10000 and store.end_time == 30
+    assert 'other' not in store and 'top.cnt' in store
+    # reopening maps the same columns
+    store = WaveStore(tmp_path / 'ws')
+    clk = store['clk']
+    assert isinstance(clk.t, np.memmap)
+    assert list(clk.t) == [0, 5, 10, 15, 20, 25, 30]
+    assert list(store['clk_alias'].t) == list(clk.t)
+    # repeated values aren't stored
+    assert list(store['wide'].t) == [0, 20]
+
+
+def test_queries(store):
+    cnt = store['cnt']
+    assert cnt.value_at(-1) is None
+    assert cnt.value_at(0) is None
+    assert [cnt.value_at(t) for t in (5, 9, 10, 24, 25, 30, 99)] == [0, 0, 1, 2, None, 3, 3]
+    vals, known = cnt.values_at([3, 12, 26, 40])
+    assert list(known) == [False, True, False, True]
+    assert vals[1] == 1 and vals[3] == 3
+    assert store['wide'].value_at(21) == (1 << 65) | 1
+    assert store['vdd'].value_at(7) == 1.8
+
+    clk = store['clk']
+    assert list(clk.edges()) == [5, 15, 25]
+    assert list(clk.edges('falling', 10, 20)) == [10, 20]
+    assert list(clk.edges('rising', 6, 14)) == []
+    # x on either side isn't an edge
+    assert list(cnt.edges('any')) == [10, 20]
+    with pytest.raises(ValueError):
+        cnt.edges('rising')
+
+    t, v, x = cnt.window(12, 26)
+    assert list(t) == [10, 20, 25]
+    assert list(v[~x]) == [1, 2]
+    t, _, _ = cnt.window(20, 20)
+    assert list(t) == [20]